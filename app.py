@@ -4,6 +4,7 @@ from flask_cors import CORS
 from contest.routes import contest_bp
 from game.routes import game_blueprint
 from leaderboard.routes import leaderboard_blueprint
+from leaderboard.services import get_cache_stats
 from user.routes import user_blueprint
 from wallet.routes import wallet_bp
 import os
@@ -44,7 +45,7 @@ def handle_exception(e):
 @app.route('/damnplay/health', methods=['GET'])
 def health_check():
     logger.info("Health check endpoint accessed")
-    return jsonify({"status": "API Gateway is running"}), 200
+    return jsonify({"status": "API Gateway is running", "caches": get_cache_stats()}), 200
 
 # Swagger UI configuration
 SWAGGER_URL = '/damnplay/api-docs'  # Swagger UI URL
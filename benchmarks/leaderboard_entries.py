@@ -0,0 +1,106 @@
+"""
+Compare memory use and serialization speed of leaderboard response rows.
+
+    python -m benchmarks.leaderboard_entries --rows 100000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from datetime import datetime
+from werkzeug.http import http_date
+from leaderboard.models import LeaderboardEntry, LeaderboardPage, dumps_response
+
+
+class DictLeaderboardEntry:
+    """LeaderboardEntry as it was before __slots__, with a __dict__ per instance."""
+
+    def __init__(self, user_id, username, score, rank=None, contest_id=None, timestamp=None):
+        self.user_id = user_id
+        self.username = username
+        self.score = score
+        self.rank = rank
+        self.contest_id = contest_id
+        self.timestamp = timestamp
+
+    def to_dict(self):
+        return {
+            "user_id": self.user_id,
+            "username": self.username,
+            "score": self.score,
+            "rank": self.rank,
+            "contest_id": self.contest_id,
+            "timestamp": self.timestamp,
+        }
+
+
+def make_rows(count):
+    return [(row + 1, f"user{row}", f"player{row}", count - row) for row in range(count)]
+
+
+def previous_entries(rows):
+    """An entry and a dict per row, each with its own datetime.now()."""
+    return [
+        DictLeaderboardEntry(user_id, username, score, rank, "contest", datetime.now()).to_dict()
+        for rank, user_id, username, score in rows
+    ]
+
+
+def slotted_entries(rows):
+    timestamp = datetime.now()
+    return [LeaderboardEntry(user_id, username, score, rank, "contest", timestamp) for rank, user_id, username, score in rows]
+
+
+def page(rows):
+    return LeaderboardPage("contest", rows, datetime.now())
+
+
+def jsonify_like(value):
+    """Encode as Flask's default JSON provider does."""
+    return json.dumps(value, default=lambda o: http_date(o), sort_keys=True)
+
+
+def measure_memory(build, rows):
+    tracemalloc.start()
+    result = build(rows)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def measure_seconds(function, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(count):
+    rows = make_rows(count)
+    print(f"{count} rows")
+
+    print(f"{'representation':<36} {'memory (MB)':>12}")
+    for name, build in (
+        ("entry + dict per row (previous)", previous_entries),
+        ("slotted LeaderboardEntry", slotted_entries),
+        ("LeaderboardPage (columns)", page),
+    ):
+        print(f"{name:<36} {measure_memory(build, rows) / 1e6:>12.1f}")
+
+    print(f"{'build and serialize':<36} {'seconds':>12}")
+    previous = measure_seconds(lambda: jsonify_like({"data": previous_entries(rows)}))
+    direct = measure_seconds(lambda: dumps_response({"data": page(rows)}))
+    print(f"{'dicts + jsonify (previous)':<36} {previous:>12.3f}")
+    print(f"{'LeaderboardPage + dumps_response':<36} {direct:>12.3f}")
+    print(f"speedup: {previous / direct:.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark leaderboard row memory and serialization.")
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+    run(args.rows)
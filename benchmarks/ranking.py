@@ -0,0 +1,81 @@
+"""
+Compare the leaderboard ranking engine with the per-row loop complete_contest used before.
+
+    python -m benchmarks.ranking --sizes 10000 100000 1000000
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+from leaderboard.models import LeaderboardEntry
+from leaderboard.ranking import np, rank_leaderboard, split_prize
+
+
+def make_leaderboard(size, seed=0):
+    rng = random.Random(seed)
+    # A narrow score range, so ties are common
+    return {
+        f"user{row}": {"username": f"player{row}", "score": rng.randrange(size // 10 + 1)}
+        for row in range(size)
+    }
+
+
+def loop_ranking(leaderboard_data, prize_pool):
+    """The sort and rank loop complete_contest used, building an entry per row."""
+    sorted_leaderboard = sorted(leaderboard_data.items(), key=lambda x: x[1].get("score", 0), reverse=True)
+    result = []
+    rank = 1
+    previous_score = None
+    tied_ranks = 0
+    rank_1_holders = []
+    for user_id, user_data in sorted_leaderboard:
+        current_score = user_data.get('score', 0)
+        if previous_score is not None:
+            if current_score < previous_score:
+                rank += tied_ranks + 1
+                tied_ranks = 0
+            else:
+                tied_ranks += 1
+        previous_score = current_score
+        if rank == 1:
+            rank_1_holders.append(user_id)
+        result.append(LeaderboardEntry(
+            user_id=user_id,
+            username=user_data.get("username", "Unknown"),
+            score=current_score,
+            rank=rank,
+            timestamp=datetime.now()
+        ).to_dict())
+    return result, [(user_id, prize_pool / len(rank_1_holders)) for user_id in rank_1_holders]
+
+
+def engine_ranking(leaderboard_data, prize_pool, top):
+    """Rank in bulk, split the prize, and materialize only the top rows."""
+    ranked = rank_leaderboard(leaderboard_data)
+    return ranked.rows(0, top), split_prize(ranked, prize_pool)
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started
+
+
+def run(sizes, top=100, prize_pool=1000):
+    print(f"engine: {'numpy ' + np.__version__ if np is not None else 'pure Python (numpy not installed)'}")
+    print(f"{'participants':>12} {'loop (s)':>10} {'engine, all (s)':>16} {'engine, top (s)':>16} {'speedup':>8}")
+    for size in sizes:
+        leaderboard_data = make_leaderboard(size)
+        loop_seconds = timed(loop_ranking, leaderboard_data, prize_pool)
+        all_seconds = timed(engine_ranking, leaderboard_data, prize_pool, None)
+        top_seconds = timed(engine_ranking, leaderboard_data, prize_pool, top)
+        print(f"{size:>12} {loop_seconds:>10.3f} {all_seconds:>16.3f} {top_seconds:>16.3f} "
+              f"{loop_seconds / top_seconds:>7.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark leaderboard ranking and prize splitting.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--top', type=int, default=100, help="Rows materialized by the engine.")
+    args = parser.parse_args()
+    run(args.sizes, top=args.top)
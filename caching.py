@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_size(value):
+    """
+    Approximate the memory a cached value costs by the length of its JSON encoding.
+    """
+    return len(json.dumps(value, default=str, separators=(',', ':')))
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a TTL per entry and a bound on the total size in bytes.
+
+    Cached values are shared between callers and must be treated as read-only.
+
+    Args:
+        name (str): Name reported in the stats.
+        default_ttl (float): Seconds an entry lives unless set() is given a TTL.
+        max_bytes (int): Upper bound on the summed estimated size of all entries;
+            the least recently used entries are evicted to stay below it.
+        size_of (callable): Function estimating the size of a value in bytes.
+    """
+
+    def __init__(self, name, default_ttl, max_bytes, size_of=estimate_size):
+        self.name = name
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self._size_of = size_of
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: (hit, value).
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def set(self, key, value, ttl=None):
+        """
+        Cache a value. Values larger than the whole cache are not stored.
+        """
+        size = self._size_of(value)
+        expires_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def get_or_load(self, key, load, ttl=None):
+        """
+        Return the cached value, or call load() and cache its result unless it is None.
+
+        Args:
+            ttl: Seconds to keep the loaded value, or a function of the value returning them.
+        """
+        hit, value = self.get(key)
+        if hit:
+            return value
+        value = load()
+        if value is not None:
+            self.set(key, value, ttl(value) if callable(ttl) else ttl)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
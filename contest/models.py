@@ -1,23 +1,23 @@
-from firebase_admin import db
+from storage.backend import reference
 
 # Firebase references
 def get_contests_ref():
     """
     Returns the Firebase reference for contests.
     """
-    return db.reference('contests')
+    return reference('contests')
 
 def get_user_contest_mapping_ref():
     """
     Returns the Firebase reference for user-contest mapping.
     """
-    return db.reference('user_contest_mapping')
+    return reference('user_contest_mapping')
 
 def get_users_wallet_ref():
     """
     Returns the Firebase reference for users' wallets.
     """
-    return db.reference('users_wallet')
+    return reference('users_wallet')
 
 def get_valid_games():
     """
@@ -25,7 +25,7 @@ def get_valid_games():
     """
     try:
         # Reference to the 'games' node in the database
-        games_ref = db.reference('games')
+        games_ref = reference('games')
 
         # Fetch all games data
         games_data = games_ref.get()
@@ -133,4 +133,4 @@ def deduct_entry_fee(user_id, contest_id, entry_fee):
 
 def log_contest_completion(contest_id, data):
     """Log a contest as completed, including its leaderboard data."""
-    db.reference(f"completed_contests/{contest_id}").set(data)
+    reference(f"completed_contests/{contest_id}").set(data)
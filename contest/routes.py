@@ -11,6 +11,7 @@ from user.models import admin_required, token_required
 from wallet.services import deduct_entry_fee
 from utils import standardize_response
 from logging_utils import setup_logger
+from middleware import idempotent
 
 # Initialize logger
 logger = setup_logger("contest_routes")
@@ -49,6 +50,7 @@ def create(current_user):
 # Route for joining a contest
 @contest_bp.route('/join', methods=['POST'])
 @token_required
+@idempotent
 def join(current_user):
     """
     Route to join a contest.
@@ -1,12 +1,19 @@
 from datetime import datetime
 from contest.models import get_contests_ref, get_user_contest_mapping_ref, get_valid_games
-from wallet.services import deduct_funds_service, add_funds_service
+from wallet.services import apply_batch_service, sanitize_key
+from leaderboard.services import invalidate_contest, CANCELING_STATUS, SETTLING_STATUS
+from leaderboard.stream import leaderboard_hub
+from leaderboard.shards import DEFAULT_LEADERBOARD_SHARDS, MAX_LEADERBOARD_SHARDS
 from utils import standardize_response
 from logging_utils import setup_logger
 
 # Initialize logger
 logger = setup_logger(__name__)
 
+# Contests whose winners are being or have been paid cannot be refunded
+UNCANCELABLE_STATUSES = (SETTLING_STATUS, 'completed', 'canceled')
+CLOSED_TO_ENTRIES_STATUSES = (CANCELING_STATUS,) + UNCANCELABLE_STATUSES
+
 class ContestService:
     @staticmethod
     def validate_datetime(datetime_str):
@@ -109,6 +116,17 @@ class ContestService:
             logger.error("Entry fee must be a valid number: %s", data.get('entry_fee'))
             return standardize_response(success=False, message='Entry fee must be a valid number', data=None), 400
 
+        # Validate leaderboard shard count
+        leaderboard_shards = data.get('leaderboard_shards', DEFAULT_LEADERBOARD_SHARDS)
+        if isinstance(leaderboard_shards, bool) or not isinstance(leaderboard_shards, int) \
+                or not 1 <= leaderboard_shards <= MAX_LEADERBOARD_SHARDS:
+            logger.error("Invalid leaderboard shard count: %s", leaderboard_shards)
+            return standardize_response(
+                success=False,
+                message=f'leaderboard_shards must be an integer between 1 and {MAX_LEADERBOARD_SHARDS}',
+                data=None
+            ), 400
+
         # Save contest to Firebase
         contest_id = get_contests_ref().push().key
         contest = {
@@ -120,6 +138,8 @@ class ContestService:
             'entry_fee': entry_fee,
             'status': 'active',
         }
+        if leaderboard_shards > 1:
+            contest['leaderboard_shards'] = leaderboard_shards
         get_contests_ref().child(contest_id).set(contest)
         logger.info("Contest created successfully with ID: %s", contest_id)
 
@@ -150,6 +170,11 @@ class ContestService:
             logger.error("Contest with ID '%s' not found.", contest_id)
             return standardize_response(success=False, message=f"Contest with ID '{contest_id}' not found.", data=None), 404
 
+        # No entries once the contest is being canceled or settled
+        if contest.get('status') in CLOSED_TO_ENTRIES_STATUSES:
+            logger.warning("Cannot join contest '%s' while it is %s.", contest_id, contest['status'])
+            return standardize_response(success=False, message=f"Contest is {contest['status']} and cannot be joined.", data=None), 400
+
         # Fetch entry fee from the contest
         entry_fee = contest.get('entry_fee')
         if entry_fee is None:
@@ -222,7 +247,14 @@ class ContestService:
     def cancel_contest(contest_id):
         """
         Cancel a contest and refund all participants.
-        A contest can only be canceled if it exists and is not already canceled.
+        A contest can only be canceled if it exists and is not already canceled,
+        settling or completed; the winners of a settling contest are being paid.
+
+        The contest is marked as canceling before any refund is paid, and every
+        paid refund is recorded under 'contests/<contest_id>/refunds', so a retry
+        after a partial failure only refunds the participants still missing one.
+        Each refund also carries an idempotency key, so a wallet is never refunded
+        twice for the same contest even if recording the refund failed.
         """
         try:
             logger.info("Canceling contest with ID: %s", contest_id)
@@ -248,28 +280,62 @@ class ContestService:
                     data={}
                 ), 400
 
-            # Refund participants
+            # Stop scores and entries before any refund is paid. The status is
+            # switched with a transaction, so a settlement starting concurrently
+            # either wins or sees the contest canceling
+            if contest.get('status') != CANCELING_STATUS:
+                status = contests_ref.child(contest_id).child('status').transaction(
+                    lambda status: status if status in UNCANCELABLE_STATUSES else CANCELING_STATUS
+                )
+                invalidate_contest(contest_id)
+                if status != CANCELING_STATUS:
+                    logger.warning("Contest with ID '%s' is %s and cannot be canceled.", contest_id, status)
+                    return standardize_response(
+                        success=False,
+                        message=f"Contest is {status} and cannot be canceled.",
+                        data={}
+                    ), 400
+
+            # Refund participants who were not refunded by an earlier attempt
             user_contest_mapping_ref = get_user_contest_mapping_ref()
             participants = user_contest_mapping_ref.child(contest_id).get() or []
-
-            for user_id in participants:
-                entry_fee = contest.get('entry_fee', 0)
-                refund_response = add_funds_service(user_id, entry_fee)
-                print(refund_response)
-
-                # Check if refund was successful
+            refunded = contest.get('refunds') or {}
+            pending = [user_id for user_id in participants if sanitize_key(user_id) not in refunded]
+
+            entry_fee = contest.get('entry_fee', 0)
+            if pending and entry_fee > 0:
+                refund_response = apply_batch_service([
+                    {"user_id": user_id, "amount": entry_fee, "reason": "contest_refund", "contest_id": contest_id,
+                     "idempotency_key": f"contest_refund:{contest_id}"}
+                    for user_id in pending
+                ])
+                if isinstance(refund_response, tuple):
+                    refund_response = refund_response[0]
+
+                results = (refund_response.get('data') or {}).get('results', [])
+                paid = {
+                    f"refunds/{sanitize_key(result['user_id'])}": result.get('transaction_id') or True
+                    for result in results if result['success']
+                }
+                if paid:
+                    contests_ref.child(contest_id).update(paid)
+
+                # Check if every refund was successful
                 if not refund_response['success']:
+                    failed = [result for result in results if not result['success']]
                     logger.error(
-                        "Failed to refund participant '%s' for contest '%s'.", user_id, contest_id
+                        "Failed to refund %d participants for contest '%s'.", len(failed), contest_id
                     )
                     return standardize_response(
                         success=False,
-                        message=f"Failed to refund participant {user_id}.",
-                        data={"details": refund_response.get('error', 'Unknown error')}
+                        message="Failed to refund some participants.",
+                        data={"details": failed or refund_response.get('data')}
                     ), 500
 
             # Mark contest as canceled
             contests_ref.child(contest_id).update({'status': 'canceled'})
+            invalidate_contest(contest_id)
+            leaderboard_hub.close_contest(contest_id, 'canceled', {"contest_id": contest_id})
 
             # Remove participants (optional cleanup)
             user_contest_mapping_ref.child(contest_id).delete()
@@ -1,6 +1,4 @@
-import firebase_admin
-from firebase_admin import credentials, db
-from user.models import get_firebase_app
+from storage.backend import reference
 
 # Check if the app is already initialized
 # if not firebase_admin._apps:
@@ -8,16 +6,15 @@ from user.models import get_firebase_app
 #     firebase_admin.initialize_app(cred, {
 #         'databaseURL': 'https://project-b15f4-default-rtdb.asia-southeast1.firebasedatabase.app/'
 #     })
-get_firebase_app()
 
 def get_games_ref():
     """
     Get a reference to the 'games' node in the database.
 
     Returns:
-        Reference: Firebase reference to the 'games' node.
+        Reference: Database reference to the 'games' node.
     """
-    return db.reference('games')
+    return reference('games')
 
 def add_game(game_data):
     """
@@ -0,0 +1,100 @@
+import bisect
+from storage.backend import reference
+
+# Rows per archived leaderboard page
+HISTORY_PAGE_SIZE = 1000
+
+ARCHIVE_FORMAT = 'paged-columns'
+
+
+def get_archive_pages_ref():
+    return reference('leaderboard_archive')
+
+
+def build_archive(contest_id, rows, completed_at, page_size=None):
+    """
+    Lay out a final leaderboard as a metadata record and fixed-size column pages.
+
+    Contest-level fields are stored once in 'completed_contests/<contest_id>';
+    each page in 'leaderboard_archive/<contest_id>/<page>' holds parallel lists
+    of user IDs, usernames, scores and ranks. The first rank of every page is kept
+    in the metadata, so rank ranges find their pages without reading the others.
+
+    Args:
+        rows (list): (rank, user_id, username, score) tuples in rank order.
+        completed_at (str): ISO timestamp of the completion.
+
+    Returns:
+        dict: Multi-path updates, relative to the database root, writing the archive.
+    """
+    page_size = page_size or HISTORY_PAGE_SIZE
+    updates = {}
+    first_ranks = []
+    for page, offset in enumerate(range(0, len(rows), page_size)):
+        chunk = rows[offset:offset + page_size]
+        first_ranks.append(chunk[0][0])
+        updates[f"leaderboard_archive/{contest_id}/{page}"] = {
+            "user_ids": [row[1] for row in chunk],
+            "usernames": [row[2] for row in chunk],
+            "scores": [row[3] for row in chunk],
+            "ranks": [row[0] for row in chunk]
+        }
+    updates[f"completed_contests/{contest_id}"] = {
+        "contest_id": contest_id,
+        "completed_at": completed_at,
+        "format": ARCHIVE_FORMAT,
+        "total": len(rows),
+        "page_size": page_size,
+        "page_first_ranks": first_ranks
+    }
+    return updates
+
+
+def _read_page(contest_id, page):
+    columns = get_archive_pages_ref().child(contest_id).child(str(page)).get() or {}
+    return [
+        {"user_id": user_id, "username": username, "score": score, "rank": rank}
+        for user_id, username, score, rank in zip(
+            columns.get("user_ids", []), columns.get("usernames", []),
+            columns.get("scores", []), columns.get("ranks", [])
+        )
+    ]
+
+
+def read_rows(contest_id, metadata, offset, limit):
+    """
+    Archived rows from a zero-based position, reading only the pages they are on.
+
+    Returns:
+        list: Row dicts with user_id, username, score and rank.
+    """
+    page_size = metadata["page_size"]
+    end = min(metadata["total"], offset + limit)
+    rows = []
+    if end <= offset:
+        return rows
+    for page in range(offset // page_size, (end - 1) // page_size + 1):
+        page_rows = _read_page(contest_id, page)
+        first = page * page_size
+        rows.extend(page_rows[max(0, offset - first):end - first])
+    return rows
+
+
+def read_rank_range(contest_id, metadata, rank_from, rank_to, limit):
+    """
+    Archived rows whose rank lies between rank_from and rank_to, inclusive.
+
+    Reading starts at the page before the first one starting at or past rank_from,
+    since tied ranks can continue across a page boundary.
+    """
+    first_ranks = metadata.get("page_first_ranks") or []
+    rows = []
+    for page in range(max(0, bisect.bisect_left(first_ranks, rank_from) - 1), len(first_ranks)):
+        if first_ranks[page] > rank_to:
+            break
+        for row in _read_page(contest_id, page):
+            if row["rank"] > rank_to or len(rows) >= limit:
+                return rows
+            if row["rank"] >= rank_from:
+                rows.append(row)
+    return rows
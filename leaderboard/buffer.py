@@ -0,0 +1,186 @@
+import atexit
+import os
+import threading
+from storage.backend import reference
+from leaderboard.shards import score_path
+from logging_utils import setup_logger
+
+# Initialize logger
+logger = setup_logger("leaderboard_buffer")
+
+# 'direct' writes every score immediately, 'buffered' coalesces them in memory
+# and writes them behind
+WRITE_MODE = os.environ.get('DAMNPLAY_LEADERBOARD_WRITE_MODE', 'direct')
+
+# How buffered updates for the same user are merged: 'latest' or 'best'
+MERGE_POLICY = os.environ.get('DAMNPLAY_LEADERBOARD_MERGE', 'latest')
+
+SCORE_FLUSH_INTERVAL_SECONDS = float(os.environ.get('DAMNPLAY_SCORE_FLUSH_INTERVAL', '1.0'))
+SCORE_FLUSH_THRESHOLD = int(os.environ.get('DAMNPLAY_SCORE_FLUSH_THRESHOLD', '1000'))
+
+
+def is_buffered():
+    return WRITE_MODE == 'buffered'
+
+
+class ScoreBuffer:
+    """
+    Write-behind buffer of leaderboard scores.
+
+    Scores are kept per (contest, user), merged with any pending score for the
+    same user, and written to the contests' leaderboards in one multi-path update
+    when the flush interval elapses or the number of pending scores reaches the
+    threshold. Failed writes are retried on the next flush and counted in
+    `failed_flushes`.
+
+    Args:
+        merge_policy (str): 'latest' keeps the newest score, 'best' the highest.
+        interval (float): Seconds between background flushes.
+        threshold (int): Pending scores that trigger an immediate flush.
+    """
+
+    def __init__(self, merge_policy=MERGE_POLICY, interval=SCORE_FLUSH_INTERVAL_SECONDS,
+                 threshold=SCORE_FLUSH_THRESHOLD):
+        self.merge_policy = merge_policy
+        self.interval = interval
+        self.threshold = threshold
+        self._pending = {}
+        self._shard_counts = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self.written = 0
+        self.received = 0
+        self.failed_flushes = 0
+        self.last_error = None
+
+    def _merge(self, current, username, score):
+        if current is not None and self.merge_policy == 'best' and current['score'] >= score:
+            return current
+        return {'username': username, 'score': score}
+
+    def add(self, contest_id, updates, shard_count=1, stored=None):
+        """
+        Buffer scores for a contest.
+
+        Under the 'best' policy a score is also compared with the user's stored
+        score when nothing is pending for them, so a lower score never replaces
+        one that was already flushed.
+
+        :param updates: Iterable of (user_id, username, score)
+        :param shard_count: Number of leaderboard shards of the contest
+        :param stored: Callable returning a user's current (score, username), or None
+        :return: List of the merged (user_id, username, score) now current
+        """
+        updates = list(updates)
+        current_scores = {}
+        if self.merge_policy == 'best' and stored is not None:
+            # Looked up before taking the lock, since it may read the database
+            for user_id, _, _ in updates:
+                entry = stored(user_id)
+                if entry is not None:
+                    current_scores[user_id] = entry
+
+        merged = []
+        with self._lock:
+            scores = self._pending.setdefault(contest_id, {})
+            self._shard_counts[contest_id] = shard_count
+            for user_id, username, score in updates:
+                self.received += 1
+                current = current_scores.get(user_id)
+                if user_id not in scores and current is not None and (current[0] or 0) >= score:
+                    merged.append((user_id, current[1], current[0]))
+                    continue
+                entry = scores[user_id] = self._merge(scores.get(user_id), username, score)
+                merged.append((user_id, entry['username'], entry['score']))
+            pending = sum(len(contest_scores) for contest_scores in self._pending.values())
+
+        self._ensure_started()
+        if pending >= self.threshold:
+            # Flushed by the background thread, so a failed write never fails the caller's update
+            self._wake.set()
+        return merged
+
+    def pending(self, contest_id):
+        """
+        Scores of a contest not yet written, as {user_id: {'username', 'score'}}.
+        """
+        with self._lock:
+            return dict(self._pending.get(contest_id, {}))
+
+    def flush(self, contest_id=None):
+        """
+        Write pending scores, of one contest or of all, and return how many were written.
+
+        If the write fails, the scores are put back (merged with any newer score by
+        the policy), the failure is counted in `failed_flushes` and the error is
+        raised, so a caller such as contest settlement knows the scores are not written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if contest_id is None:
+                    batch, self._pending = self._pending, {}
+                else:
+                    batch = {contest_id: self._pending.pop(contest_id, {})}
+                shard_counts = dict(self._shard_counts)
+
+            updates = {
+                score_path(batch_contest_id, user_id, shard_counts.get(batch_contest_id, 1)): entry
+                for batch_contest_id, scores in batch.items()
+                for user_id, entry in scores.items()
+            }
+            if not updates:
+                return 0
+
+            try:
+                reference('/').update(updates)
+            except Exception as e:
+                with self._lock:
+                    self.failed_flushes += 1
+                    self.last_error = str(e)
+                    for batch_contest_id, scores in batch.items():
+                        current = self._pending.setdefault(batch_contest_id, {})
+                        for user_id, entry in scores.items():
+                            newer = current.get(user_id)
+                            # A newer score wins, unless the policy keeps the higher one
+                            current[user_id] = entry if newer is None else self._merge(entry, newer['username'], newer['score'])
+                logger.exception(f"Failed to flush {len(updates)} buffered scores; they will be retried.")
+                raise
+
+            self.written += len(updates)
+            logger.info(f"Flushed {len(updates)} buffered scores.")
+            return len(updates)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='score-buffer-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.flush()
+            except Exception:
+                # Counted and logged by flush, and the scores were put back; the
+                # thread keeps running so the next interval retries them
+                continue
+
+    def stop(self):
+        """Stop the background flusher and write everything still pending."""
+        self._stop.set()
+        self._wake.set()
+        self.flush()
+
+
+# Shared buffer for the leaderboard services
+score_buffer = ScoreBuffer()
+atexit.register(lambda: score_buffer.flush())
@@ -1,24 +1,56 @@
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context
 from leaderboard.services import (
     fetch_leaderboard,
     update_leaderboard_entry,
+    update_leaderboard_entries,
     fetch_historical_leaderboard,
-    complete_contest
+    complete_contest,
+    stream_leaderboard,
+    fetch_leaderboard_stats,
+    DEFAULT_AROUND_WINDOW,
+    fetch_user_contest_history,
+    DEFAULT_USER_HISTORY_LIMIT
 )
+from leaderboard.models import dumps_response
 from utils import standardize_response
 
 def get_leaderboard(contest_id):
     """
     Fetch the current leaderboard for an active contest.
+
+    Entries are written to the response body directly from the leaderboard rows,
+    without building a dict per entry.
     """
     try:
-        leaderboard_data = fetch_leaderboard(contest_id)
-        return {
-            "leaderboard": leaderboard_data
-        }
+        top = request.args.get('top', type=int)
+        around = request.args.get('around')
+        window = request.args.get('window', type=int)
+        if top is None and around is None:
+            leaderboard_data = fetch_leaderboard(contest_id, as_page=True)
+        else:
+            leaderboard_data = fetch_leaderboard(
+                contest_id,
+                top=top,
+                around=around,
+                window=DEFAULT_AROUND_WINDOW if window is None else window,
+                as_page=True
+            )
+        return Response(dumps_response({"leaderboard": leaderboard_data}), mimetype='application/json')
     except Exception as e:
         raise Exception(f"Error fetching leaderboard: {str(e)}")
 
+def get_leaderboard_stats(contest_id):
+    """
+    Fetch the score distribution of an active contest.
+    """
+    try:
+        result = fetch_leaderboard_stats(contest_id, user_id=request.args.get('user_id'))
+        if not result["success"]:
+            return result, 404
+        return result
+    except Exception as e:
+        raise Exception(f"Error fetching leaderboard stats: {str(e)}")
+
 def modify_leaderboard():
     """
     Update the leaderboard for a contest by adding/updating entries.
@@ -60,18 +92,68 @@ def modify_leaderboard():
             success=False
         )
 
+def modify_leaderboard_batch():
+    """
+    Update the leaderboard with a batch of scores, possibly spanning several contests.
+    """
+    try:
+        data = request.get_json() or {}
+        scores = data.get('scores')
+        if not isinstance(scores, list) or not scores:
+            raise ValueError("Missing required parameter: 'scores' must be a non-empty list")
+
+        return update_leaderboard_entries(scores)
+
+    except Exception as e:
+        return standardize_response(
+            data={"details": f"Error updating leaderboard: {str(e)}"},
+            message="Failed to update leaderboard",
+            success=False
+        )
+
+def stream_leaderboard_controller(contest_id):
+    """
+    Stream live score and rank changes of an active contest as Server-Sent Events.
+    """
+    result = stream_leaderboard(contest_id)
+    if not result["success"]:
+        return result, 404
+    response = Response(stream_with_context(result["data"]["events"]), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 def get_historical_leaderboard(contest_id):
     """
     Fetch historical leaderboard for a completed contest.
     """
     try:
-        historical_data = fetch_historical_leaderboard(contest_id)
+        offset = request.args.get('offset', type=int)
+        limit = request.args.get('limit', type=int)
+        rank_from = request.args.get('rank_from', type=int)
+        rank_to = request.args.get('rank_to', type=int)
+        historical_data = fetch_historical_leaderboard(
+            contest_id, offset=offset, limit=limit, rank_from=rank_from, rank_to=rank_to
+        )
         return {
             "historical_leaderboard": historical_data
         }
     except Exception as e:
         raise Exception(f"Error fetching historical leaderboard: {str(e)}")
 
+def get_user_contest_history(user_id):
+    """
+    Fetch a page of a user's completed contests.
+    """
+    try:
+        return fetch_user_contest_history(
+            user_id,
+            limit=request.args.get('limit', DEFAULT_USER_HISTORY_LIMIT, type=int),
+            cursor=request.args.get('cursor')
+        )
+    except Exception as e:
+        raise Exception(f"Error fetching contest history: {str(e)}")
+
 def complete_contest_route():
     """
     Complete a contest and archive its leaderboard.
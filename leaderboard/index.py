@@ -0,0 +1,275 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from leaderboard.stats import ScoreSketch
+
+# How often a contest index is rebuilt from the database to pick up scores
+# written by other processes
+LEADERBOARD_INDEX_RELOAD_SECONDS = 60
+
+# Maximum number of contest indexes kept in memory
+MAX_INDEXED_CONTESTS = 256
+
+_MAX_LEVEL = 32
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        # width[i] is the number of bottom-level steps to next[i]
+        self.width = [1] * level
+
+
+class RankedIndex:
+    """
+    Indexable skip list of unique, sortable keys.
+
+    Insertion, removal, counting the keys below a key and fetching the key at a
+    position all take O(log n) expected time, so ranks never require a sort.
+    """
+
+    def __init__(self):
+        self._head = _Node(None, _MAX_LEVEL)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def _random_level():
+        level = 1
+        while level < _MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        return level
+
+    def _find(self, key):
+        """Return the last node before key on every level and the position of each."""
+        chain = [None] * _MAX_LEVEL
+        steps = [0] * _MAX_LEVEL
+        node = self._head
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                steps[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        return chain, steps
+
+    def insert(self, key):
+        chain, steps_at_level = self._find(key)
+        node = _Node(key, self._random_level())
+        steps = 0
+        for level in range(len(node.next)):
+            previous = chain[level]
+            node.next[level] = previous.next[level]
+            previous.next[level] = node
+            node.width[level] = previous.width[level] - steps
+            previous.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(len(node.next), _MAX_LEVEL):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain, _ = self._find(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for level in range(len(node.next)):
+            previous = chain[level]
+            previous.width[level] += node.width[level] - 1
+            previous.next[level] = node.next[level]
+        for level in range(len(node.next), _MAX_LEVEL):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def count_less(self, key):
+        """Number of keys strictly lower than key."""
+        _, steps = self._find(key)
+        return sum(steps)
+
+    def iter_from(self, position):
+        """Yield keys in order, starting at the given zero-based position."""
+        if position < 0 or position >= self._size:
+            return
+        node = self._head
+        remaining = position + 1
+        for level in reversed(range(_MAX_LEVEL)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        while node is not None:
+            yield node.key
+            node = node.next[0]
+
+
+class ContestIndex:
+    """
+    Scores of one contest ordered by (score descending, user ID).
+
+    Ranks follow the leaderboard's competition ranking: tied scores share a rank
+    and the next score's rank skips past them (1, 2, 2, 4). A ScoreSketch of the
+    scores is kept up to date alongside for the score distribution.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loaded_at = None
+        self._ranked = RankedIndex()
+        self._entries = {}
+        self.sketch = ScoreSketch()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(user_id, score):
+        return (-(score or 0), user_id)
+
+    def rebuild(self, leaderboard_data):
+        """
+        Replace the contents with a {user_id: {'username', 'score'}} mapping.
+        """
+        self._ranked = RankedIndex()
+        self._entries = {}
+        self.sketch = ScoreSketch()
+        for user_id, user_data in (leaderboard_data or {}).items():
+            self.upsert(user_id, user_data.get('username', 'Unknown'), user_data.get('score', 0))
+        self.loaded_at = time.monotonic()
+
+    def upsert(self, user_id, username, score):
+        previous = self._entries.get(user_id)
+        if previous is not None:
+            self._ranked.remove(self._key(user_id, previous[0]))
+            self.sketch.remove(previous[0])
+        self._entries[user_id] = (score or 0, username)
+        self._ranked.insert(self._key(user_id, score))
+        self.sketch.add(score)
+
+    def remove(self, user_id):
+        previous = self._entries.pop(user_id, None)
+        if previous is not None:
+            self._ranked.remove(self._key(user_id, previous[0]))
+            self.sketch.remove(previous[0])
+
+    def get(self, user_id):
+        """
+        :return: (score, username) or None
+        """
+        return self._entries.get(user_id)
+
+    def position(self, user_id):
+        """Zero-based position of a user in ranked order, or None."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        return self._ranked.count_less(self._key(user_id, entry[0]))
+
+    def rank_of_score(self, score):
+        """Competition rank a score holds: one more than the number of higher scores."""
+        return self._ranked.count_less((-(score or 0), '')) + 1
+
+    def rank(self, user_id):
+        entry = self._entries.get(user_id)
+        return None if entry is None else self.rank_of_score(entry[0])
+
+    def entries(self, start=0, count=None):
+        """
+        Ranked entries from a zero-based position.
+
+        :return: List of (rank, user_id, username, score)
+        """
+        result = []
+        rank = None
+        previous_score = None
+        for offset, (negative_score, user_id) in enumerate(self._ranked.iter_from(max(0, start))):
+            if count is not None and offset >= count:
+                break
+            score, username = self._entries[user_id]
+            if rank is None:
+                rank = self.rank_of_score(score)
+            elif score != previous_score:
+                rank = start + offset + 1
+            previous_score = score
+            result.append((rank, user_id, username, score))
+        return result
+
+
+class LeaderboardIndexRegistry:
+    """
+    Per-process ranked indexes of live contest leaderboards.
+
+    A contest's index is built from the database on first use and rebuilt every
+    `reload_seconds`; in between, update_leaderboard_entry keeps it current one
+    score at a time. The least recently used contests are dropped beyond
+    `max_contests`.
+    """
+
+    def __init__(self, reload_seconds=LEADERBOARD_INDEX_RELOAD_SECONDS, max_contests=MAX_INDEXED_CONTESTS):
+        self.reload_seconds = reload_seconds
+        self.max_contests = max_contests
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, contest_id, load):
+        """
+        Return the contest's index, building it with load() if needed.
+
+        :param load: Callable returning {user_id: {'username', 'score'}} for the contest
+        """
+        with self._lock:
+            index = self._indexes.get(contest_id)
+            if index is None:
+                index = self._indexes[contest_id] = ContestIndex()
+            self._indexes.move_to_end(contest_id)
+            while len(self._indexes) > self.max_contests:
+                self._indexes.popitem(last=False)
+
+        # Held while loading, so updates applied meanwhile land on the new contents
+        with index.lock:
+            if index.loaded_at is None or time.monotonic() - index.loaded_at >= self.reload_seconds:
+                index.rebuild(load())
+        return index
+
+    def is_loaded(self, contest_id):
+        """Whether the contest's index is in memory and not due for a reload."""
+        with self._lock:
+            index = self._indexes.get(contest_id)
+        return (
+            index is not None and index.loaded_at is not None
+            and time.monotonic() - index.loaded_at < self.reload_seconds
+        )
+
+    def apply_update(self, contest_id, user_id, username, score):
+        """Apply a score already written to the database to a loaded index."""
+        self.apply_updates(contest_id, [(user_id, username, score)])
+
+    def apply_updates(self, contest_id, updates):
+        """
+        Apply several scores already written to the database under one lock acquisition.
+
+        :param updates: Iterable of (user_id, username, score)
+        """
+        with self._lock:
+            index = self._indexes.get(contest_id)
+        if index is None:
+            return
+        with index.lock:
+            if index.loaded_at is not None:
+                for user_id, username, score in updates:
+                    index.upsert(user_id, username, score)
+
+    def discard(self, contest_id):
+        with self._lock:
+            self._indexes.pop(contest_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+# Shared registry for the leaderboard services
+leaderboard_indexes = LeaderboardIndexRegistry()
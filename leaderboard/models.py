@@ -1,4 +1,26 @@
+import json
+import math
+from datetime import date
+from json.encoder import encode_basestring_ascii
+from werkzeug.http import http_date
+
+
+def encode_json_value(value):
+    """JSON text of a scalar leaderboard field, encoded the way Flask's jsonify does."""
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return int.__repr__(value)
+    if isinstance(value, float) and math.isfinite(value):
+        return float.__repr__(value)
+    if isinstance(value, date):
+        return encode_basestring_ascii(http_date(value))
+    return json.dumps(value, default=str)
+
+
 class LeaderboardEntry:
+    __slots__ = ('user_id', 'username', 'score', 'rank', 'contest_id', 'timestamp')
+
     def __init__(self, user_id, username, score, rank=None, contest_id=None, timestamp=None):
         self.user_id = user_id
         self.username = username
@@ -15,4 +37,102 @@ class LeaderboardEntry:
             "rank": self.rank,
             "contest_id": self.contest_id,
             "timestamp": self.timestamp,
-        }
\ No newline at end of file
+        }
+
+
+class LeaderboardPage:
+    """
+    Ranked leaderboard rows of one response, stored as parallel columns.
+
+    All rows share the contest ID and the snapshot time, which are kept once.
+    The page renders as the same entries as LeaderboardEntry.to_dict(), either as
+    dicts or written straight to JSON text without building them.
+    """
+
+    __slots__ = ('contest_id', 'timestamp', 'ranks', 'user_ids', 'usernames', 'scores')
+
+    def __init__(self, contest_id, rows, timestamp):
+        """
+        :param rows: Iterable of (rank, user_id, username, score)
+        :param timestamp: datetime of the snapshot the rows were read at
+        """
+        self.contest_id = contest_id
+        self.timestamp = timestamp
+        self.ranks, self.user_ids, self.usernames, self.scores = [], [], [], []
+        for rank, user_id, username, score in rows:
+            self.ranks.append(rank)
+            self.user_ids.append(user_id)
+            self.usernames.append(username)
+            self.scores.append(score)
+
+    def __len__(self):
+        return len(self.ranks)
+
+    def entries(self):
+        """Yield the rows as LeaderboardEntry objects."""
+        for rank, user_id, username, score in zip(self.ranks, self.user_ids, self.usernames, self.scores):
+            yield LeaderboardEntry(user_id, username, score, rank, self.contest_id, self.timestamp)
+
+    def to_dicts(self):
+        return [
+            {
+                "user_id": user_id,
+                "username": username,
+                "score": score,
+                "rank": rank,
+                "contest_id": self.contest_id,
+                "timestamp": self.timestamp,
+            }
+            for rank, user_id, username, score in zip(self.ranks, self.user_ids, self.usernames, self.scores)
+        ]
+
+    def write_json(self, parts):
+        """
+        Append the JSON text of the rows, as an array, to a list of strings.
+
+        Row keys are written in sorted order, as jsonify writes them.
+        """
+        # Fields shared by every row are encoded once
+        contest_id = encode_json_value(self.contest_id)
+        timestamp = encode_json_value(http_date(self.timestamp))
+        parts.append('[')
+        separator = ''
+        for rank, user_id, username, score in zip(self.ranks, self.user_ids, self.usernames, self.scores):
+            parts.append(
+                f'{separator}{{"contest_id":{contest_id},"rank":{encode_json_value(rank)}'
+                f',"score":{encode_json_value(score)},"timestamp":{timestamp}'
+                f',"user_id":{encode_json_value(user_id)},"username":{encode_json_value(username)}}}'
+            )
+            separator = ','
+        parts.append(']')
+
+
+def dumps_response(value):
+    """
+    Serialize a response that may hold LeaderboardPage objects to JSON text.
+
+    Pages write their rows directly; everything else is encoded as jsonify would.
+    """
+    parts = []
+    _write_json(value, parts)
+    return ''.join(parts)
+
+
+def _write_json(value, parts):
+    if isinstance(value, LeaderboardPage):
+        value.write_json(parts)
+    elif isinstance(value, dict):
+        parts.append('{')
+        for position, key in enumerate(sorted(value)):
+            parts.append(f'{"," if position else ""}{encode_json_value(key)}:')
+            _write_json(value[key], parts)
+        parts.append('}')
+    elif isinstance(value, (list, tuple)):
+        parts.append('[')
+        for position, item in enumerate(value):
+            if position:
+                parts.append(',')
+            _write_json(item, parts)
+        parts.append(']')
+    else:
+        parts.append(encode_json_value(value))
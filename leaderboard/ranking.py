@@ -0,0 +1,110 @@
+try:
+    import numpy as np
+except ImportError:  # Optional: rankings fall back to pure Python
+    np = None
+
+
+class RankedLeaderboard:
+    """
+    A contest's scores in rank order, kept as parallel columns.
+
+    `order` lists row positions from best to worst (score descending, then user ID)
+    and `ranks` holds the competition rank of each of them (1, 2, 2, 4). Entries
+    are only materialized for the rows a caller asks for.
+
+    Args:
+        user_ids (list): User ID of each row.
+        usernames (list): Username of each row.
+        scores (list): Score of each row, as stored.
+        order: Row positions in rank order (NumPy array or list).
+        ranks: Rank of each position in `order` (NumPy array or list).
+    """
+
+    def __init__(self, user_ids, usernames, scores, order, ranks):
+        self.user_ids = user_ids
+        self.usernames = usernames
+        self.scores = scores
+        self.order = order
+        self.ranks = ranks
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def rows(self, start=0, count=None):
+        """
+        Ranked rows from a zero-based position.
+
+        Returns:
+            list: (rank, user_id, username, score) tuples.
+        """
+        end = len(self) if count is None else min(len(self), start + count)
+        positions = self.order[start:end]
+        ranks = self.ranks[start:end]
+        if np is not None:
+            positions, ranks = positions.tolist(), ranks.tolist()
+        return [
+            (rank, self.user_ids[row], self.usernames[row], self.scores[row])
+            for rank, row in zip(ranks, positions)
+        ]
+
+    def rank_one_holders(self):
+        """User IDs of every row sharing the best score."""
+        if np is not None:
+            count = int(np.count_nonzero(self.ranks == 1))
+            positions = self.order[:count].tolist()
+        else:
+            count = 0
+            while count < len(self.ranks) and self.ranks[count] == 1:
+                count += 1
+            positions = self.order[:count]
+        return [self.user_ids[row] for row in positions]
+
+
+def rank_leaderboard(leaderboard_data):
+    """
+    Rank a {user_id: {'username', 'score'}} mapping.
+
+    With NumPy installed the sort and the tie handling are vectorized: rows are
+    ordered with one lexsort and each rank is the insertion point of its score
+    among the sorted scores. Without NumPy the same ranking is computed in Python.
+
+    Returns:
+        RankedLeaderboard
+    """
+    user_ids = list(leaderboard_data)
+    usernames = []
+    scores = []
+    for user_data in leaderboard_data.values():
+        usernames.append(user_data.get('username', 'Unknown'))
+        scores.append(user_data.get('score', 0) or 0)
+
+    if np is not None:
+        negative_scores = -np.asarray(scores, dtype=np.float64)
+        order = np.lexsort((np.asarray(user_ids, dtype=str), negative_scores))
+        sorted_scores = negative_scores[order]
+        ranks = np.searchsorted(sorted_scores, sorted_scores, side='left') + 1
+        return RankedLeaderboard(user_ids, usernames, scores, order, ranks)
+
+    order = sorted(range(len(user_ids)), key=lambda row: (-scores[row], user_ids[row]))
+    ranks = []
+    previous_score = None
+    for position, row in enumerate(order):
+        if scores[row] != previous_score:
+            rank = position + 1
+            previous_score = scores[row]
+        ranks.append(rank)
+    return RankedLeaderboard(user_ids, usernames, scores, order, ranks)
+
+
+def split_prize(ranked, prize_pool):
+    """
+    Split a prize pool equally among the rank 1 holders.
+
+    Returns:
+        list: (user_id, amount) pairs, empty if the leaderboard is empty.
+    """
+    winners = ranked.rank_one_holders()
+    if not winners:
+        return []
+    amount = prize_pool / len(winners)
+    return [(user_id, amount) for user_id in winners]
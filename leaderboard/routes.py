@@ -23,6 +23,34 @@ def fetch_leaderboard_route(contest_id):
         logger.error(f"Error fetching leaderboard for contest_id: {contest_id}, Error: {str(e)}")
         return standardize_response(data={"details": str(e)}, message="Failed to fetch leaderboard", success=False), 500
 
+@leaderboard_blueprint.route('/leaderboard/<contest_id>/stats', methods=['GET'])
+def fetch_leaderboard_stats_route(contest_id):
+    """
+    Fetch the score distribution of an active contest.
+    """
+    from .controllers import get_leaderboard_stats  # Import here to avoid circular import
+    try:
+        logger.info(f"Fetching leaderboard stats for contest_id: {contest_id}")
+        result = get_leaderboard_stats(contest_id)
+        logger.info(f"Leaderboard stats fetched for contest_id: {contest_id}")
+        return result
+    except Exception as e:
+        logger.error(f"Error fetching leaderboard stats for contest_id: {contest_id}, Error: {str(e)}")
+        return standardize_response(data={"details": str(e)}, message="Failed to fetch leaderboard stats", success=False), 500
+
+@leaderboard_blueprint.route('/leaderboard/<contest_id>/stream', methods=['GET'])
+def stream_leaderboard_route(contest_id):
+    """
+    Stream live leaderboard changes for an active contest.
+    """
+    from .controllers import stream_leaderboard_controller  # Import here to avoid circular import
+    try:
+        logger.info(f"Opening leaderboard stream for contest_id: {contest_id}")
+        return stream_leaderboard_controller(contest_id)
+    except Exception as e:
+        logger.error(f"Error opening leaderboard stream for contest_id: {contest_id}, Error: {str(e)}")
+        return standardize_response(data={"details": str(e)}, message="Failed to open leaderboard stream", success=False), 500
+
 @leaderboard_blueprint.route('/update_leaderboard', methods=['POST'])
 def update_leaderboard_route():
     """
@@ -38,6 +66,21 @@ def update_leaderboard_route():
         logger.error(f"Error updating leaderboard, Error: {str(e)}")
         return standardize_response(data={"details": str(e)}, message="Failed to update leaderboard", success=False), 500
 
+@leaderboard_blueprint.route('/update_leaderboard/batch', methods=['POST'])
+def update_leaderboard_batch_route():
+    """
+    Update the leaderboard with a batch of scores.
+    """
+    from .controllers import modify_leaderboard_batch  # Import here to avoid circular import
+    try:
+        logger.info("Updating leaderboard with a batch of scores")
+        result = modify_leaderboard_batch()
+        logger.info("Leaderboard score batch processed")
+        return result
+    except Exception as e:
+        logger.error(f"Error updating leaderboard with a batch of scores, Error: {str(e)}")
+        return standardize_response(data={"details": str(e)}, message="Failed to update leaderboard", success=False), 500
+
 @leaderboard_blueprint.route('/leaderboard/history/<contest_id>', methods=['GET'])
 def fetch_historical_leaderboard_route(contest_id):
     """
@@ -53,6 +96,21 @@ def fetch_historical_leaderboard_route(contest_id):
         logger.error(f"Error fetching historical leaderboard for contest_id: {contest_id}, Error: {str(e)}")
         return standardize_response(data={"details": str(e)}, message="Failed to fetch historical leaderboard", success=False), 500
 
+@leaderboard_blueprint.route('/leaderboard/history/user/<user_id>', methods=['GET'])
+def fetch_user_contest_history_route(user_id):
+    """
+    Fetch the completed contests of a user, most recent first.
+    """
+    from .controllers import get_user_contest_history  # Import here to avoid circular import
+    try:
+        logger.info(f"Fetching contest history for user_id: {user_id}")
+        result = get_user_contest_history(user_id)
+        logger.info(f"Contest history fetched for user_id: {user_id}")
+        return result
+    except Exception as e:
+        logger.error(f"Error fetching contest history for user_id: {user_id}, Error: {str(e)}")
+        return standardize_response(data={"details": str(e)}, message="Failed to fetch contest history", success=False), 500
+
 @leaderboard_blueprint.route('/leaderboard/complete', methods=['POST'])
 def complete_leaderboard_route():
     """
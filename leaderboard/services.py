@@ -1,18 +1,73 @@
+import time
+import uuid
 from datetime import datetime
-from firebase_admin import db
-from leaderboard.models import LeaderboardEntry
-from wallet.services import credit_winnings_service
-from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from storage.backend import reference
+from storage.base import INVALID_KEY_CHARS
+from leaderboard.models import LeaderboardPage
+from leaderboard.index import leaderboard_indexes
+from leaderboard.stats import STATS_PERCENTILES
+from leaderboard.ranking import rank_leaderboard, split_prize
+from leaderboard.archive import ARCHIVE_FORMAT, build_archive, read_rows, read_rank_range
+from leaderboard.shards import (
+    get_shard_count, read_scores, read_score, unscored_users, write_scores, scores_path,
+    top_scores, count_higher, rank_key
+)
+from leaderboard.buffer import score_buffer, is_buffered
+from leaderboard.stream import leaderboard_hub, SSE_SNAPSHOT_SIZE
+from wallet.services import (
+    apply_batch_service, query_transactions_page, encode_cursor, decode_cursor
+)
+from caching import TTLCache
 from utils import standardize_response
 from logging_utils import setup_logger
 
 # Initialize logger
 logger = setup_logger("leaderboard_services")
 
-# Firebase database references
-leaderboard_ref = db.reference('leaderboards')
-contests_ref = db.reference('contests')
-completed_contests_ref = db.reference('completed_contests')
+# Leaderboard slices
+MAX_LEADERBOARD_SLICE = 1000
+DEFAULT_AROUND_WINDOW = 5
+MAX_AROUND_WINDOW = 100
+
+# Historical leaderboard slices
+DEFAULT_HISTORY_LIMIT = 100
+MAX_HISTORY_LIMIT = 1000
+
+# Per-user contest history pages
+DEFAULT_USER_HISTORY_LIMIT = 20
+MAX_USER_HISTORY_LIMIT = 100
+
+# Batched score submission
+MAX_SCORE_BATCH = 10000
+SCORE_WRITE_GROUP_SIZE = 1000   # Scores per multi-path update
+
+# Caches
+CONTEST_CACHE_TTL_SECONDS = 10
+TERMINAL_CONTEST_CACHE_TTL_SECONDS = 300
+LEADERBOARD_CACHE_TTL_SECONDS = 5
+TERMINAL_CONTEST_STATUSES = ('completed', 'canceled')
+SETTLING_STATUS = 'settling'
+CANCELING_STATUS = 'canceling'
+
+# Contest settlement
+SETTLEMENT_BATCH_SIZE = 1000    # Payouts per wallet batch
+SETTLEMENT_MAX_WORKERS = 4      # Wallet batches applied concurrently
+SETTLEMENT_LEASE_SECONDS = 300  # How long a run holds a settlement without renewing
+HISTORY_WRITE_BATCH_SIZE = 1000 # Contest history entries per multi-path update
+
+contest_cache = TTLCache('contests', CONTEST_CACHE_TTL_SECONDS, max_bytes=4 * 1024 * 1024)
+leaderboard_cache = TTLCache('leaderboards', LEADERBOARD_CACHE_TTL_SECONDS, max_bytes=32 * 1024 * 1024)
+
+# Database references
+def get_leaderboard_ref():
+    return reference('leaderboards')
+
+def get_contests_ref():
+    return reference('contests')
+
+def get_completed_contests_ref():
+    return reference('completed_contests')
 
 # Helper function to validate datetime format
 def validate_datetime(datetime_str):
@@ -28,91 +83,339 @@ def validate_datetime(datetime_str):
         logger.error(f"Invalid datetime format: {datetime_str}")
         return None
 
-@lru_cache(maxsize=128)
+def is_contest_active(contest_data):
+    """
+    Whether a contest can still receive scores, i.e. is neither being settled, canceled nor completed.
+    """
+    return contest_data.get('status') not in TERMINAL_CONTEST_STATUSES + (SETTLING_STATUS, CANCELING_STATUS)
+
+def is_contest_open_for_scores(contest_id, contest_data):
+    """
+    Whether a contest accepts scores, judged by its status read from the database.
+
+    The cached contest can show an active status for up to CONTEST_CACHE_TTL_SECONDS
+    after another process started settling or canceling it, so score writes check
+    the stored status leaf instead; a cached status found stale is dropped.
+    """
+    status = get_contests_ref().child(contest_id).child('status').get()
+    if status != contest_data.get('status'):
+        contest_cache.invalidate(contest_id)
+    return is_contest_active({'status': status})
+
+def is_contest_readable(contest_data):
+    """
+    Whether a contest's live leaderboard can still be read: it is active, or being
+    settled, in which case the leaderboard is served read-only until it is archived.
+    """
+    return is_contest_active(contest_data) or contest_data.get('status') == SETTLING_STATUS
+
 def get_leaderboard_data(contest_id):
     """
     Fetch leaderboard data from the database and cache it.
 
+    The cached value is shared and must not be modified.
+
     :param contest_id: The ID of the contest
     :return: Leaderboard data dictionary
     """
-    logger.info(f"Fetching leaderboard data for contest_id: {contest_id}")
-    return leaderboard_ref.child(contest_id).get()
+    def load():
+        logger.info(f"Fetching leaderboard data for contest_id: {contest_id}")
+        return read_scores(contest_id, get_shard_count(get_contest_data(contest_id)))
+    return leaderboard_cache.get_or_load(contest_id, load)
 
-@lru_cache(maxsize=128)
 def get_contest_data(contest_id):
     """
     Fetch contest data from the database and cache it.
 
+    Active contests are cached briefly so a status change made by another process
+    shows up quickly; completed and canceled contests never change again. Score
+    writes still check the stored status with `is_contest_open_for_scores`.
+    The cached value is shared and must not be modified.
+
     :param contest_id: The ID of the contest
     :return: Contest data dictionary
     """
-    logger.info(f"Fetching contest data for contest_id: {contest_id}")
-    return contests_ref.child(contest_id).get()
+    def load():
+        logger.info(f"Fetching contest data for contest_id: {contest_id}")
+        return get_contests_ref().child(contest_id).get()
+    return contest_cache.get_or_load(
+        contest_id,
+        load,
+        ttl=lambda contest: TERMINAL_CONTEST_CACHE_TTL_SECONDS if contest.get('status') in TERMINAL_CONTEST_STATUSES else CONTEST_CACHE_TTL_SECONDS
+    )
+
+def invalidate_contest(contest_id):
+    """
+    Drop everything cached for a contest, e.g. after its status changed. Buffered
+    scores are kept; they were already accepted and are still written.
+
+    :param contest_id: The ID of the contest
+    """
+    contest_cache.invalidate(contest_id)
+    leaderboard_cache.invalidate(contest_id)
+    leaderboard_indexes.discard(contest_id)
+
+def get_cache_stats():
+    """
+    Hit, miss and size counters of the leaderboard caches.
+    """
+    return [contest_cache.stats(), leaderboard_cache.stats()]
+
+def load_leaderboard(contest_id):
+    """
+    Read a contest's scores, adding a zero score for participants without a submission.
+
+    :param contest_id: The ID of the contest
+    :return: {user_id: {'username', 'score'}}, empty if the contest has no leaderboard
+    """
+    contest_data = get_contest_data(contest_id)
+    leaderboard_data = read_scores(contest_id, get_shard_count(contest_data))
+    if not leaderboard_data:
+        return {}
+
+    participants = contest_data.get('participants', []) if contest_data else []
+    for participant in participants:
+        if participant not in leaderboard_data:
+            leaderboard_data[participant] = {
+                'username': 'Unknown',
+                'score': 0
+            }
+    return leaderboard_data
+
+def get_leaderboard_index(contest_id):
+    """
+    Return the ranked index of a contest's leaderboard.
+
+    :param contest_id: The ID of the contest
+    :return: ContestIndex, built from the database on first use
+    """
+    def load():
+        leaderboard_data = load_leaderboard(contest_id)
+        # Scores still waiting in the write-behind buffer are newer than the database
+        pending = score_buffer.pending(contest_id)
+        if pending:
+            leaderboard_data = dict(leaderboard_data, **pending)
+        return leaderboard_data
+    return leaderboard_indexes.get(contest_id, load)
+
+def build_leaderboard_entries(contest_id, ranked, timestamp=None):
+    """
+    Turn (rank, user_id, username, score) rows from the index into entry dicts
+    sharing one snapshot timestamp.
+    """
+    return LeaderboardPage(contest_id, ranked, timestamp or datetime.now()).to_dicts()
 
-def fetch_leaderboard(contest_id):
+def fetch_leaderboard(contest_id, top=None, around=None, window=DEFAULT_AROUND_WINDOW, as_page=False):
     """
     Fetch and rank leaderboard data for a given contest ID, handling ties and missing submissions.
 
+    Entries are read in rank order from the contest's ranked index, so no sort is needed.
+    With `top` and/or `around` only those slices are returned, at O(log n + K) cost.
+    A contest being settled is still served, read-only, until it is archived.
+
     :param contest_id: The ID of the contest
+    :param top: Return the K best entries
+    :param around: Return the entries around this user
+    :param window: Number of entries above and below `around`
+    :param as_page: Return entries as LeaderboardPage objects, for dumps_response, instead of dicts
     :return: Standardized response with leaderboard entries or error details
     """
     try:
         logger.info(f"Fetching leaderboard for contest_id: {contest_id}")
-        leaderboard_data = get_leaderboard_data(contest_id)
+        if top is not None and not 0 < top <= MAX_LEADERBOARD_SLICE:
+            return standardize_response(data=None, message=f"top must be between 1 and {MAX_LEADERBOARD_SLICE}", success=False)
+        if around is not None and not 0 <= window <= MAX_AROUND_WINDOW:
+            return standardize_response(data=None, message=f"window must be between 0 and {MAX_AROUND_WINDOW}", success=False)
+
         contest_data = get_contest_data(contest_id)
+        if contest_data and not is_contest_readable(contest_data):
+            leaderboard_indexes.discard(contest_id)
+            logger.warning(f"Contest {contest_id} is no longer active")
+            return standardize_response(data=None, message=f"Contest {contest_id} is no longer active", success=False)
+
+        if (
+            contest_data and get_shard_count(contest_data) > 1 and not is_buffered()
+            and (top is not None or around is not None) and (around is None or window == 0)
+            and not leaderboard_indexes.is_loaded(contest_id)
+        ):
+            sharded = fetch_sharded_leaderboard(contest_id, contest_data, top, around)
+        else:
+            sharded = None
+        if sharded is not None:
+            if not sharded["success"]:
+                return sharded
+            ranked = sharded["data"]
+        else:
+            ranked = read_leaderboard_index(contest_id, top, around, window)
+            if isinstance(ranked, str):
+                return standardize_response(data=None, message=ranked, success=False)
+
+        # One snapshot time for every entry of the response
+        snapshot = datetime.now()
+
+        def render(rows):
+            page = LeaderboardPage(contest_id, rows, snapshot)
+            return page if as_page else page.to_dicts()
+
+        if isinstance(ranked, dict):
+            result = {key: value if key == "total" else render(value) for key, value in ranked.items()}
+        else:
+            result = render(ranked)
 
-        if not leaderboard_data:
+        logger.info(f"Successfully fetched leaderboard for contest_id: {contest_id}")
+        return standardize_response(data=result, message="Leaderboard fetched successfully", success=True)
+
+    except Exception as e:
+        logger.exception(f"Failed to fetch leaderboard for contest_id: {contest_id}")
+        return standardize_response(data={"details": str(e)}, message="Failed to fetch leaderboard", success=False)
+
+def read_leaderboard_index(contest_id, top=None, around=None, window=DEFAULT_AROUND_WINDOW):
+    """
+    Read ranked rows of a live contest from its index.
+
+    :return: List of (rank, user_id, username, score) rows, or with `top`/`around`
+             a {total, top?, around?} dict of them; an error message if there is nothing to return
+    """
+    index = get_leaderboard_index(contest_id)
+
+    with index.lock:
+        if not len(index):
             logger.warning(f"No leaderboard data found for contest {contest_id}")
-            return standardize_response(data=None, message=f"No leaderboard data found for contest {contest_id}", success=False)
+            return f"No leaderboard data found for contest {contest_id}"
+
+        if top is None and around is None:
+            return index.entries()
+
+        ranked = {"total": len(index)}
+        if top is not None:
+            ranked["top"] = index.entries(0, top)
+        if around is not None:
+            position = index.position(around)
+            if position is None:
+                logger.warning(f"User {around} not found in leaderboard for contest {contest_id}")
+                return f"User {around} not found in leaderboard"
+            start = max(0, position - window)
+            ranked["around"] = index.entries(start, position - start + window + 1)
+        return ranked
+
+def fetch_sharded_leaderboard(contest_id, contest_data, top=None, around=None):
+    """
+    Answer top-K and single-user rank queries of a sharded contest from its shards,
+    without loading the whole leaderboard.
 
-        participants = contest_data.get('participants', []) if contest_data else []
-        for participant in participants:
-            if participant not in leaderboard_data:
-                leaderboard_data[participant] = {
-                    'username': 'Unknown',
-                    'score': 0
-                }
+    Top entries are a k-way merge of each shard's best K scores; a user's rank is
+    one more than the number of higher scores summed over the shards. Only those
+    rows are read, so the response carries no total. A rank that would need more
+    than MAX_SHARD_RANK_SCAN rows of a shard, or more than MAX_UNSCORED_SCAN
+    participants checked for a missing score, is not answered here.
 
-        sorted_leaderboard = sorted(
-            leaderboard_data.items(),
-            key=lambda x: x[1].get('score', 0),
-            reverse=True
-        )
+    :param contest_id: The ID of the contest
+    :param contest_data: The contest record
+    :param top: Return the K best entries
+    :param around: Return this user's entry
+    :return: Standardized response with {top?, around?}, each slice a list of
+             (rank, user_id, username, score) rows, or None if the query is
+             to be answered from the ranked index instead
+    """
+    shard_count = get_shard_count(contest_data)
+    participants = contest_data.get('participants', [])
+    result = {}
+    if top is not None:
+        rows = top_scores(contest_id, shard_count, top)
+        if not rows:
+            logger.warning(f"No leaderboard data found for contest {contest_id}")
+            return standardize_response(data=None, message=f"No leaderboard data found for contest {contest_id}", success=False)
+        # Participants without a submission count as a zero score, so they can
+        # only reach the top K when it extends down to zero; ties go by user ID,
+        # so the first K of them in ID order are enough
+        if len(rows) < top or rows[-1][2] <= 0:
+            unscored = unscored_users(contest_id, shard_count, participants, count=top)
+            if unscored is None:
+                logger.info(f"Too many participants to check in contest {contest_id}; using the index")
+                return None
+            rows += [(user_id, 'Unknown', 0) for user_id in unscored]
+        rows.sort(key=lambda row: rank_key(row[0], row[2]))
+        ranked = []
+        for position, (user_id, username, score) in enumerate(rows[:top]):
+            rank = position + 1 if not ranked or ranked[-1][3] != score else ranked[-1][0]
+            ranked.append((rank, user_id, username, score))
+        result["top"] = ranked
+    if around is not None:
+        user_data = read_score(contest_id, around, shard_count)
+        if user_data is not None:
+            username, score = user_data.get('username', 'Unknown'), user_data.get('score', 0) or 0
+        elif around in participants and top_scores(contest_id, shard_count, 1):
+            username, score = 'Unknown', 0
+        else:
+            logger.warning(f"User {around} not found in leaderboard for contest {contest_id}")
+            return standardize_response(data=None, message=f"User {around} not found in leaderboard", success=False)
+        higher = count_higher(contest_id, shard_count, score)
+        if higher is None:
+            logger.info(f"Rank of {around} in contest {contest_id} is too deep for the shards; using the index")
+            return None
+        rank = higher + 1
+        if score < 0:
+            unscored = unscored_users(contest_id, shard_count, participants)
+            if unscored is None:
+                logger.info(f"Too many participants to check in contest {contest_id}; using the index")
+                return None
+            rank += len(unscored)
+        result["around"] = [(rank, around, username, score)]
+
+    logger.info(f"Successfully fetched sharded leaderboard for contest_id: {contest_id}")
+    return standardize_response(data=result, message="Leaderboard fetched successfully", success=True)
+
+def fetch_leaderboard_stats(contest_id, user_id=None):
+    """
+    Fetch the score distribution of a live contest.
 
-        result = []
-        rank = 1
-        previous_score = None
-        tied_ranks = 0
-
-        for i, (user_id, user_data) in enumerate(sorted_leaderboard):
-            current_score = user_data.get('score', 0)
-
-            if previous_score is not None:
-                if current_score < previous_score:
-                    rank += tied_ranks + 1
-                    tied_ranks = 0
-                else:
-                    tied_ranks += 1
-
-            previous_score = current_score
-
-            entry = LeaderboardEntry(
-                user_id=user_id,
-                contest_id=contest_id,
-                timestamp=datetime.now(),
-                username=user_data.get('username', 'Unknown'),
-                score=current_score,
-                rank=rank
-            )
-            result.append(entry.to_dict())
+    The distribution is kept up to date in the contest's index as scores are
+    written, so reading it costs the same however many players the contest has.
+    Percentiles and histogram bounds are accurate to within SCORE_SKETCH_ACCURACY.
 
-        logger.info(f"Successfully fetched leaderboard for contest_id: {contest_id}")
-        return standardize_response(data=result, message="Leaderboard fetched successfully", success=True)
+    :param contest_id: The ID of the contest
+    :param user_id: Also return this user's rank and the share of players at or above it
+    :return: Standardized response with {count, highest, lowest, percentiles, histogram, user?}
+    """
+    try:
+        logger.info(f"Fetching leaderboard stats for contest_id: {contest_id}")
+        contest_data = get_contest_data(contest_id)
+        if contest_data and not is_contest_readable(contest_data):
+            logger.warning(f"Contest {contest_id} is no longer active")
+            return standardize_response(data=None, message=f"Contest {contest_id} is no longer active", success=False)
+
+        index = get_leaderboard_index(contest_id)
+        with index.lock:
+            count = len(index)
+            if not count:
+                logger.warning(f"No leaderboard data found for contest {contest_id}")
+                return standardize_response(data=None, message=f"No leaderboard data found for contest {contest_id}", success=False)
+
+            stats = {
+                "count": count,
+                "highest": index.entries(0, 1)[0][3],
+                "lowest": index.entries(count - 1, 1)[0][3],
+                "percentiles": {f"p{p}": index.sketch.quantile(p / 100) for p in STATS_PERCENTILES},
+                "histogram": index.sketch.histogram()
+            }
+            if user_id is not None:
+                rank = index.rank(user_id)
+                if rank is None:
+                    logger.warning(f"User {user_id} not found in leaderboard for contest {contest_id}")
+                    return standardize_response(data=None, message=f"User {user_id} not found in leaderboard", success=False)
+                stats["user"] = {
+                    "user_id": user_id,
+                    "score": index.get(user_id)[0],
+                    "rank": rank,
+                    "top_percent": round(100 * rank / count, 2)
+                }
+
+        logger.info(f"Successfully fetched leaderboard stats for contest_id: {contest_id}")
+        return standardize_response(data=stats, message="Leaderboard stats fetched successfully", success=True)
 
     except Exception as e:
-        logger.exception(f"Failed to fetch leaderboard for contest_id: {contest_id}")
-        return standardize_response(data={"details": str(e)}, message="Failed to fetch leaderboard", success=False)
+        logger.exception(f"Failed to fetch leaderboard stats for contest_id: {contest_id}")
+        return standardize_response(data={"details": str(e)}, message="Failed to fetch leaderboard stats", success=False)
 
 def update_leaderboard_entry(contest_id, user_id, username, score):
     """
@@ -130,13 +433,22 @@ def update_leaderboard_entry(contest_id, user_id, username, score):
         if not contest:
             logger.warning(f"Contest {contest_id} does not exist.")
             return standardize_response(data=None, message=f"Contest {contest_id} does not exist.", success=False)
-
-        leaderboard_ref.child(contest_id).child(user_id).set({
-            'username': username,
-            'score': score
-        })
-
-        get_leaderboard_data.cache_clear()
+        if not is_contest_active(contest) or not is_contest_open_for_scores(contest_id, contest):
+            logger.warning(f"Contest {contest_id} is no longer active.")
+            return standardize_response(data=None, message=f"Contest {contest_id} is no longer active.", success=False)
+
+        if is_buffered():
+            # Coalesced with other updates and written behind; the index serves reads meanwhile
+            leaderboard_indexes.apply_updates(
+                contest_id,
+                score_buffer.add(contest_id, [(user_id, username, score)], get_shard_count(contest),
+                                 stored=lambda stored_user_id: get_leaderboard_index(contest_id).get(stored_user_id))
+            )
+        else:
+            write_scores(contest_id, get_shard_count(contest), [(user_id, username, score)])
+            leaderboard_cache.invalidate(contest_id)
+            leaderboard_indexes.apply_update(contest_id, user_id, username, score)
+        publish_score_changes(contest_id, [user_id])
         logger.info(f"Successfully updated leaderboard entry for user_id: {user_id} in contest_id: {contest_id}")
         return standardize_response(data=None, message="Leaderboard entry updated successfully", success=True)
 
@@ -144,23 +456,326 @@ def update_leaderboard_entry(contest_id, user_id, username, score):
         logger.exception(f"Failed to update leaderboard entry for user_id: {user_id} in contest_id: {contest_id}")
         return standardize_response(data={"details": str(e)}, message="Failed to update leaderboard entry", success=False)
 
+def publish_score_changes(contest_id, user_ids):
+    """
+    Push the new score and rank of the given users to the contest's stream subscribers.
+
+    :param contest_id: The ID of the contest
+    :param user_ids: IDs of the users whose score changed
+    """
+    if not leaderboard_hub.has_subscribers(contest_id):
+        return
+    index = get_leaderboard_index(contest_id)
+    changes = []
+    with index.lock:
+        for user_id in user_ids:
+            entry = index.get(user_id)
+            if entry is not None:
+                score, username = entry
+                changes.append({"user_id": user_id, "username": username, "score": score, "rank": index.rank(user_id)})
+    if changes:
+        leaderboard_hub.publish(contest_id, 'scores', {"contest_id": contest_id, "total": len(index), "changes": changes})
+
+def stream_leaderboard(contest_id):
+    """
+    Subscribe to a contest's live leaderboard changes.
+
+    :param contest_id: The ID of the contest
+    :return: Standardized response whose data holds a generator of Server-Sent Events:
+             a snapshot of the top entries, then a 'scores' event per change
+    """
+    contest = get_contest_data(contest_id)
+    if not contest:
+        return standardize_response(data=None, message=f"Contest {contest_id} does not exist.", success=False)
+    if not is_contest_active(contest):
+        return standardize_response(data=None, message=f"Contest {contest_id} is no longer active", success=False)
+
+    subscription = leaderboard_hub.subscribe(contest_id)
+    logger.info(f"New leaderboard stream for contest_id: {contest_id} ({leaderboard_hub.subscriber_count(contest_id)} subscribers)")
+
+    def snapshot():
+        response = fetch_leaderboard(contest_id, top=SSE_SNAPSHOT_SIZE)
+        data = response["data"] if response["success"] else {"total": 0, "top": []}
+        return dict(data, contest_id=contest_id)
+
+    return standardize_response(
+        data={"events": leaderboard_hub.stream(subscription, snapshot)},
+        message="Leaderboard stream opened",
+        success=True
+    )
+
+def validate_score_item(item):
+    """
+    :return: Error message, or None if the score item is valid
+    """
+    if not isinstance(item, dict):
+        return "Item must be an object."
+    for field in ('contest_id', 'user_id'):
+        value = item.get(field)
+        if not value or not isinstance(value, str) or '/' in value or INVALID_KEY_CHARS.search(value):
+            return f"Invalid {field}."
+    if item.get('username') is None:
+        return "Username is required."
+    score = item.get('score')
+    if isinstance(score, bool) or not isinstance(score, (int, float)):
+        return "Score must be a number."
+    return None
+
+def update_leaderboard_entries(scores):
+    """
+    Update or add many leaderboard entries at once.
+
+    Each contest is validated once, its scores are written with multi-path updates
+    of up to SCORE_WRITE_GROUP_SIZE entries, and its ranked index and cache are
+    updated once. When a batch holds several scores for the same user and contest,
+    the last one wins.
+
+    :param scores: List of {'contest_id', 'user_id', 'username', 'score'} dicts
+    :return: Standardized response with a result per item
+    """
+    if not isinstance(scores, list) or not scores:
+        return standardize_response(data=None, message="A non-empty list of scores is required.", success=False)
+    if len(scores) > MAX_SCORE_BATCH:
+        return standardize_response(data=None, message=f"A batch can contain at most {MAX_SCORE_BATCH} scores.", success=False)
+
+    results = [None] * len(scores)
+    by_contest = {}
+    for position, item in enumerate(scores):
+        error = validate_score_item(item)
+        if error:
+            results[position] = {"success": False, "error": error}
+            continue
+        # Keyed by user so later scores replace earlier ones for the same user
+        by_contest.setdefault(item['contest_id'], {})[item['user_id']] = (position, item)
+
+    for contest_id, entries in by_contest.items():
+        try:
+            contest = get_contest_data(contest_id)
+            if not contest:
+                error = f"Contest {contest_id} does not exist."
+            elif not is_contest_active(contest) or not is_contest_open_for_scores(contest_id, contest):
+                error = f"Contest {contest_id} is no longer active."
+            else:
+                error = None
+
+            if error is None and is_buffered():
+                leaderboard_indexes.apply_updates(contest_id, score_buffer.add(
+                    contest_id,
+                    [(user_id, item['username'], item['score']) for user_id, (_, item) in entries.items()],
+                    get_shard_count(contest),
+                    stored=lambda stored_user_id: get_leaderboard_index(contest_id).get(stored_user_id)
+                ))
+            elif error is None:
+                rows = list(entries.items())
+                for offset in range(0, len(rows), SCORE_WRITE_GROUP_SIZE):
+                    write_scores(contest_id, get_shard_count(contest), [
+                        (user_id, item['username'], item['score'])
+                        for user_id, (_, item) in rows[offset:offset + SCORE_WRITE_GROUP_SIZE]
+                    ])
+                leaderboard_cache.invalidate(contest_id)
+                leaderboard_indexes.apply_updates(
+                    contest_id,
+                    [(user_id, item['username'], item['score']) for user_id, (_, item) in rows]
+                )
+            if error is None:
+                publish_score_changes(contest_id, list(entries))
+        except Exception as e:
+            logger.exception(f"Failed to write scores for contest_id: {contest_id}")
+            error = str(e)
+
+        for user_id, (position, item) in entries.items():
+            results[position] = {"success": True} if error is None else {"success": False, "error": error}
+
+    # Scores replaced by a later one in the same batch were not written on their own
+    for position, item in enumerate(scores):
+        if results[position] is None:
+            results[position] = {"success": True, "superseded": True}
+
+    failed = sum(1 for result in results if not result['success'])
+    logger.info(f"Score batch processed: {len(scores) - failed} succeeded, {failed} failed.")
+    return standardize_response(
+        data={"results": results, "succeeded": len(scores) - failed, "failed": failed},
+        message="Scores updated successfully" if not failed else "Scores updated with failures",
+        success=not failed
+    )
+
+def get_contest_history_ref():
+    return reference('contest_history')
+
+def get_settlements_ref():
+    return reference('settlements')
+
+class _SettlementClaimed(Exception):
+    """Aborts a settlement claim while another run holds an unexpired lease."""
+
+def claim_settlement(contest_id, payouts, owner):
+    """
+    Claim the settlement of a contest for one run.
+
+    The first claim records the payouts, each marked not done. A later run takes
+    the settlement over only once the lease of the run holding it has expired.
+
+    :param contest_id: The ID of the contest
+    :param payouts: (user_id, amount) pairs, used when the settlement is new
+    :param owner: ID of the claiming run
+    :return: The claimed settlement record, or None while another run holds it
+    """
+    def claim(current):
+        now = time.time()
+        if current is None:
+            current = {
+                "status": "paying",
+                "started_at": datetime.utcnow().isoformat(),
+                "payouts": {user_id: {"amount": amount, "done": False} for user_id, amount in payouts}
+            }
+        elif current.get('status') == 'completed':
+            return current
+        elif (current.get('lease') or {}).get('expires_at', 0) > now:
+            raise _SettlementClaimed()
+        current['lease'] = {"owner": owner, "expires_at": now + SETTLEMENT_LEASE_SECONDS}
+        return current
+
+    try:
+        return get_settlements_ref().child(contest_id).transaction(claim)
+    except _SettlementClaimed:
+        return None
+
+def renew_settlement_lease(contest_id, owner):
+    """
+    Extend the lease of a settlement run.
+
+    :return: True if the run still holds the lease, False if another run took it over
+    """
+    def renew(lease):
+        if not lease or lease.get('owner') != owner:
+            raise _SettlementClaimed()
+        return {"owner": owner, "expires_at": time.time() + SETTLEMENT_LEASE_SECONDS}
+
+    try:
+        get_settlements_ref().child(contest_id).child('lease').transaction(renew)
+        return True
+    except _SettlementClaimed:
+        return False
+
+def release_settlement_lease(contest_id, owner):
+    """Give up the lease of a settlement run so a retry can resume it at once."""
+    def release(lease):
+        if lease and lease.get('owner') != owner:
+            return lease
+        return None
+
+    get_settlements_ref().child(contest_id).child('lease').transaction(release)
+
+def pay_settlement(contest_id, settlement, owner):
+    """
+    Credit every payout of a settlement that is not yet marked done.
+
+    Payouts go out in batches of SETTLEMENT_BATCH_SIZE through a pool of
+    SETTLEMENT_MAX_WORKERS workers, and each paid batch is marked done in the
+    settlement. The lease is renewed before every batch, and a run that lost it
+    pays nothing more. Winnings carry an idempotency key per contest, so a credit
+    an interrupted run applied without marking it done is not paid twice.
+
+    :param contest_id: The ID of the contest
+    :param settlement: The claimed settlement record
+    :param owner: ID of the run holding the lease
+    :return: Number of payouts that failed
+    """
+    payouts = settlement.get('payouts') or {}
+    unpaid = [(user_id, payout['amount']) for user_id, payout in payouts.items() if not payout.get('done')]
+    payouts_ref = get_settlements_ref().child(contest_id).child('payouts')
+
+    def pay(batch):
+        if not renew_settlement_lease(contest_id, owner):
+            logger.error(f"Lost the settlement lease of contest {contest_id}; {len(batch)} payouts left to its holder")
+            return len(batch)
+        response = apply_batch_service([
+            {"user_id": user_id, "amount": amount, "reason": "contest_winnings", "contest_id": contest_id,
+             "idempotency_key": f"contest_winnings:{contest_id}"}
+            for user_id, amount in batch
+        ])
+        if isinstance(response, tuple):
+            logger.error(f"Failed to credit winnings for contest {contest_id}: {response[0]['message']}")
+            return len(batch)
+        paid_now = [result for result in response["data"]["results"] if result["success"]]
+        if paid_now:
+            done = {}
+            for result in paid_now:
+                done[f"{result['user_id']}/done"] = True
+                done[f"{result['user_id']}/transaction_id"] = result["transaction_id"]
+            payouts_ref.update(done)
+        return len(batch) - len(paid_now)
+
+    batches = [unpaid[offset:offset + SETTLEMENT_BATCH_SIZE] for offset in range(0, len(unpaid), SETTLEMENT_BATCH_SIZE)]
+    if not batches:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(SETTLEMENT_MAX_WORKERS, len(batches))) as executor:
+        return sum(executor.map(pay, batches))
+
+def write_settlement_history(contest_id, settlement, rows, completed_at, owner):
+    """
+    Write every player's result of a settled contest to their contest history.
+
+    Entries go out in multi-path updates of HISTORY_WRITE_BATCH_SIZE, each also
+    recording in the settlement how many rows are written, so a resumed run
+    continues after the last written batch. Entries are keyed by contest, so a
+    batch written again after an interruption rewrites the same entries.
+
+    :param contest_id: The ID of the contest
+    :param settlement: The claimed settlement record
+    :param rows: (rank, user_id, username, score) tuples in rank order
+    :param completed_at: ISO timestamp of the completion
+    :param owner: ID of the run holding the lease
+    :return: True once every entry is written, False if another run took the settlement over
+    """
+    payouts = settlement.get('payouts') or {}
+    for offset in range(settlement.get('history_written') or 0, len(rows), HISTORY_WRITE_BATCH_SIZE):
+        if not renew_settlement_lease(contest_id, owner):
+            logger.error(f"Lost the settlement lease of contest {contest_id} while writing contest history")
+            return False
+        chunk = rows[offset:offset + HISTORY_WRITE_BATCH_SIZE]
+        updates = {
+            f"contest_history/{user_id}/{contest_id}": {
+                "contest_id": contest_id,
+                "timestamp": completed_at,
+                "rank": rank,
+                "score": score,
+                "winnings": (payouts.get(user_id) or {}).get('amount', 0),
+                "participants": len(rows)
+            }
+            for rank, user_id, username, score in chunk
+        }
+        updates[f"settlements/{contest_id}/history_written"] = offset + len(chunk)
+        updates[f"settlements/{contest_id}/completed_at"] = completed_at
+        reference('/').update(updates)
+    return True
+
 def complete_contest(contest_id):
     """
     Mark a contest as completed, distribute winnings among rank 1 holders equally, 
     update contest status, and archive its leaderboard data.
 
+    Settlement is resumable: the first run stops score submissions and records the
+    payouts in 'settlements/<contest_id>'; the run holding the settlement's lease
+    then pays the winners not yet paid and writes every player's contest history in
+    batches, and the archive, the status change and the leaderboard removal are
+    written together in one multi-path update once that is done. A failed
+    settlement is finished by calling this again, and one whose run was
+    interrupted once its lease has expired.
+
     :param contest_id: The ID of the contest
     :return: Standardized response with success or error details
     """
+    owner = None
     try:
         logger.info(f"Completing contest_id: {contest_id}")
-        leaderboard_data = get_leaderboard_data(contest_id)
-        contest_data = get_contest_data(contest_id)
-
-        if not leaderboard_data:
-            logger.warning(f"No leaderboard data found for contest {contest_id}")
-            return standardize_response(data=None, message=f"No leaderboard data found for contest {contest_id}", success=False)
+        settlement = get_settlements_ref().child(contest_id).get()
+        if settlement and settlement.get('status') == 'completed':
+            logger.info(f"Contest {contest_id} is already settled")
+            return standardize_response(data=None, message=f"Contest {contest_id} completed successfully", success=True)
 
+        invalidate_contest(contest_id)
+        contest_data = get_contest_data(contest_id)
         if not contest_data:
             logger.warning(f"Contest data not found for contest {contest_id}")
             return standardize_response(data=None, message=f"Contest data not found for contest {contest_id}", success=False)
@@ -170,58 +785,78 @@ def complete_contest(contest_id):
             logger.error(f"Invalid prize pool for contest {contest_id}")
             return standardize_response(data=None, message=f"Invalid prize pool for contest {contest_id}", success=False)
 
-        sorted_leaderboard = sorted(
-            leaderboard_data.items(),
-            key=lambda x: x[1].get("score", 0),
-            reverse=True
-        )
+        # Scores stop being accepted before the final standings are read. The
+        # status is switched with a transaction, so a cancellation starting
+        # concurrently either wins or sees the contest settling
+        previous_status = contest_data.get('status')
+        if previous_status != SETTLING_STATUS:
+            def start_settling(status):
+                return status if status in (CANCELING_STATUS, 'canceled') else SETTLING_STATUS
+
+            status = get_contests_ref().child(contest_id).child('status').transaction(start_settling)
+            invalidate_contest(contest_id)
+            if status != SETTLING_STATUS:
+                logger.warning(f"Contest {contest_id} is {status} and cannot be completed")
+                return standardize_response(data=None, message=f"Contest {contest_id} is {status} and cannot be completed", success=False)
+
+        # Settle on fresh data: write the scores accepted so far, then bypass every cache
+        try:
+            score_buffer.flush(contest_id)
+        except Exception as e:
+            logger.error(f"Buffered scores of contest {contest_id} could not be written; settlement not started")
+            return standardize_response(
+                data={"details": str(e)},
+                message=f"Failed to write buffered scores for contest {contest_id}",
+                success=False
+            )
+        invalidate_contest(contest_id)
+        leaderboard_data = get_leaderboard_data(contest_id)
+
+        if not leaderboard_data:
+            logger.warning(f"No leaderboard data found for contest {contest_id}")
+            if previous_status != SETTLING_STATUS and previous_status is not None:
+                get_contests_ref().child(contest_id).update({"status": previous_status})
+                invalidate_contest(contest_id)
+            return standardize_response(data=None, message=f"No leaderboard data found for contest {contest_id}", success=False)
 
-        result = []
-        rank = 1
-        previous_score = None
-        tied_ranks = 0
-        rank_1_holders = []
-
-        for user_id, user_data in sorted_leaderboard:
-            current_score = user_data.get('score', 0)
-
-            if previous_score is not None:
-                if current_score < previous_score:
-                    rank += tied_ranks + 1
-                    tied_ranks = 0
-                else:
-                    tied_ranks += 1
-
-            previous_score = current_score
-
-            if rank == 1:
-                rank_1_holders.append(user_id)
-
-            entry = LeaderboardEntry(
-                user_id=user_id,
-                contest_id=contest_id,
-                timestamp=datetime.now(),
-                username=user_data.get("username", "Unknown"),
-                score=current_score,
-                rank=rank
+        ranked = rank_leaderboard(leaderboard_data)
+        settlement = claim_settlement(contest_id, split_prize(ranked, prize_pool), uuid.uuid4().hex)
+        if settlement is None:
+            logger.warning(f"Settlement of contest {contest_id} is held by another run")
+            return standardize_response(data=None, message=f"Settlement of contest {contest_id} is already in progress", success=False)
+        if settlement.get('status') == 'completed':
+            logger.info(f"Contest {contest_id} is already settled")
+            return standardize_response(data=None, message=f"Contest {contest_id} completed successfully", success=True)
+        owner = settlement['lease']['owner']
+
+        failed = pay_settlement(contest_id, settlement, owner)
+        if failed:
+            logger.error(f"Failed to credit winnings to {failed} users for contest {contest_id}; settlement can be retried")
+            return standardize_response(
+                data={"failed_payouts": failed},
+                message=f"Failed to credit some winnings for contest {contest_id}",
+                success=False
             )
-            entry_dict = entry.to_dict()
-            entry_dict['timestamp'] = entry_dict['timestamp'].isoformat()
-            result.append(entry_dict)
-
-        if rank_1_holders:
-            prize_per_user = prize_pool / len(rank_1_holders)
-            for user_id in rank_1_holders:
-                credit_winnings_service(user_id, contest_id, prize_per_user)
-
-        completed_data = {
-            "leaderboard": result,
-            "completed_at": datetime.now().isoformat()
-        }
 
-        completed_contests_ref.child(contest_id).set(completed_data)
-        contests_ref.child(contest_id).update({"status": "completed"})
-        leaderboard_ref.child(contest_id).delete()
+        rows = ranked.rows()
+        completed_at = settlement.get('completed_at') or datetime.now().isoformat()
+        if not write_settlement_history(contest_id, settlement, rows, completed_at, owner):
+            return standardize_response(data=None, message=f"Settlement of contest {contest_id} is already in progress", success=False)
+
+        updates = build_archive(contest_id, rows, completed_at)
+        updates.update({
+            f"contests/{contest_id}/status": "completed",
+            scores_path(contest_id, get_shard_count(contest_data)): None,
+            f"settlements/{contest_id}/status": "completed",
+            f"settlements/{contest_id}/completed_at": completed_at,
+            f"settlements/{contest_id}/lease": None
+        })
+        reference('/').update(updates)
+        invalidate_contest(contest_id)
+        leaderboard_hub.close_contest(contest_id, 'completed', {
+            "contest_id": contest_id,
+            "leaderboard": build_leaderboard_entries(contest_id, rows[:SSE_SNAPSHOT_SIZE])
+        })
 
         logger.info(f"Successfully completed contest_id: {contest_id}")
         return standardize_response(data=None, message=f"Contest {contest_id} completed successfully", success=True)
@@ -230,23 +865,141 @@ def complete_contest(contest_id):
         logger.exception(f"Failed to complete contest_id: {contest_id}")
         return standardize_response(data={"details": str(e)}, message="Failed to complete contest", success=False)
 
-def fetch_historical_leaderboard(contest_id):
+    finally:
+        # A run that stopped early lets a retry resume at once instead of waiting out the lease
+        if owner:
+            release_settlement_lease(contest_id, owner)
+
+def fetch_historical_leaderboard(contest_id, offset=None, limit=None, rank_from=None, rank_to=None):
     """
-    Fetch the historical leaderboard data for a completed contest.
+    Fetch the historical leaderboard of a completed contest, or a slice of it.
+
+    Without paging parameters the whole leaderboard is returned in the original
+    {leaderboard, completed_at} shape. With them, only the archive pages holding
+    the requested rows are read.
 
     :param contest_id: The ID of the completed contest
-    :return: Standardized response with historical leaderboard data or error details
+    :param offset: Zero-based position of the first row
+    :param limit: Maximum number of rows (default DEFAULT_HISTORY_LIMIT)
+    :param rank_from: Return rows ranked at or below this rank instead of from an offset
+    :param rank_to: Together with rank_from, the last rank to return (inclusive)
+    :return: Standardized response with {leaderboard, completed_at}, or with paging
+             parameters {contest_id, completed_at, total, entries}, or error details
     """
     try:
         logger.info(f"Fetching historical leaderboard for contest_id: {contest_id}")
-        data = completed_contests_ref.child(contest_id).get()
-        if not data:
+        if offset is None and limit is None and rank_from is None and rank_to is None:
+            return fetch_full_historical_leaderboard(contest_id)
+        offset = offset or 0
+        limit = DEFAULT_HISTORY_LIMIT if limit is None else limit
+        if rank_to is not None and rank_from is None:
+            rank_from = 1
+        if not 0 < limit <= MAX_HISTORY_LIMIT:
+            return standardize_response(data=None, message=f"limit must be between 1 and {MAX_HISTORY_LIMIT}", success=False)
+        if offset < 0:
+            return standardize_response(data=None, message="offset must not be negative", success=False)
+        if rank_from is not None and (rank_from < 1 or (rank_to is not None and rank_to < rank_from)):
+            return standardize_response(data=None, message="Invalid rank range", success=False)
+
+        metadata = get_completed_contests_ref().child(contest_id).get()
+        if not metadata:
             logger.warning(f"No historical data found for contest {contest_id}")
             return standardize_response(data=None, message=f"No historical data found for contest {contest_id}", success=False)
 
+        rank_to = rank_to if rank_to is not None else float('inf')
+        if metadata.get("format") == ARCHIVE_FORMAT:
+            total = metadata["total"]
+            if rank_from is not None:
+                entries = read_rank_range(contest_id, metadata, rank_from, rank_to, limit)
+            else:
+                entries = read_rows(contest_id, metadata, offset, limit)
+        else:
+            # Archived before the paged format: one list of full entries
+            leaderboard = metadata.get("leaderboard") or []
+            total = len(leaderboard)
+            if rank_from is not None:
+                entries = [entry for entry in leaderboard if rank_from <= entry.get("rank", 0) <= rank_to][:limit]
+            else:
+                entries = leaderboard[offset:offset + limit]
+
         logger.info(f"Successfully fetched historical leaderboard for contest_id: {contest_id}")
-        return standardize_response(data=data, message="Historical leaderboard fetched successfully", success=True)
+        return standardize_response(
+            data={
+                "contest_id": contest_id,
+                "completed_at": metadata.get("completed_at"),
+                "total": total,
+                "entries": entries
+            },
+            message="Historical leaderboard fetched successfully",
+            success=True
+        )
 
     except Exception as e:
         logger.exception(f"Failed to fetch historical leaderboard for contest_id: {contest_id}")
         return standardize_response(data={"details": str(e)}, message="Failed to fetch historical leaderboard", success=False)
+
+def fetch_full_historical_leaderboard(contest_id):
+    """
+    Fetch the whole historical leaderboard of a completed contest as
+    {leaderboard, completed_at}, with every entry carrying its contest ID and
+    the completion time, as contests archived before the paged format stored it.
+    """
+    metadata = get_completed_contests_ref().child(contest_id).get()
+    if not metadata:
+        logger.warning(f"No historical data found for contest {contest_id}")
+        return standardize_response(data=None, message=f"No historical data found for contest {contest_id}", success=False)
+
+    if metadata.get("format") == ARCHIVE_FORMAT:
+        completed_at = metadata.get("completed_at")
+        leaderboard = [
+            {
+                "user_id": row["user_id"],
+                "contest_id": contest_id,
+                "timestamp": completed_at,
+                "username": row["username"],
+                "score": row["score"],
+                "rank": row["rank"]
+            }
+            for row in read_rows(contest_id, metadata, 0, metadata["total"])
+        ]
+        metadata = {"leaderboard": leaderboard, "completed_at": completed_at}
+
+    logger.info(f"Successfully fetched historical leaderboard for contest_id: {contest_id}")
+    return standardize_response(data=metadata, message="Historical leaderboard fetched successfully", success=True)
+
+def fetch_user_contest_history(user_id, limit=DEFAULT_USER_HISTORY_LIMIT, cursor=None):
+    """
+    Fetch a page of a user's completed contests, most recent first.
+
+    Reads the user's 'contest_history' index with one ordered, limited query.
+
+    :param user_id: The ID of the user
+    :param limit: Maximum number of contests
+    :param cursor: next_cursor of the previous page
+    :return: Standardized response with {entries, next_cursor} or error details
+    """
+    try:
+        logger.info(f"Fetching contest history for user_id: {user_id}")
+        if not user_id or '/' in user_id or INVALID_KEY_CHARS.search(user_id):
+            return standardize_response(data=None, message="Invalid user ID", success=False)
+        if not 0 < limit <= MAX_USER_HISTORY_LIMIT:
+            return standardize_response(data=None, message=f"limit must be between 1 and {MAX_USER_HISTORY_LIMIT}", success=False)
+        try:
+            before = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return standardize_response(data={"details": str(e)}, message="Invalid cursor", success=False)
+
+        page, has_more = query_transactions_page(get_contest_history_ref().child(user_id), limit, before=before)
+        entries = [entry for _, entry in page]
+        next_cursor = encode_cursor(page[-1][1].get('timestamp', ''), page[-1][0]) if page and has_more else None
+
+        logger.info(f"Successfully fetched contest history for user_id: {user_id}")
+        return standardize_response(
+            data={"entries": entries, "next_cursor": next_cursor},
+            message="Contest history fetched successfully",
+            success=True
+        )
+
+    except Exception as e:
+        logger.exception(f"Failed to fetch contest history for user_id: {user_id}")
+        return standardize_response(data={"details": str(e)}, message="Failed to fetch contest history", success=False)
@@ -0,0 +1,176 @@
+import heapq
+import itertools
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from storage.backend import reference
+
+# Number of shards new contests spread their leaderboard over; 1 keeps the
+# single 'leaderboards/<contest_id>' node
+DEFAULT_LEADERBOARD_SHARDS = int(os.environ.get('DAMNPLAY_LEADERBOARD_SHARDS', '1'))
+MAX_LEADERBOARD_SHARDS = 64
+
+# Shards read in parallel
+MAX_SHARD_READERS = 16
+
+# Rows at or above a score read from each shard to rank it; deeper ranks are
+# answered from the contest's ranked index instead
+MAX_SHARD_RANK_SCAN = 1000
+
+# Participants checked for a missing score before the query falls back to the index
+MAX_UNSCORED_SCAN = 1000
+
+
+def get_shard_count(contest_data):
+    """Number of leaderboard shards a contest was created with."""
+    return int((contest_data or {}).get('leaderboard_shards') or 1)
+
+
+def shard_of(user_id, shard_count):
+    """Shard holding a user's score; stable across processes."""
+    return zlib.crc32(str(user_id).encode('utf-8')) % shard_count
+
+
+def scores_path(contest_id, shard_count):
+    """Database path holding all of a contest's scores."""
+    return f'leaderboard_shards/{contest_id}' if shard_count > 1 else f'leaderboards/{contest_id}'
+
+
+def score_path(contest_id, user_id, shard_count):
+    """Database path of one user's score."""
+    if shard_count > 1:
+        return f'leaderboard_shards/{contest_id}/{shard_of(user_id, shard_count)}/{user_id}'
+    return f'leaderboards/{contest_id}/{user_id}'
+
+
+def _shard_ref(contest_id, shard):
+    return reference('leaderboard_shards').child(contest_id).child(str(shard))
+
+
+def _read_shards(shard_count, read):
+    with ThreadPoolExecutor(max_workers=min(shard_count, MAX_SHARD_READERS)) as executor:
+        return list(executor.map(read, range(shard_count)))
+
+
+def write_scores(contest_id, shard_count, rows):
+    """
+    Write scores in one multi-path update, each to its user's shard.
+
+    :param rows: Iterable of (user_id, username, score)
+    """
+    updates = {
+        score_path(contest_id, user_id, shard_count): {'username': username, 'score': score}
+        for user_id, username, score in rows
+    }
+    if updates:
+        reference('/').update(updates)
+
+
+def read_scores(contest_id, shard_count):
+    """
+    Read every score of a contest, reading the shards in parallel.
+
+    :return: {user_id: {'username', 'score'}} or None if the contest has no scores
+    """
+    if shard_count <= 1:
+        return reference('leaderboards').child(contest_id).get()
+    merged = {}
+    for shard_scores in _read_shards(shard_count, lambda shard: _shard_ref(contest_id, shard).get()):
+        merged.update(shard_scores or {})
+    return merged or None
+
+
+def read_score(contest_id, user_id, shard_count):
+    """A user's {'username', 'score'}, or None if they have no score."""
+    return reference(score_path(contest_id, user_id, shard_count)).get()
+
+
+def unscored_users(contest_id, shard_count, user_ids, count=None, limit=None):
+    """
+    The given users without a score, in user ID order.
+
+    Score paths are checked in parallel, MAX_SHARD_READERS at a time, stopping
+    once `count` users without a score are found.
+
+    :param count: Return at most this many users
+    :param limit: Users checked at most, MAX_UNSCORED_SCAN by default
+    :return: List of user IDs, or None if more than `limit` users would have to be checked
+    """
+    limit = MAX_UNSCORED_SCAN if limit is None else limit
+    user_ids = sorted(user_ids)
+    missing = []
+    with ThreadPoolExecutor(max_workers=MAX_SHARD_READERS) as executor:
+        for start in range(0, len(user_ids), MAX_SHARD_READERS):
+            if count is not None and len(missing) >= count:
+                return missing[:count]
+            if start >= limit:
+                return None
+            chunk = user_ids[start:start + MAX_SHARD_READERS]
+            scored = executor.map(
+                lambda user_id: reference(score_path(contest_id, user_id, shard_count)).get(shallow=True) is not None,
+                chunk
+            )
+            missing.extend(user_id for user_id, is_scored in zip(chunk, scored) if not is_scored)
+    return missing if count is None else missing[:count]
+
+
+def rank_key(user_id, score):
+    """Leaderboard order: score descending, then user ID."""
+    return (-(score or 0), user_id)
+
+
+def _shard_top(contest_id, shard, count):
+    """
+    The best `count` rows of one shard in leaderboard order.
+
+    The score index returns the highest scores, but breaks ties at the cut-off by
+    key in the opposite direction, so rows tied with the lowest score returned
+    are read as well before cutting.
+    """
+    rows = _shard_ref(contest_id, shard).order_by_child('score').limit_to_last(count).get() or {}
+    if len(rows) >= count and rows:
+        lowest = min(user_data.get('score', 0) for user_data in rows.values())
+        rows = dict(rows)
+        rows.update(_shard_ref(contest_id, shard).order_by_child('score').equal_to(lowest).get() or {})
+    ordered = sorted(
+        (rank_key(user_id, user_data.get('score', 0)), user_data.get('username', 'Unknown'))
+        for user_id, user_data in rows.items()
+    )
+    return ordered[:count]
+
+
+def top_scores(contest_id, shard_count, count):
+    """
+    The best `count` rows across all shards.
+
+    Each shard returns its own best rows, in order, from its score index; the
+    sorted shard lists are then combined with a k-way merge.
+
+    :return: List of (user_id, username, score) in leaderboard order
+    """
+    shard_tops = _read_shards(shard_count, lambda shard: _shard_top(contest_id, shard, count))
+    return [
+        (user_id, username, -negative_score)
+        for (negative_score, user_id), username in itertools.islice(heapq.merge(*shard_tops), count)
+    ]
+
+
+def count_higher(contest_id, shard_count, score, limit=None):
+    """
+    Number of users with a higher score, summed over the shards.
+
+    Each shard returns at most `limit` + 1 of its rows at or above the score, so
+    the cost is bounded however low the score ranks.
+
+    :param limit: Rows read per shard, MAX_SHARD_RANK_SCAN by default
+    :return: The count, or None if a shard has more than `limit` rows at or above the score
+    """
+    limit = MAX_SHARD_RANK_SCAN if limit is None else limit
+
+    def count(shard):
+        rows = _shard_ref(contest_id, shard).order_by_child('score').start_at(score).limit_to_first(limit + 1).get() or {}
+        if len(rows) > limit:
+            return None
+        return sum(1 for user_data in rows.values() if (user_data.get('score', 0) or 0) > score)
+    counts = _read_shards(shard_count, count)
+    return None if None in counts else sum(counts)
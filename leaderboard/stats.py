@@ -0,0 +1,111 @@
+import math
+from collections import Counter
+
+# Relative accuracy of score percentiles and histogram bucket bounds
+SCORE_SKETCH_ACCURACY = 0.01
+
+# Percentiles reported by the stats endpoint
+STATS_PERCENTILES = (50, 75, 90, 95, 99)
+
+# Upper bound on the number of histogram buckets returned
+MAX_HISTOGRAM_BUCKETS = 20
+
+
+class ScoreSketch:
+    """
+    Score distribution kept in logarithmic buckets, updated one score at a time.
+
+    A score falls into the bucket ``ceil(log(|score|) / log(gamma))`` on its side
+    of zero, so every bucket spans scores within a constant ratio of each other
+    and a percentile read from it is within `relative_accuracy` of the true value.
+    The number of buckets grows with the logarithm of the score range rather than
+    with the number of scores, and scores can be removed as well as added, so a
+    changed score is moved by removing the old value and adding the new one.
+
+    Args:
+        relative_accuracy (float): Bound on the relative error of percentiles.
+    """
+
+    def __init__(self, relative_accuracy=SCORE_SKETCH_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._positive = Counter()
+        self._negative = Counter()
+        self._zero = 0
+        self.count = 0
+
+    def _key(self, magnitude):
+        return math.ceil(math.log(magnitude) / self._log_gamma)
+
+    def _value(self, key):
+        # Midpoint of (gamma^(key-1), gamma^key] with the lowest relative error
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, score, count=1):
+        """Add a score, or remove it with a negative count."""
+        score = score or 0
+        if score > 0:
+            buckets, key = self._positive, self._key(score)
+        elif score < 0:
+            buckets, key = self._negative, self._key(-score)
+        else:
+            self._zero += count
+            self.count += count
+            return
+        buckets[key] += count
+        if buckets[key] <= 0:
+            del buckets[key]
+        self.count += count
+
+    def remove(self, score):
+        self.add(score, -1)
+
+    def _buckets(self):
+        """Yield (low, high, count) for every non-empty bucket, lowest scores first."""
+        for key in sorted(self._negative, reverse=True):
+            yield -self.gamma ** key, -self.gamma ** (key - 1), self._negative[key]
+        if self._zero:
+            yield 0, 0, self._zero
+        for key in sorted(self._positive):
+            yield self.gamma ** (key - 1), self.gamma ** key, self._positive[key]
+
+    def quantile(self, q):
+        """Approximate score below which a fraction q of the scores lie, or None if empty."""
+        if not self.count:
+            return None
+        target = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self._negative, reverse=True):
+            seen += self._negative[key]
+            if seen > target:
+                return -self._value(key)
+        seen += self._zero
+        if seen > target:
+            return 0
+        for key in sorted(self._positive):
+            seen += self._positive[key]
+            if seen > target:
+                return self._value(key)
+        return self._value(max(self._positive))
+
+    def histogram(self, max_buckets=MAX_HISTOGRAM_BUCKETS):
+        """
+        Score counts in at most `max_buckets` ranges, lowest scores first.
+
+        Neighbouring sketch buckets are combined in equal-sized groups when there
+        are more of them than `max_buckets`.
+
+        Returns:
+            list: {'from', 'to', 'count'} dicts.
+        """
+        buckets = list(self._buckets())
+        group = max(1, math.ceil(len(buckets) / max_buckets))
+        histogram = []
+        for start in range(0, len(buckets), group):
+            chunk = buckets[start:start + group]
+            histogram.append({
+                "from": round(chunk[0][0], 6),
+                "to": round(chunk[-1][1], 6),
+                "count": sum(count for _, _, count in chunk)
+            })
+        return histogram
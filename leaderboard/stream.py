@@ -0,0 +1,145 @@
+import json
+import queue
+import threading
+
+# Events a subscriber may fall behind by before its queue is dropped for a snapshot
+SSE_CLIENT_QUEUE_SIZE = 100
+
+# Seconds between keep-alive comments on an idle stream
+SSE_KEEPALIVE_SECONDS = 15
+
+# Number of leading entries sent in a snapshot
+SSE_SNAPSHOT_SIZE = 100
+
+
+def format_event(event, data):
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    """
+    One client's view of a contest's updates.
+
+    Events wait in a bounded queue; when the client falls behind and the queue
+    is full, the queued events are dropped and the client is sent a fresh
+    snapshot instead.
+    """
+
+    def __init__(self, contest_id, max_queue=SSE_CLIENT_QUEUE_SIZE):
+        self.contest_id = contest_id
+        self.max_queue = max_queue
+        # Two slots beyond max_queue stay free for the final event and the end-of-stream marker
+        self.queue = queue.Queue(maxsize=max_queue + 2)
+        self.needs_snapshot = True
+        self.closed = False
+        # Serializes publishers so the drain and the put below cannot interleave
+        self._lock = threading.Lock()
+
+    def offer(self, event):
+        with self._lock:
+            if self.closed:
+                return
+            if self.queue.qsize() >= self.max_queue:
+                # The snapshot supersedes everything queued so far
+                self.needs_snapshot = True
+                while True:
+                    try:
+                        self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                # The pending snapshot already covers this event
+                pass
+
+    def close(self, final=None):
+        """
+        End the stream, optionally after one final event.
+
+        The final event and the end-of-stream marker go into the reserved
+        slots together, so a full queue can never evict either of them.
+        """
+        with self._lock:
+            if self.closed:
+                return
+            if final is not None:
+                self.queue.put_nowait(final)
+            self.queue.put_nowait(None)
+            self.closed = True
+
+
+class LeaderboardHub:
+    """
+    Fan-out of leaderboard changes to every subscriber of a contest.
+
+    Publishing costs one bounded, non-blocking put per subscriber regardless of
+    how slow that subscriber is.
+    """
+
+    def __init__(self, max_queue=SSE_CLIENT_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, contest_id):
+        subscription = Subscription(contest_id, self.max_queue)
+        with self._lock:
+            self._subscriptions.setdefault(contest_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.contest_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.contest_id]
+
+    def has_subscribers(self, contest_id):
+        return contest_id in self._subscriptions
+
+    def subscriber_count(self, contest_id):
+        with self._lock:
+            return len(self._subscriptions.get(contest_id, ()))
+
+    def publish(self, contest_id, event, data):
+        """Send one event to every subscriber of the contest."""
+        with self._lock:
+            subscribers = list(self._subscriptions.get(contest_id, ()))
+        for subscription in subscribers:
+            subscription.offer((event, data))
+
+    def close_contest(self, contest_id, event, data):
+        """Send a final event to every subscriber of the contest and end their streams."""
+        with self._lock:
+            subscribers = self._subscriptions.pop(contest_id, set())
+        for subscription in subscribers:
+            subscription.close((event, data))
+
+    def stream(self, subscription, snapshot, keepalive=SSE_KEEPALIVE_SECONDS):
+        """
+        Yield the Server-Sent Events of a subscription until it is closed.
+
+        :param snapshot: Callable returning the current leaderboard snapshot
+        """
+        try:
+            while not subscription.closed or not subscription.queue.empty():
+                if subscription.needs_snapshot:
+                    subscription.needs_snapshot = False
+                    yield format_event('snapshot', snapshot())
+                try:
+                    item = subscription.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                yield format_event(*item)
+        finally:
+            self.unsubscribe(subscription)
+
+
+# Shared hub for the leaderboard services
+leaderboard_hub = LeaderboardHub()
@@ -1,6 +1,10 @@
 
-from flask import request, jsonify
+from flask import request, jsonify, make_response
 import jwt
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from logging_utils import setup_logger
 
@@ -10,6 +14,11 @@ logger = setup_logger(__name__)
 JWT_SECRET = "Raghav"
 JWT_ALGORITHM = "HS256"
 
+# Idempotency key settings
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
+IDEMPOTENCY_MAX_ENTRIES = 10000
+
 def fix_jwt_padding(token):
     """Fixes base64 padding issue for JWT tokens."""
     missing_padding = len(token) % 4
@@ -45,6 +54,159 @@ def token_required(f):
     return decorated
 
 
+class IdempotencyStore:
+    """
+    Bounded, TTL-evicting store of responses keyed by idempotency key.
+
+    Entries expire after `ttl_seconds` and the least recently stored entry is
+    evicted once `max_entries` is reached. A per-key lock makes concurrent
+    requests with the same key wait for the first one instead of repeating it.
+    """
+
+    def __init__(self, max_entries=IDEMPOTENCY_MAX_ENTRIES, ttl_seconds=IDEMPOTENCY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now):
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[key]
+
+    def get(self, key):
+        with self._lock:
+            now = time.monotonic()
+            self._evict_expired(now)
+            entry = self._entries.get(key)
+            return entry[1] if entry else None
+
+    def put(self, key, value):
+        with self._lock:
+            now = time.monotonic()
+            self._evict_expired(now)
+            self._entries.pop(key, None)
+            self._entries[key] = (now + self.ttl_seconds, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def key_lock(self, key):
+        """Return the in-flight lock for a key, creating it if needed."""
+        with self._lock:
+            entry = self._key_locks.get(key)
+            if entry is None:
+                entry = self._key_locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def release_key_lock(self, key):
+        with self._lock:
+            entry = self._key_locks.get(key)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._key_locks[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+idempotency_store = IdempotencyStore()
+
+
+def idempotency_caller(current_user=None):
+    """
+    Identify the authenticated caller an idempotency key belongs to.
+
+    The caller is the user passed in by user.models.token_required, the user set
+    by token_required in this module, or else the user ID of a validly signed
+    'access-token' or Authorization JWT. Returns None when the request has no
+    verified caller.
+    """
+    if isinstance(current_user, dict) and current_user.get('id'):
+        return f"user:{current_user['id']}"
+    user_id = (getattr(request, 'user', None) or {}).get('user_id')
+    if user_id:
+        return f"user:{user_id}"
+    for header in ('access-token', 'Authorization'):
+        token = request.headers.get(header)
+        if not token:
+            continue
+        if token.startswith("Bearer "):
+            token = token[7:]
+        try:
+            data = jwt.decode(fix_jwt_padding(token), JWT_SECRET, algorithms=[JWT_ALGORITHM],
+                              options={"verify_exp": False})
+        except jwt.InvalidTokenError:
+            continue
+        if isinstance(data, dict) and data.get('user_id'):
+            return f"user:{data['user_id']}"
+    return None
+
+
+def idempotent(f):
+    """
+    Replay the stored response when a request repeats an Idempotency-Key.
+
+    The first response for a key (unless it is a server error) is kept for
+    IDEMPOTENCY_TTL_SECONDS and returned for every retry with the same key and
+    payload, without running the endpoint again. Reusing a key with a different
+    payload is rejected with 422. Requests without the header run normally.
+    Keys are scoped to the authenticated caller, so two callers sending the same
+    key never share a response; a key sent without a verified caller is
+    rejected with 400.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not idempotency_key:
+            return f(*args, **kwargs)
+
+        caller = idempotency_caller(args[0] if args else None)
+        if caller is None:
+            logger.warning("Idempotency key sent without an authenticated caller.")
+            return jsonify({
+                "success": False,
+                "message": "Idempotency-Key requires an authenticated caller."
+            }), 400
+        scope_key = f"{caller}:{request.method}:{request.path}:{idempotency_key}"
+        fingerprint = hashlib.sha256(caller.encode('utf-8') + b"\0" + request.get_data()).hexdigest()
+
+        key_lock = idempotency_store.key_lock(scope_key)
+        try:
+            with key_lock:
+                cached = idempotency_store.get(scope_key)
+                if cached is not None:
+                    if cached["fingerprint"] != fingerprint:
+                        logger.warning(f"Idempotency key reused with a different payload: {idempotency_key}")
+                        return jsonify({
+                            "success": False,
+                            "message": "Idempotency key was already used with a different request payload."
+                        }), 422
+                    logger.info(f"Replaying stored response for idempotency key: {idempotency_key}")
+                    response = make_response(cached["body"], cached["status"])
+                    response.mimetype = cached["mimetype"]
+                    response.headers["Idempotent-Replayed"] = "true"
+                    return response
+
+                response = make_response(f(*args, **kwargs))
+                if response.status_code < 500:
+                    idempotency_store.put(scope_key, {
+                        "fingerprint": fingerprint,
+                        "body": response.get_data(),
+                        "status": response.status_code,
+                        "mimetype": response.mimetype
+                    })
+                return response
+        finally:
+            idempotency_store.release_key_lock(scope_key)
+    return decorated
+
+
 # def check_admin():
 #     """
 #     Middleware to check if the user is an admin.
@@ -0,0 +1,84 @@
+import os
+import threading
+from logging_utils import setup_logger
+
+# Initialize logger
+logger = setup_logger("storage_backend")
+
+# Backend selection: 'firebase' (default), 'memory' or 'sqlite'
+STORAGE_BACKEND_ENV = 'DAMNPLAY_STORAGE_BACKEND'
+SQLITE_PATH_ENV = 'DAMNPLAY_SQLITE_PATH'
+DEFAULT_SQLITE_PATH = 'damnplay.sqlite3'
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def create_store(backend=None, **options):
+    """
+    Create a store for the given backend name.
+
+    Args:
+        backend (str, optional): 'firebase', 'memory' or 'sqlite'. Defaults to the
+            DAMNPLAY_STORAGE_BACKEND environment variable, or 'firebase'.
+        **options: Backend specific options, e.g. ``db_path`` for SQLite.
+
+    Returns:
+        A store exposing ``reference(path)``.
+
+    Raises:
+        ValueError: If the backend name is unknown.
+    """
+    backend = (backend or os.environ.get(STORAGE_BACKEND_ENV, 'firebase')).lower()
+    if backend == 'firebase':
+        from storage.firebase import FirebaseStore
+        return FirebaseStore()
+    if backend == 'memory':
+        from storage.memory import MemoryStore
+        return MemoryStore()
+    if backend == 'sqlite':
+        from storage.sqlite import SQLiteStore
+        db_path = options.get('db_path') or os.environ.get(SQLITE_PATH_ENV, DEFAULT_SQLITE_PATH)
+        return SQLiteStore(db_path)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def get_store():
+    """
+    Return the process wide store, creating it from configuration on first use.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_store()
+                logger.info(f"Storage backend initialized: {type(_store).__name__}")
+    return _store
+
+
+def set_store(store):
+    """
+    Replace the process wide store (e.g. with a MemoryStore in tests or benchmarks).
+
+    Returns:
+        The previously configured store, or None.
+    """
+    global _store
+    with _store_lock:
+        previous, _store = _store, store
+    return previous
+
+
+def reference(path='/'):
+    """
+    Get a reference to a location in the configured database.
+
+    Drop-in replacement for ``firebase_admin.db.reference``.
+
+    Args:
+        path (str): Slash separated path to the location.
+
+    Returns:
+        Reference supporting child, get, set, update, push, delete and ordered queries.
+    """
+    return get_store().reference(path)
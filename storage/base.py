@@ -0,0 +1,402 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Characters Firebase does not allow inside a path segment
+INVALID_KEY_CHARS = re.compile(r'[.#$\[\]]')
+
+# Number of times LocalReference.transaction retries, matching firebase_admin
+MAX_TRANSACTION_RETRIES = 25
+
+PUSH_CHARS = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+
+_push_lock = threading.Lock()
+_last_push_time = 0
+_last_rand_chars = [0] * 12
+
+
+def split_path(path):
+    """
+    Split a database path into its segments.
+
+    Args:
+        path (str): Slash separated path, e.g. 'wallets/user1/balance'.
+
+    Returns:
+        list: Path segments without empty parts.
+
+    Raises:
+        ValueError: If a segment contains a character Firebase rejects.
+    """
+    if path is None:
+        return []
+    segments = [segment for segment in str(path).split('/') if segment]
+    for segment in segments:
+        if INVALID_KEY_CHARS.search(segment):
+            raise ValueError(f'Invalid path segment: "{segment}".')
+    return segments
+
+
+def join_path(segments):
+    """Join path segments back into a slash separated path."""
+    return '/'.join(segments)
+
+
+def generate_push_id():
+    """
+    Generate a chronologically ordered key in the same format as Firebase push IDs.
+
+    The first 8 characters encode the current time in milliseconds and the remaining
+    12 are random, incremented when several keys are generated in the same millisecond.
+    Sorting the keys lexicographically therefore sorts them by creation time.
+
+    Returns:
+        str: A 20 character push ID.
+    """
+    global _last_push_time
+    with _push_lock:
+        now = int(time.time() * 1000)
+        duplicate_time = now == _last_push_time
+        _last_push_time = now
+
+        time_chars = []
+        for _ in range(8):
+            time_chars.append(PUSH_CHARS[now % 64])
+            now //= 64
+        push_id = ''.join(reversed(time_chars))
+
+        if not duplicate_time:
+            for i in range(12):
+                _last_rand_chars[i] = random.randrange(64)
+        else:
+            i = 11
+            while i >= 0 and _last_rand_chars[i] == 63:
+                _last_rand_chars[i] = 0
+                i -= 1
+            _last_rand_chars[i] += 1
+
+        return push_id + ''.join(PUSH_CHARS[c] for c in _last_rand_chars)
+
+
+def normalize_value(value):
+    """
+    Convert a value into the shape the database stores.
+
+    Lists become dicts keyed by index, keys become strings, and ``None`` values
+    and empty containers are dropped, mirroring how Firebase persists JSON.
+
+    Returns:
+        The normalized value, or None if nothing would be stored.
+    """
+    if isinstance(value, (list, tuple)):
+        value = {str(index): item for index, item in enumerate(value)}
+    if isinstance(value, dict):
+        node = {}
+        for key, item in value.items():
+            item = normalize_value(item)
+            if item is not None:
+                node[str(key)] = item
+        return node or None
+    return value
+
+
+def denormalize_value(node):
+    """
+    Return a copy of a stored node, turning array-like dicts back into lists.
+
+    Firebase returns a list when every key is an integer index and most of the
+    slots between 0 and the highest index are filled.
+    """
+    if not isinstance(node, dict):
+        return node
+    result = {key: denormalize_value(item) for key, item in node.items()}
+    if result and all(key.isdigit() and (key == '0' or not key.startswith('0')) for key in result):
+        highest = max(int(key) for key in result)
+        if highest < 2 * len(result):
+            return [result.get(str(index)) for index in range(highest + 1)]
+    return result
+
+
+def compute_etag(value):
+    """
+    Compute the ETag of a stored value.
+
+    Like Firebase, the ETag only depends on the content, so two reads of an
+    unchanged location return the same ETag.
+    """
+    encoded = json.dumps(value, sort_keys=True, separators=(',', ':'))
+    return hashlib.md5(encoded.encode('utf-8')).hexdigest()
+
+
+def sort_key(value):
+    """
+    Order values the way Firebase orders children in a query:
+    null, false, true, numbers, strings, then objects.
+    """
+    if value is None:
+        return (0, 0)
+    if value is False:
+        return (1, 0)
+    if value is True:
+        return (2, 0)
+    if isinstance(value, (int, float)):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, 0)
+
+
+class LocalQuery:
+    """
+    Ordered, filtered read of the children of a LocalReference.
+
+    Supports the same builder methods as ``firebase_admin.db.Query`` and, like it,
+    returns the matching children as an OrderedDict.
+    """
+
+    def __init__(self, reference, order_by):
+        if not order_by or not isinstance(order_by, str):
+            raise ValueError('order_by field must be a non-empty string')
+        self._reference = reference
+        self._order_by = order_by
+        self._start = None
+        self._end = None
+        self._limit_first = None
+        self._limit_last = None
+
+    def limit_to_first(self, limit):
+        if not isinstance(limit, int) or limit < 0:
+            raise ValueError('Limit must be a non-negative integer.')
+        if self._limit_last is not None:
+            raise ValueError('Cannot set both first and last limits.')
+        self._limit_first = limit
+        return self
+
+    def limit_to_last(self, limit):
+        if not isinstance(limit, int) or limit < 0:
+            raise ValueError('Limit must be a non-negative integer.')
+        if self._limit_first is not None:
+            raise ValueError('Cannot set both first and last limits.')
+        self._limit_last = limit
+        return self
+
+    def start_at(self, start):
+        if start is None:
+            raise ValueError('Start value must not be None.')
+        self._start = start
+        return self
+
+    def end_at(self, end):
+        if end is None:
+            raise ValueError('End value must not be None.')
+        self._end = end
+        return self
+
+    def equal_to(self, value):
+        if value is None:
+            raise ValueError('Equal to value must not be None.')
+        self._start = value
+        self._end = value
+        return self
+
+    def _ordering_value(self, key, value):
+        if self._order_by == '$key':
+            return key
+        if self._order_by == '$value':
+            return value
+        for segment in split_path(self._order_by):
+            value = value.get(segment) if isinstance(value, dict) else None
+        return value
+
+    def get(self):
+        """
+        Execute the query.
+
+        Returns:
+            OrderedDict: Matching children in query order (empty if none match).
+        """
+        data = self._reference.get()
+        if isinstance(data, list):
+            data = {str(index): item for index, item in enumerate(data) if item is not None}
+        if not isinstance(data, dict):
+            return OrderedDict()
+
+        if self._order_by == '$key':
+            rows = sorted(data.items(), key=lambda item: item[0])
+        else:
+            rows = sorted(
+                data.items(),
+                key=lambda item: (sort_key(self._ordering_value(*item)), item[0])
+            )
+
+        if self._start is not None:
+            start = sort_key(self._start)
+            rows = [row for row in rows if sort_key(self._ordering_value(*row)) >= start]
+        if self._end is not None:
+            end = sort_key(self._end)
+            rows = [row for row in rows if sort_key(self._ordering_value(*row)) <= end]
+
+        if self._limit_first is not None:
+            rows = rows[:self._limit_first]
+        elif self._limit_last is not None:
+            rows = rows[max(0, len(rows) - self._limit_last):] if self._limit_last else []
+
+        return OrderedDict(rows)
+
+
+class LocalReference:
+    """
+    Reference to a location in a local store.
+
+    Mirrors the subset of ``firebase_admin.db.Reference`` used by the services so
+    the same code runs against Firebase or a local backend.
+    """
+
+    def __init__(self, store, segments):
+        self._store = store
+        self._segments = list(segments)
+
+    @property
+    def key(self):
+        return self._segments[-1] if self._segments else None
+
+    @property
+    def path(self):
+        return '/' + join_path(self._segments)
+
+    @property
+    def parent(self):
+        if not self._segments:
+            return None
+        return LocalReference(self._store, self._segments[:-1])
+
+    def child(self, path):
+        if not path or not isinstance(path, str):
+            raise ValueError(f'Invalid path argument: "{path}". Path must be a non-empty string.')
+        return LocalReference(self._store, self._segments + split_path(path))
+
+    def get(self, etag=False, shallow=False):
+        if etag and shallow:
+            raise ValueError('etag and shallow cannot both be set to True.')
+        value = self._store.read(self._segments)
+        if etag:
+            return value, compute_etag(value)
+        if shallow and isinstance(value, dict):
+            return {key: True for key in value}
+        return value
+
+    def set_if_unchanged(self, expected_etag, value):
+        """
+        Set the value only if the location still has the expected ETag.
+
+        Returns:
+            tuple: (success, current value, current ETag), as firebase_admin does.
+        """
+        if not isinstance(expected_etag, str):
+            raise ValueError('Expected ETag must be a string.')
+        if value is None:
+            raise ValueError('Value must not be none.')
+        return self._store.compare_and_set(self._segments, expected_etag, value)
+
+    def transaction(self, transaction_update):
+        """
+        Atomically replace the value with ``transaction_update(current_value)``.
+
+        Returns:
+            The new value.
+        """
+        if not callable(transaction_update):
+            raise ValueError('transaction_update must be a function.')
+        for _ in range(MAX_TRANSACTION_RETRIES):
+            value, etag = self.get(etag=True)
+            new_value = transaction_update(value)
+            if new_value is None:
+                self._store.write(self._segments, None)
+                return None
+            success, _, _ = self._store.compare_and_set(self._segments, etag, new_value)
+            if success:
+                return new_value
+        raise RuntimeError('Transaction aborted after failed retries.')
+
+    def set(self, value):
+        if value is None:
+            raise ValueError('Value must not be None.')
+        self._store.write(self._segments, value)
+
+    def update(self, value):
+        """
+        Update the given children. Keys may be slash separated paths, in which case
+        all of them are written in one atomic multi-path update.
+        """
+        if not value or not isinstance(value, dict):
+            raise ValueError('Value argument must be a non-empty dictionary.')
+        if None in value.keys():
+            raise ValueError('Dictionary must not contain None keys.')
+        self._store.update(self._segments, value)
+
+    def push(self, value=''):
+        if value is None:
+            raise ValueError('Value must not be None.')
+        new_ref = self.child(generate_push_id())
+        new_ref.set(value)
+        return new_ref
+
+    def delete(self):
+        self._store.write(self._segments, None)
+
+    def order_by_child(self, path):
+        if path.startswith('/'):
+            raise ValueError(f'Invalid path argument: "{path}". Child path must not start with "/"')
+        return LocalQuery(self, path)
+
+    def order_by_key(self):
+        return LocalQuery(self, '$key')
+
+    def order_by_value(self):
+        return LocalQuery(self, '$value')
+
+
+class LocalStore:
+    """
+    Base class for stores that keep the database tree in this process.
+
+    Subclasses implement ``read``, ``write`` and ``update`` on lists of path segments.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def reference(self, path='/'):
+        return LocalReference(self, split_path(path))
+
+    def read(self, segments):
+        raise NotImplementedError
+
+    def write(self, segments, value):
+        raise NotImplementedError
+
+    def update(self, segments, values):
+        raise NotImplementedError
+
+    def compare_and_set(self, segments, expected_etag, value):
+        """
+        Write the value if the current ETag matches, atomically with respect to other writers.
+
+        Returns:
+            tuple: (success, current value, current ETag).
+        """
+        with self._lock:
+            current = self.read(segments)
+            current_etag = compute_etag(current)
+            if current_etag != expected_etag:
+                return False, current, current_etag
+            self.write(segments, value)
+            current = self.read(segments)
+            return True, current, compute_etag(current)
+
+    def close(self):
+        pass
@@ -0,0 +1,18 @@
+from firebase_admin import db
+
+
+class FirebaseStore:
+    """
+    Store backed by the Firebase Realtime Database.
+
+    References are the native ``firebase_admin.db.Reference`` objects; the Firebase
+    app is initialized on first use so importing the services never needs credentials.
+    """
+
+    def reference(self, path='/'):
+        from user.models import get_firebase_app  # Imported lazily to avoid a circular import
+        get_firebase_app()
+        return db.reference(path)
+
+    def close(self):
+        pass
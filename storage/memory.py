@@ -0,0 +1,65 @@
+from storage.base import LocalStore, normalize_value, denormalize_value, split_path
+
+
+class MemoryStore(LocalStore):
+    """
+    Database tree held in a nested dict inside this process.
+
+    Data is lost when the process exits; intended for tests, benchmarks and
+    single-process deployments.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._root = {}
+
+    def read(self, segments):
+        with self._lock:
+            node = self._root
+            for segment in segments:
+                if not isinstance(node, dict) or segment not in node:
+                    return None
+                node = node[segment]
+            return denormalize_value(node)
+
+    def _write_locked(self, segments, value):
+        value = normalize_value(value)
+        if not segments:
+            self._root = value if isinstance(value, dict) else {}
+            return
+
+        parents = [self._root]
+        node = self._root
+        for segment in segments[:-1]:
+            child = node.get(segment)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = {}
+                node[segment] = child
+            node = child
+            parents.append(node)
+
+        if value is None:
+            node.pop(segments[-1], None)
+            # Drop parents left empty, as Firebase does
+            for depth in range(len(segments) - 1, 0, -1):
+                if parents[depth]:
+                    break
+                parents[depth - 1].pop(segments[depth - 1], None)
+        else:
+            node[segments[-1]] = value
+
+    def write(self, segments, value):
+        with self._lock:
+            self._write_locked(segments, value)
+
+    def update(self, segments, values):
+        writes = [(segments + split_path(key), value) for key, value in values.items()]
+        with self._lock:
+            for path, value in writes:
+                self._write_locked(path, value)
+
+    def clear(self):
+        with self._lock:
+            self._root = {}
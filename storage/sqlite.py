@@ -0,0 +1,128 @@
+import json
+import sqlite3
+from storage.base import LocalStore, normalize_value, denormalize_value, split_path, join_path, compute_etag
+
+
+class SQLiteStore(LocalStore):
+    """
+    Database tree persisted in a SQLite file.
+
+    Every leaf value is one row keyed by its full path, so reading a single field
+    such as 'wallets/<uid>/balance' is a primary key lookup and reading a subtree
+    is a range scan over the paths below it.
+    """
+
+    def __init__(self, db_path='damnplay.sqlite3'):
+        super().__init__()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        if db_path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS nodes (path TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID'
+        )
+
+    @staticmethod
+    def _subtree_bounds(path):
+        # '0' is the character right after '/', so [path/, path0) covers every descendant
+        return path + '/', path + '0'
+
+    def read(self, segments):
+        path = join_path(segments)
+        with self._lock:
+            if not path:
+                rows = self._conn.execute('SELECT path, value FROM nodes').fetchall()
+            else:
+                row = self._conn.execute('SELECT value FROM nodes WHERE path = ?', (path,)).fetchone()
+                if row is not None:
+                    return json.loads(row[0])
+                low, high = self._subtree_bounds(path)
+                rows = self._conn.execute(
+                    'SELECT path, value FROM nodes WHERE path >= ? AND path < ?', (low, high)
+                ).fetchall()
+
+        if not rows:
+            return None
+
+        prefix_length = len(path) + 1 if path else 0
+        tree = {}
+        for row_path, value in rows:
+            parts = row_path[prefix_length:].split('/')
+            node = tree
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            node[parts[-1]] = json.loads(value)
+        return denormalize_value(tree)
+
+    @staticmethod
+    def _flatten(path, value, rows):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                SQLiteStore._flatten(f'{path}/{key}' if path else key, item, rows)
+        else:
+            rows.append((path, json.dumps(value)))
+
+    def _write_locked(self, segments, value):
+        path = join_path(segments)
+        if not path:
+            self._conn.execute('DELETE FROM nodes')
+        else:
+            low, high = self._subtree_bounds(path)
+            self._conn.execute('DELETE FROM nodes WHERE path = ? OR (path >= ? AND path < ?)', (path, low, high))
+            # A scalar stored at an ancestor would shadow the new subtree
+            ancestors = [join_path(segments[:depth]) for depth in range(1, len(segments))]
+            if ancestors:
+                self._conn.execute(
+                    f'DELETE FROM nodes WHERE path IN ({",".join("?" * len(ancestors))})', ancestors
+                )
+
+        value = normalize_value(value)
+        if value is None:
+            return
+        rows = []
+        self._flatten(path, value, rows)
+        self._conn.executemany('INSERT INTO nodes (path, value) VALUES (?, ?)', rows)
+
+    def write(self, segments, value):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._write_locked(segments, value)
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def update(self, segments, values):
+        writes = [(segments + split_path(key), value) for key, value in values.items()]
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                for path, value in writes:
+                    self._write_locked(path, value)
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def compare_and_set(self, segments, expected_etag, value):
+        # Hold the write transaction across the read so other processes cannot interleave
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                current = self.read(segments)
+                current_etag = compute_etag(current)
+                if current_etag != expected_etag:
+                    self._conn.execute('ROLLBACK')
+                    return False, current, current_etag
+                self._write_locked(segments, value)
+                current = self.read(segments)
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return True, current, compute_etag(current)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Ensure project root is in the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+# Run the test suite against the in-process store instead of Firebase
+os.environ.setdefault("DAMNPLAY_STORAGE_BACKEND", "memory")
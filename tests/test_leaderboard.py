@@ -8,7 +8,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 
 
-from flask import Flask
+from flask import Flask, jsonify
 from flask.testing import FlaskClient
 from leaderboard.routes import leaderboard_blueprint
 
@@ -89,3 +89,693 @@ def test_complete_leaderboard(mock_complete_contest, client: FlaskClient):
     print("this is" ,response)
     assert response.status_code == 200
 
+
+
+# --- Ranked index ---
+
+import random
+
+from storage.backend import set_store
+from storage.memory import MemoryStore
+from leaderboard.index import RankedIndex, ContestIndex, leaderboard_indexes
+from leaderboard import services as leaderboard_services
+
+
+@pytest.fixture
+def memory_store():
+    store = MemoryStore()
+    previous = set_store(store)
+    leaderboard_indexes.clear()
+    leaderboard_services.contest_cache.clear()
+    leaderboard_services.leaderboard_cache.clear()
+    yield store
+    set_store(previous)
+    leaderboard_indexes.clear()
+    leaderboard_services.contest_cache.clear()
+    leaderboard_services.leaderboard_cache.clear()
+
+
+def test_ranked_index_matches_sorted_keys():
+    rng = random.Random(7)
+    index = RankedIndex()
+    keys = set()
+    for _ in range(2000):
+        key = (rng.randrange(100), rng.randrange(1000))
+        if key in keys and rng.random() < 0.5:
+            index.remove(key)
+            keys.remove(key)
+        elif key not in keys:
+            index.insert(key)
+            keys.add(key)
+
+    ordered = sorted(keys)
+    assert len(index) == len(ordered)
+    assert list(index.iter_from(0)) == ordered
+    assert list(index.iter_from(len(ordered) // 2)) == ordered[len(ordered) // 2:]
+    probe = ordered[len(ordered) // 3]
+    assert index.count_less(probe) == len(ordered) // 3
+
+
+def test_contest_index_competition_ranks():
+    index = ContestIndex()
+    index.rebuild({
+        "a": {"username": "A", "score": 50},
+        "b": {"username": "B", "score": 80},
+        "c": {"username": "C", "score": 80},
+        "d": {"username": "D", "score": 10},
+    })
+    assert [(rank, user_id) for rank, user_id, _, _ in index.entries()] == [(1, "b"), (1, "c"), (3, "a"), (4, "d")]
+    assert [rank for rank, _, _, _ in index.entries(start=1, count=2)] == [1, 3]
+
+    index.upsert("d", "D", 90)
+    assert index.rank("d") == 1
+    assert index.rank("b") == 2
+    assert index.position("a") == 3
+
+
+def test_fetch_leaderboard_uses_index_updates(memory_store):
+    memory_store.reference('contests/c1').set({"prize_pool": 100, "participants": ["u3"]})
+    memory_store.reference('leaderboards/c1').set({
+        "u1": {"username": "one", "score": 10},
+        "u2": {"username": "two", "score": 30},
+    })
+
+    ranked = leaderboard_services.fetch_leaderboard("c1")["data"]
+    assert [(entry["user_id"], entry["rank"]) for entry in ranked] == [("u2", 1), ("u1", 2), ("u3", 3)]
+
+    leaderboard_services.update_leaderboard_entry("c1", "u3", "three", 50)
+    ranked = leaderboard_services.fetch_leaderboard("c1")["data"]
+    assert [(entry["user_id"], entry["rank"], entry["username"]) for entry in ranked][0] == ("u3", 1, "three")
+
+
+def test_fetch_leaderboard_top_and_around(memory_store, client):
+    memory_store.reference('contests/c1').set({"prize_pool": 100})
+    memory_store.reference('leaderboards/c1').set({
+        f"u{i:02d}": {"username": f"user{i}", "score": i} for i in range(20)
+    })
+
+    result = leaderboard_services.fetch_leaderboard("c1", top=3, around="u10", window=2)["data"]
+    assert result["total"] == 20
+    assert [entry["user_id"] for entry in result["top"]] == ["u19", "u18", "u17"]
+    assert [(entry["user_id"], entry["rank"]) for entry in result["around"]] == [
+        ("u12", 8), ("u11", 9), ("u10", 10), ("u09", 11), ("u08", 12)
+    ]
+
+    # The window is clipped at the top of the board
+    response = client.get("/leaderboard/c1?around=u18&window=3")
+    around = response.get_json()["leaderboard"]["data"]["around"]
+    assert [entry["user_id"] for entry in around] == ["u19", "u18", "u17", "u16", "u15"]
+
+    missing = leaderboard_services.fetch_leaderboard("c1", around="nobody")
+    assert missing["success"] is False
+
+
+# --- Caching ---
+
+def test_ttl_cache_expiry_bytes_and_counters():
+    from caching import TTLCache
+    cache = TTLCache('test', default_ttl=60, max_bytes=20)
+    cache.set('a', 'x' * 8)    # 10 bytes as JSON
+    cache.set('b', 'y' * 8)
+    assert cache.get('a') == (True, 'x' * 8)
+    cache.set('c', 'z' * 8)    # evicts the least recently used entry, 'b'
+    assert cache.get('b') == (False, None)
+    cache.set('d', 'w' * 100)  # larger than the whole cache: not stored
+    assert cache.get('d') == (False, None)
+
+    cache.set('e', 1, ttl=0)
+    assert cache.get('e') == (False, None)
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['expirations']) == (1, 3, 2, 1)
+    assert stats['bytes'] <= 20
+
+
+def test_score_update_invalidates_only_its_contest(memory_store):
+    memory_store.reference('contests').set({"c1": {"status": "active"}, "c2": {"status": "active"}})
+    memory_store.reference('leaderboards').set({
+        "c1": {"u1": {"username": "one", "score": 1}},
+        "c2": {"u2": {"username": "two", "score": 2}},
+    })
+    leaderboard_services.get_leaderboard_data("c1")
+    leaderboard_services.get_leaderboard_data("c2")
+
+    leaderboard_services.update_leaderboard_entry("c1", "u1", "one", 5)
+
+    assert leaderboard_services.leaderboard_cache.get("c1") == (False, None)
+    assert leaderboard_services.leaderboard_cache.get("c2")[0] is True
+
+
+def test_completed_contest_is_never_served_as_active(memory_store):
+    from contest.services import ContestService
+    memory_store.reference('contests/c1').set({"status": "active", "entry_fee": 0})
+    memory_store.reference('leaderboards/c1').set({"u1": {"username": "one", "score": 1}})
+    assert leaderboard_services.fetch_leaderboard("c1")["success"] is True
+
+    ContestService.cancel_contest("c1")
+
+    assert leaderboard_services.fetch_leaderboard("c1")["success"] is False
+    response = leaderboard_services.update_leaderboard_entry("c1", "u1", "one", 10)
+    assert response["message"] == "Contest c1 is no longer active."
+
+
+def test_cancel_contest_retry_refunds_each_participant_once(memory_store, monkeypatch):
+    from contest.services import ContestService
+    memory_store.reference('contests/c1').set({"status": "active", "entry_fee": 10})
+    memory_store.reference('user_contest_mapping/c1').set(["u1", "u2"])
+    memory_store.reference('wallets').set({"u1": {"balance": 0}, "u2": {"balance": 0}})
+
+    original = memory_store.write
+
+    def failing_write(segments, value):
+        if segments[:3] == ['wallets', 'u2', 'pending']:
+            raise RuntimeError("write failed")
+        return original(segments, value)
+
+    monkeypatch.setattr(memory_store, "write", failing_write)
+    _, status = ContestService.cancel_contest("c1")
+    assert status == 500
+    contest = memory_store.reference('contests/c1').get()
+    assert contest["status"] == "canceling" and list(contest["refunds"]) == ["u1"]
+    assert leaderboard_services.update_leaderboard_entry("c1", "u1", "one", 10)["success"] is False
+    _, status = ContestService.join_contest({"user_id": "u3", "contest_id": "c1"})
+    assert status == 400
+    assert memory_store.reference('user_contest_mapping/c1').get() == ["u1", "u2"]
+
+    monkeypatch.setattr(memory_store, "write", original)
+    _, status = ContestService.cancel_contest("c1")
+    assert status == 200
+    wallets = memory_store.reference('wallets').get()
+    assert wallets["u1"]["balance"] == wallets["u2"]["balance"] == 10
+    assert len(wallets["u1"]["transactions"]) == 1
+    assert memory_store.reference('contests/c1/status').get() == "canceled"
+
+
+def test_cancel_and_settlement_exclude_each_other(memory_store):
+    from contest.services import ContestService
+    memory_store.reference('user_contest_mapping/c1').set(["u1"])
+    memory_store.reference('leaderboards/c1').set({"u1": {"username": "one", "score": 10}})
+
+    # Winnings are not topped up with refunds
+    for status in ("settling", "completed"):
+        memory_store.reference('contests/c1').set({"status": status, "entry_fee": 10, "prize_pool": 100})
+        leaderboard_services.invalidate_contest("c1")
+        _, code = ContestService.cancel_contest("c1")
+        assert code == 400
+        assert memory_store.reference('contests/c1/status').get() == status
+    assert memory_store.reference('wallets/u1').get() is None
+
+    # Refunds are not topped up with winnings
+    memory_store.reference('contests/c1').set({"status": "canceling", "entry_fee": 10, "prize_pool": 100})
+    leaderboard_services.invalidate_contest("c1")
+    assert leaderboard_services.complete_contest("c1")["success"] is False
+    assert memory_store.reference('contests/c1/status').get() == "canceling"
+    assert memory_store.reference('settlements/c1').get() is None
+
+
+def test_update_leaderboard_batch(memory_store, client):
+    memory_store.reference('contests').set({"c1": {"status": "active"}, "c2": {"status": "completed"}})
+    memory_store.reference('leaderboards/c1').set({"u1": {"username": "one", "score": 1}})
+    leaderboard_services.fetch_leaderboard("c1")  # Load the ranked index
+
+    scores = [{"contest_id": "c1", "user_id": f"u{i}", "username": f"user{i}", "score": i} for i in range(2, 2500)]
+    scores += [
+        {"contest_id": "c1", "user_id": "u1", "username": "one", "score": 5},
+        {"contest_id": "c1", "user_id": "u1", "username": "one", "score": 9000},
+        {"contest_id": "c2", "user_id": "u1", "username": "one", "score": 5},
+        {"contest_id": "c1", "user_id": "u.1", "username": "bad", "score": 5},
+    ]
+    response = client.post("/update_leaderboard/batch", json={"scores": scores})
+    body = response.get_json()
+    assert body["data"]["failed"] == 2
+    results = body["data"]["results"]
+    assert results[-2]["error"] == "Contest c2 is no longer active."
+    assert results[-3] == {"success": True}
+    assert results[-4] == {"success": True, "superseded": True}
+
+    assert len(memory_store.reference('leaderboards/c1').get()) == 2499
+    assert memory_store.reference('leaderboards/c1/u1/score').get() == 9000
+    top = leaderboard_services.fetch_leaderboard("c1", top=2)["data"]["top"]
+    assert [entry["user_id"] for entry in top] == ["u1", "u2499"]
+
+
+# --- Write-behind score buffer ---
+
+@pytest.fixture
+def buffered(monkeypatch):
+    import leaderboard.buffer as buffer
+    score_buffer = buffer.ScoreBuffer(interval=3600, threshold=1000)
+    monkeypatch.setattr(buffer, "WRITE_MODE", "buffered")
+    monkeypatch.setattr(leaderboard_services, "score_buffer", score_buffer)
+    return score_buffer
+
+
+def test_buffered_updates_coalesce_and_stay_readable(memory_store, buffered):
+    memory_store.reference('contests/c1').set({"status": "active", "prize_pool": 100})
+    memory_store.reference('leaderboards/c1').set({"u1": {"username": "one", "score": 1}})
+
+    for score in range(2, 50):
+        leaderboard_services.update_leaderboard_entry("c1", "u2", "two", score)
+
+    # Nothing written yet, but reads see the latest score
+    assert memory_store.reference('leaderboards/c1/u2').get() is None
+    top = leaderboard_services.fetch_leaderboard("c1", top=1)["data"]["top"]
+    assert (top[0]["user_id"], top[0]["score"]) == ("u2", 49)
+
+    # Invalidating the caches keeps the accepted scores
+    leaderboard_services.invalidate_contest("c1")
+    assert buffered.pending("c1") == {"u2": {"username": "two", "score": 49}}
+
+    assert buffered.flush() == 1
+    assert memory_store.reference('leaderboards/c1/u2/score').get() == 49
+
+
+def test_buffer_best_policy_and_flush_on_completion(memory_store, buffered):
+    buffered.merge_policy = 'best'
+    memory_store.reference('contests/c1').set({"status": "active", "prize_pool": 100})
+    memory_store.reference('leaderboards/c1').set({"u1": {"username": "one", "score": 10}})
+
+    leaderboard_services.update_leaderboard_entry("c1", "u2", "two", 30)
+    leaderboard_services.update_leaderboard_entry("c1", "u2", "two", 20)
+    assert buffered.pending("c1") == {"u2": {"username": "two", "score": 30}}
+
+    # Once flushed, a lower score is still compared with the stored one
+    buffered.flush()
+    leaderboard_services.update_leaderboard_entry("c1", "u2", "two", 25)
+    leaderboard_services.update_leaderboard_entry("c1", "u1", "one", 5)
+    assert buffered.pending("c1") == {}
+    assert leaderboard_services.fetch_leaderboard("c1", top=1)["data"]["top"][0]["score"] == 30
+    leaderboard_services.update_leaderboard_entry("c1", "u2", "two", 35)
+    assert buffered.pending("c1") == {"u2": {"username": "two", "score": 35}}
+
+    leaderboard_services.complete_contest("c1")
+
+    completed = leaderboard_services.fetch_historical_leaderboard("c1")["data"]["leaderboard"]
+    assert [(entry["user_id"], entry["score"]) for entry in completed] == [("u2", 35), ("u1", 10)]
+    assert buffered.pending("c1") == {}
+
+
+def test_failed_flush_keeps_scores_and_blocks_settlement(memory_store, buffered, monkeypatch):
+    memory_store.reference('contests/c1').set({"status": "active", "prize_pool": 100})
+    leaderboard_services.update_leaderboard_entry("c1", "u1", "one", 10)
+
+    original = memory_store.update
+
+    def failing_update(segments, values):
+        if segments[:1] != ['contests']:
+            raise RuntimeError("write failed")
+        return original(segments, values)
+
+    monkeypatch.setattr(memory_store, "update", failing_update)
+    with pytest.raises(RuntimeError):
+        buffered.flush()
+    response = leaderboard_services.complete_contest("c1")
+    assert response["success"] is False
+    assert buffered.failed_flushes == 2
+    assert buffered.pending("c1") == {"u1": {"username": "one", "score": 10}}
+    # Scores already stopped, but no settlement started
+    assert memory_store.reference('contests/c1/status').get() == "settling"
+    assert memory_store.reference('settlements/c1').get() is None
+
+    monkeypatch.setattr(memory_store, "update", original)
+    assert leaderboard_services.complete_contest("c1")["success"] is True
+
+
+
+def test_settlement_stops_scores_before_reading_standings(memory_store, buffered, monkeypatch):
+    memory_store.reference('contests/c1').set({"status": "active", "prize_pool": 100})
+    memory_store.reference('leaderboards/c1').set({"u1": {"username": "one", "score": 10}})
+    leaderboard_services.fetch_leaderboard("c1")
+
+    # A score arriving while the buffer is flushed is either settled or rejected
+    flush = buffered.flush
+    late = []
+
+    def flush_with_late_score(contest_id=None):
+        late.append(leaderboard_services.update_leaderboard_entry("c1", "u2", "two", 50)["success"])
+        # The leaderboard stays readable while the contest is settled
+        reading = leaderboard_services.fetch_leaderboard("c1", top=1)
+        assert reading["success"] and reading["data"]["top"][0]["user_id"] == "u1"
+        assert leaderboard_services.fetch_leaderboard_stats("c1")["data"]["count"] == 1
+        return flush(contest_id)
+
+    monkeypatch.setattr(buffered, "flush", flush_with_late_score)
+    assert leaderboard_services.complete_contest("c1")["success"]
+    assert late == [False]
+    assert buffered.pending("c1") == {}
+    assert memory_store.reference('contest_history/u1/c1/winnings').get() == 100
+
+def test_score_writes_check_the_stored_status(memory_store):
+    memory_store.reference('contests/c1').set({"status": "active", "prize_pool": 100})
+    assert leaderboard_services.update_leaderboard_entry("c1", "u1", "one", 10)["success"]
+
+    # Another process starts settling while this one still caches the contest as active
+    memory_store.reference('contests/c1/status').set("settling")
+    assert leaderboard_services.get_contest_data("c1")["status"] == "active"
+    assert not leaderboard_services.update_leaderboard_entry("c1", "u2", "two", 20)["success"]
+    batch = leaderboard_services.update_leaderboard_entries([
+        {"contest_id": "c1", "user_id": "u3", "username": "three", "score": 30}
+    ])
+    assert not batch["data"]["results"][0]["success"]
+    assert set(memory_store.reference('leaderboards/c1').get()) == {"u1"}
+    assert leaderboard_services.get_contest_data("c1")["status"] == "settling"
+
+# --- Live leaderboard stream ---
+
+def test_slow_subscriber_falls_back_to_snapshot():
+    from leaderboard.stream import LeaderboardHub
+    hub = LeaderboardHub(max_queue=3)
+    fast, slow = hub.subscribe("c1"), hub.subscribe("c1")
+    events = hub.stream(fast, snapshot=lambda: {"top": []}, keepalive=0.01)
+    assert next(events).startswith("event: snapshot")
+
+    for score in range(5):
+        hub.publish("c1", "scores", {"score": score})
+        assert f'"score":{score}' in next(events)
+
+    # The slow subscriber overflowed: only the newest events are kept and a snapshot is due
+    assert slow.needs_snapshot and slow.queue.qsize() == 2
+
+    hub.publish("c1", "scores", {"score": 5})
+    assert '"score":5' in next(events)
+    assert slow.queue.qsize() == 3
+
+    hub.close_contest("c1", "completed", {})
+    assert next(events).startswith("event: completed")
+    assert list(events) == []
+    assert hub.subscriber_count("c1") == 0
+
+    # The slow subscriber still receives the final event after its backlog
+    slow_events = list(hub.stream(slow, snapshot=lambda: {"top": []}, keepalive=0.01))
+    assert slow_events[0].startswith("event: snapshot")
+    assert slow_events[-1].startswith("event: completed")
+
+
+def test_concurrent_publishers_never_overflow_a_subscription():
+    import threading
+    from leaderboard.stream import LeaderboardHub
+    hub = LeaderboardHub(max_queue=2)
+    subscription = hub.subscribe("c1")
+
+    def publish():
+        for score in range(500):
+            hub.publish("c1", "scores", {"score": score})
+
+    publishers = [threading.Thread(target=publish) for _ in range(8)]
+    for publisher in publishers:
+        publisher.start()
+    for publisher in publishers:
+        publisher.join()
+
+    assert subscription.needs_snapshot and 0 < subscription.queue.qsize() <= 2
+
+
+def test_stream_leaderboard_sends_snapshot_then_changes(memory_store):
+    memory_store.reference('contests/c1').set({"status": "active", "prize_pool": 100})
+    memory_store.reference('leaderboards/c1').set({"u1": {"username": "one", "score": 10}})
+
+    events = leaderboard_services.stream_leaderboard("c1")["data"]["events"]
+    snapshot = next(events)
+    assert snapshot.startswith("event: snapshot") and '"user_id":"u1"' in snapshot
+
+    leaderboard_services.update_leaderboard_entry("c1", "u2", "two", 20)
+    change = next(events)
+    assert change.startswith("event: scores")
+    assert '"user_id":"u2"' in change and '"rank":1' in change
+
+    events.close()
+    assert not leaderboard_services.leaderboard_hub.has_subscribers("c1")
+    assert not leaderboard_services.stream_leaderboard("missing")["success"]
+
+
+# --- Ranking engine ---
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_rank_leaderboard_competition_ranks_and_prize(monkeypatch, use_numpy):
+    from leaderboard import ranking
+    if use_numpy and ranking.np is None:
+        pytest.skip("numpy not installed")
+    if not use_numpy:
+        monkeypatch.setattr(ranking, "np", None)
+
+    ranked = ranking.rank_leaderboard({
+        "d": {"username": "D", "score": 10},
+        "c": {"username": "C", "score": 80},
+        "a": {"username": "A", "score": 50},
+        "b": {"username": "B", "score": 80},
+        "e": {"username": "E"},
+    })
+    assert ranked.rows() == [(1, "b", "B", 80), (1, "c", "C", 80), (3, "a", "A", 50), (4, "d", "D", 10), (5, "e", "E", 0)]
+    assert ranked.rows(2, 2) == [(3, "a", "A", 50), (4, "d", "D", 10)]
+    assert all(type(rank) is int for rank, _, _, _ in ranked.rows())
+    assert ranking.split_prize(ranked, 100) == [("b", 50.0), ("c", 50.0)]
+
+
+# --- Sharded leaderboards ---
+
+def test_sharded_leaderboard_merges_top_and_rank(memory_store, monkeypatch):
+    memory_store.reference('contests/c1').set({
+        "status": "active", "prize_pool": 100, "leaderboard_shards": 4, "participants": ["idle"]
+    })
+    leaderboard_services.update_leaderboard_entries([
+        {"contest_id": "c1", "user_id": f"u{n:03}", "username": f"user{n}", "score": n % 37}
+        for n in range(300)
+    ])
+
+    assert memory_store.reference('leaderboards/c1').get() is None
+    assert len(memory_store.reference('leaderboard_shards/c1').get(shallow=True)) == 4
+
+    # Answered from the shards, without building the contest's index or listing every user
+    reads = []
+    original_read = memory_store.read
+    memory_store.read = lambda segments: reads.append(list(segments)) or original_read(segments)
+    merged = leaderboard_services.fetch_leaderboard("c1", top=20)["data"]
+    rank = leaderboard_services.fetch_leaderboard("c1", around="u100", window=0)["data"]
+    idle = leaderboard_services.fetch_leaderboard("c1", around="idle", window=0)["data"]
+    memory_store.read = original_read
+    assert not leaderboard_indexes.is_loaded("c1")
+    assert ['leaderboard_shards', 'c1'] not in reads and "total" not in merged
+
+    full = leaderboard_services.fetch_leaderboard("c1")["data"]
+    assert len(full) == 301
+    assert idle["around"][0]["rank"] == next(e for e in full if e["user_id"] == "idle")["rank"]
+    assert [(e["rank"], e["user_id"], e["score"]) for e in merged["top"]] == \
+        [(e["rank"], e["user_id"], e["score"]) for e in full[:20]]
+    expected = next(e for e in full if e["user_id"] == "u100")
+    assert (rank["around"][0]["rank"], rank["around"][0]["score"]) == (expected["rank"], expected["score"])
+
+    # A rank deeper than the shard scan bound is answered from the index
+    monkeypatch.setattr("leaderboard.shards.MAX_SHARD_RANK_SCAN", 10)
+    leaderboard_indexes.discard("c1")
+    assert leaderboard_services.fetch_leaderboard("c1", around="u036", window=0)["data"]["around"][0]["rank"] == 1
+    assert not leaderboard_indexes.is_loaded("c1")
+    deep = leaderboard_services.fetch_leaderboard("c1", around="idle", window=0)["data"]
+    assert leaderboard_indexes.is_loaded("c1")
+    assert deep["around"][0]["rank"] == idle["around"][0]["rank"]
+
+    # Only as many participants as the top K needs are checked for a missing score
+    from leaderboard.shards import unscored_users
+    participants = [f"u{n:03}" for n in range(300)] + ["idle", "a-idle"]
+    assert unscored_users("c1", 4, participants, count=1) == ["a-idle"]
+    assert unscored_users("c1", 4, participants, limit=32) is None
+    assert unscored_users("c1", 4, participants) == ["a-idle", "idle"]
+
+    leaderboard_services.complete_contest("c1")
+    assert memory_store.reference('leaderboard_shards/c1').get() is None
+    assert memory_store.reference('completed_contests/c1/total').get() == 300
+
+
+# --- Settlement ---
+
+def test_settlement_resumes_without_paying_twice(memory_store):
+    import time
+    from datetime import datetime
+    from wallet.services import apply_batch_service
+    memory_store.reference('contests/c1').set({"status": "active", "prize_pool": 100})
+    memory_store.reference('leaderboards/c1').set({
+        "a": {"username": "A", "score": 9},
+        "b": {"username": "B", "score": 9},
+        "c": {"username": "C", "score": 1},
+    })
+    # An interrupted run fixed the payouts and credited 'a' without marking it done
+    memory_store.reference('settlements/c1').set({
+        "status": "paying", "started_at": datetime.utcnow().isoformat(),
+        "payouts": {"a": {"amount": 50, "done": False}, "b": {"amount": 50, "done": False}},
+        "lease": {"owner": "crashed", "expires_at": time.time() - 1}
+    })
+    memory_store.reference('contests/c1/status').set('settling')
+    apply_batch_service([{"user_id": "a", "amount": 50, "reason": "contest_winnings", "contest_id": "c1",
+                          "idempotency_key": "contest_winnings:c1"}])
+    assert not leaderboard_services.update_leaderboard_entry("c1", "c", "C", 99)["success"]
+
+    for _ in range(2):
+        assert leaderboard_services.complete_contest("c1")["success"]
+        assert memory_store.reference('wallets/a/balance').get() == 50
+        assert memory_store.reference('wallets/b/balance').get() == 50
+
+    settlement = memory_store.reference('settlements/c1').get()
+    assert settlement["status"] == "completed" and "lease" not in settlement
+    assert all(payout["done"] for payout in settlement["payouts"].values())
+    assert memory_store.reference('contests/c1/status').get() == "completed"
+    assert memory_store.reference('leaderboards/c1').get() is None
+    history = leaderboard_services.fetch_historical_leaderboard("c1")["data"]["leaderboard"]
+    assert [entry["user_id"] for entry in history] == ["a", "b", "c"]
+
+
+def test_settlement_held_by_another_run_is_not_paid_again(memory_store):
+    import time
+    memory_store.reference('contests/c1').set({"status": "active", "prize_pool": 100})
+    memory_store.reference('leaderboards/c1').set({"a": {"username": "A", "score": 9}})
+    # Another run claimed the settlement and is still paying
+    lease = {"owner": "other", "expires_at": time.time() + 60}
+    memory_store.reference('settlements/c1').set({
+        "status": "paying", "started_at": "2024-01-01T00:00:00",
+        "payouts": {"a": {"amount": 100, "done": False}}, "lease": lease
+    })
+
+    response = leaderboard_services.complete_contest("c1")
+    assert not response["success"] and "in progress" in response["message"]
+    assert memory_store.reference('wallets/a/balance').get() is None
+    assert memory_store.reference('settlements/c1/lease').get() == lease
+
+    # Once the lease expires, the next run takes over and pays
+    memory_store.reference('settlements/c1/lease/expires_at').set(time.time() - 1)
+    assert leaderboard_services.complete_contest("c1")["success"]
+    assert memory_store.reference('wallets/a/balance').get() == 100
+    assert memory_store.reference('settlements/c1/payouts/a/done').get() is True
+
+
+# --- Historical leaderboard archive ---
+
+def test_history_is_paged_by_offset_and_rank(memory_store, monkeypatch):
+    monkeypatch.setattr("leaderboard.archive.HISTORY_PAGE_SIZE", 10)
+    memory_store.reference('contests/c1').set({"status": "active", "prize_pool": 100})
+    # Scores 24, 24, 23, 23, ... so tied ranks straddle page boundaries
+    memory_store.reference('leaderboards/c1').set({
+        f"u{n:02}": {"username": f"user{n}", "score": 24 - n // 2} for n in range(45)
+    })
+    assert leaderboard_services.complete_contest("c1")["success"]
+
+    metadata = memory_store.reference('completed_contests/c1').get()
+    assert (metadata["total"], len(memory_store.reference('leaderboard_archive/c1').get())) == (45, 5)
+    assert metadata["page_first_ranks"] == [1, 11, 21, 31, 41]
+
+    page = leaderboard_services.fetch_historical_leaderboard("c1", offset=8, limit=5)["data"]
+    assert [entry["user_id"] for entry in page["entries"]] == ["u08", "u09", "u10", "u11", "u12"]
+
+    ranked = leaderboard_services.fetch_historical_leaderboard("c1", rank_from=19, rank_to=21, limit=10)["data"]
+    assert [(entry["rank"], entry["user_id"]) for entry in ranked["entries"]] == \
+        [(19, "u18"), (19, "u19"), (21, "u20"), (21, "u21")]
+
+    # Without paging parameters the whole leaderboard keeps its original shape
+    full = leaderboard_services.fetch_historical_leaderboard("c1")["data"]
+    assert set(full) == {"leaderboard", "completed_at"} and len(full["leaderboard"]) == 45
+    assert full["leaderboard"][0] == {
+        "user_id": "u00", "contest_id": "c1", "timestamp": metadata["completed_at"],
+        "username": "user0", "score": 24, "rank": 1
+    }
+
+
+# --- Per-user contest history ---
+
+def test_settlement_writes_user_history_pages(memory_store, client):
+    for n, contest_id in enumerate(["c1", "c2", "c3"]):
+        memory_store.reference(f'contests/{contest_id}').set({"status": "active", "prize_pool": 90})
+        memory_store.reference(f'leaderboards/{contest_id}').set({
+            "a": {"username": "A", "score": 10 * n},
+            "b": {"username": "B", "score": 15},
+        })
+        assert leaderboard_services.complete_contest(contest_id)["success"]
+
+    first = client.get("/leaderboard/history/user/a?limit=2").get_json()["data"]
+    assert [(e["contest_id"], e["rank"], e["winnings"]) for e in first["entries"]] == [("c3", 1, 90), ("c2", 2, 0)]
+    rest = client.get(f"/leaderboard/history/user/a?limit=2&cursor={first['next_cursor']}").get_json()["data"]
+    assert [(e["contest_id"], e["score"], e["participants"]) for e in rest["entries"]] == [("c1", 0, 2)]
+    assert rest["next_cursor"] is None
+
+
+def test_settlement_history_is_written_in_resumable_batches(memory_store, monkeypatch):
+    monkeypatch.setattr(leaderboard_services, "HISTORY_WRITE_BATCH_SIZE", 2)
+    memory_store.reference('contests/c1').set({"status": "active", "prize_pool": 100})
+    memory_store.reference('leaderboards/c1').set({
+        f"u{n}": {"username": f"user{n}", "score": 10 - n} for n in range(5)
+    })
+    root = memory_store.reference('/')
+    update = root.update
+    history_batches = []
+
+    def failing_update(value):
+        if any(path.startswith("contest_history/") for path in value):
+            history_batches.append(len(value))
+            if len(history_batches) == 2:
+                raise RuntimeError("write size exceeded")
+        return update(value)
+
+    monkeypatch.setattr(leaderboard_services, "reference", lambda path: root if path == '/' else memory_store.reference(path))
+    monkeypatch.setattr(root, "update", failing_update)
+    assert not leaderboard_services.complete_contest("c1")["success"]
+    assert memory_store.reference('settlements/c1/history_written').get() == 2
+    assert memory_store.reference('contests/c1/status').get() == "settling"
+
+    # The retry resumes at once and only writes the remaining batches
+    assert leaderboard_services.complete_contest("c1")["success"]
+    assert history_batches == [4, 4, 4, 3]
+    assert memory_store.reference('wallets/u0/balance').get() == 100
+    assert set(memory_store.reference('contest_history').get()) == {f"u{n}" for n in range(5)}
+    assert memory_store.reference('contest_history/u4/c1/participants').get() == 5
+
+
+# --- Leaderboard serialization ---
+
+def test_leaderboard_page_serializes_like_jsonify(app, memory_store, client):
+    import json
+    from datetime import datetime
+    from leaderboard.models import LeaderboardPage, dumps_response
+
+    page = LeaderboardPage("c1", [(1, "u1", "Zoë \"z\"", 12.5), (2, "u2", None, 3)], datetime(2024, 5, 1, 12, 30))
+    response = {"leaderboard": {"success": True, "message": "ok", "data": {"total": 2, "top": page}}}
+    expected = {"leaderboard": dict(response["leaderboard"], data={"total": 2, "top": page.to_dicts()})}
+    assert json.loads(dumps_response(response)) == json.loads(app.json.dumps(expected))
+    with app.app_context():
+        assert dumps_response(response) + "\n" == jsonify(expected).get_data(as_text=True)
+
+    memory_store.reference('contests/c1').set({"prize_pool": 100})
+    memory_store.reference('leaderboards/c1').set({f"u{i}": {"username": f"user{i}", "score": i} for i in range(50)})
+    entries = client.get("/leaderboard/c1").get_json()["leaderboard"]["data"]
+    assert [entry["rank"] for entry in entries] == list(range(1, 51))
+    assert len({entry["timestamp"] for entry in entries}) == 1
+
+
+# --- Score distribution ---
+
+def test_score_sketch_percentiles_within_accuracy():
+    from leaderboard.stats import ScoreSketch
+    rng = random.Random(3)
+    scores = [rng.randrange(-500, 100000) for _ in range(5000)]
+    sketch = ScoreSketch(relative_accuracy=0.01)
+    for score in scores + [0, 7, 7]:
+        sketch.add(score)
+    for score in (0, 7, 7):
+        sketch.remove(score)
+
+    ordered = sorted(scores)
+    for q in (0.5, 0.9, 0.99):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.01 * abs(exact) + 1e-9
+    histogram = sketch.histogram(max_buckets=10)
+    assert len(histogram) <= 10 and sum(bucket["count"] for bucket in histogram) == len(scores) == sketch.count
+
+
+def test_leaderboard_stats_follow_score_updates(memory_store, client):
+    memory_store.reference('contests/c1').set({"status": "active", "prize_pool": 100})
+    memory_store.reference('leaderboards/c1').set({f"u{i}": {"username": f"user{i}", "score": i} for i in range(1, 101)})
+
+    stats = client.get("/leaderboard/c1/stats?user_id=u91").get_json()["data"]
+    assert (stats["count"], stats["highest"], stats["lowest"]) == (100, 100, 1)
+    assert abs(stats["percentiles"]["p50"] - 50) <= 0.5
+    assert stats["user"] == {"user_id": "u91", "score": 91, "rank": 10, "top_percent": 10.0}
+
+    leaderboard_services.update_leaderboard_entry("c1", "u1", "user1", 500)
+    leaderboard_services.update_leaderboard_entry("c1", "new", "newcomer", 0)
+    stats = leaderboard_services.fetch_leaderboard_stats("c1")["data"]
+    assert (stats["count"], stats["highest"], stats["lowest"]) == (101, 500, 0)
+    assert sum(bucket["count"] for bucket in stats["histogram"]) == 101
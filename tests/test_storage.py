@@ -0,0 +1,143 @@
+import pytest
+
+import sys
+import os
+
+# Ensure project root is in the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from storage.backend import create_store, set_store, reference
+from storage.base import generate_push_id
+from storage.memory import MemoryStore
+from storage.sqlite import SQLiteStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryStore()
+    else:
+        store = SQLiteStore(str(tmp_path / "test.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_set_get_child(store):
+    wallets = store.reference('wallets')
+    wallets.child('user1').set({"balance": 100, "transactions": {}})
+    assert wallets.child('user1').get() == {"balance": 100}
+    assert wallets.child('user1/balance').get() == 100
+    assert store.reference('/wallets/user2').get() is None
+
+
+def test_update_multi_path(store):
+    ref = store.reference('wallets/user1')
+    ref.set({"balance": 100, "daily_totals": {"2025-01-01": {"deposit": 10}}})
+    ref.update({
+        "balance": 150,
+        "transactions/txn1": {"type": "deposit", "amount": 50},
+        "daily_totals/2025-01-01/deposit": 60,
+    })
+    assert ref.get() == {
+        "balance": 150,
+        "transactions": {"txn1": {"type": "deposit", "amount": 50}},
+        "daily_totals": {"2025-01-01": {"deposit": 60}},
+    }
+
+
+def test_set_replaces_scalar_with_subtree(store):
+    ref = store.reference('node')
+    ref.set(5)
+    ref.child('inner').set({"a": 1})
+    assert ref.get() == {"inner": {"a": 1}}
+    ref.set("flat")
+    assert ref.get() == "flat"
+
+
+def test_push_generates_ordered_keys(store):
+    ref = store.reference('games')
+    first = ref.push({"title": "a"})
+    second = ref.push({"title": "b"})
+    assert first.key < second.key
+    assert list(ref.get().keys()) == sorted([first.key, second.key])
+    assert len(generate_push_id()) == 20
+
+
+def test_delete_prunes_empty_parents(store):
+    store.reference('leaderboards/c1/u1').set({"score": 1})
+    store.reference('leaderboards/c1/u1').delete()
+    assert store.reference('leaderboards').get() is None
+
+
+def test_lists_round_trip(store):
+    ref = store.reference('user_contest_mapping/c1')
+    ref.set(["u1", "u2"])
+    assert ref.get() == ["u1", "u2"]
+
+
+def test_order_by_child_queries(store):
+    users = store.reference('users')
+    users.child('a').set({"email": "a@x.com", "age": 30})
+    users.child('b').set({"email": "b@x.com", "age": 20})
+    users.child('c').set({"email": "c@x.com", "age": 40})
+
+    result = users.order_by_child('email').equal_to('b@x.com').get()
+    assert list(result.keys()) == ['b']
+
+    result = users.order_by_child('age').start_at(25).get()
+    assert list(result.keys()) == ['a', 'c']
+
+    result = users.order_by_child('age').limit_to_last(2).get()
+    assert list(result.keys()) == ['a', 'c']
+
+    result = users.order_by_key().limit_to_first(1).get()
+    assert list(result.keys()) == ['a']
+
+    result = users.order_by_child('age').limit_to_last(10).get()
+    assert list(result.keys()) == ['b', 'a', 'c']
+
+
+def test_sqlite_store_persists(tmp_path):
+    path = str(tmp_path / "persist.sqlite3")
+    store = SQLiteStore(path)
+    store.reference('contests/c1').set({"status": "active"})
+    store.close()
+
+    reopened = SQLiteStore(path)
+    assert reopened.reference('contests/c1/status').get() == "active"
+    reopened.close()
+
+
+def test_backend_selection():
+    assert isinstance(create_store('memory'), MemoryStore)
+    with pytest.raises(ValueError):
+        create_store('unknown')
+
+    previous = set_store(MemoryStore())
+    try:
+        reference('a/b').set(1)
+        assert reference('a').get() == {"b": 1}
+    finally:
+        set_store(previous)
+
+
+def test_set_if_unchanged(store):
+    ref = store.reference('wallets/user1/balance')
+    ref.set(100)
+    value, etag = ref.get(etag=True)
+    assert value == 100
+
+    success, value, new_etag = ref.set_if_unchanged(etag, 150)
+    assert success is True and value == 150
+
+    success, value, current_etag = ref.set_if_unchanged(etag, 200)
+    assert success is False
+    assert value == 150
+    assert current_etag == new_etag
+
+
+def test_transaction(store):
+    ref = store.reference('counters/visits')
+    for _ in range(3):
+        ref.transaction(lambda current: (current or 0) + 1)
+    assert ref.get() == 3
@@ -127,3 +127,639 @@ def test_credit_winnings(client):
 
     result = credit_winnings_service(user_id, contest_id, 50)
     assert result["message"] == "Winnings credited"
+
+
+# --- Service tests against the in-process store ---
+
+from storage.backend import set_store
+from storage.memory import MemoryStore
+from wallet.services import get_today_date
+from wallet.limits import daily_limits, DailyLimitTracker
+from wallet.cache import balance_cache, BalanceCache
+
+
+@pytest.fixture
+def memory_store():
+    store = MemoryStore()
+    previous = set_store(store)
+    daily_limits.clear()
+    balance_cache.clear()
+    yield store
+    set_store(previous)
+    daily_limits.clear()
+    balance_cache.clear()
+
+
+def test_add_funds_single_write(memory_store):
+    memory_store.reference('wallets/user1').set({"balance": 100})
+
+    result = add_funds_service("user1", 50)
+    assert result["success"] is True
+    assert result["data"]["balance"] == 150
+
+    wallet = memory_store.reference('wallets/user1').get()
+    assert wallet["balance"] == 150
+    assert wallet["daily_totals"][get_today_date()]["deposit"] == 50
+    (transaction,) = wallet["transactions"].values()
+    assert transaction["type"] == "deposit"
+    assert transaction["amount"] == 50
+
+
+def test_add_funds_never_reads_the_ledger(memory_store, monkeypatch):
+    memory_store.reference('wallets/user1').set({"balance": 100, "transactions": {
+        f"t{n:04}": {"type": "deposit", "amount": 1, "timestamp": "2024-01-01T00:00:00"} for n in range(1000)
+    }})
+    reads = []
+    read = memory_store.read
+    monkeypatch.setattr(memory_store, "read", lambda segments: reads.append(list(segments)) or read(segments))
+
+    assert add_funds_service("user1", 50)["success"] is True
+    assert ['wallets', 'user1'] not in reads
+    assert not any('transactions' in segments for segments in reads)
+    wallet = memory_store.reference('wallets/user1').get()
+    assert wallet["balance"] == 150 and len(wallet["transactions"]) == 1001 and "pending" not in wallet
+
+
+def test_deduct_funds_updates_daily_total(memory_store):
+    memory_store.reference('wallets/user1').set({"balance": 100})
+
+    deduct_funds_service("user1", 30)
+    result = deduct_funds_service("user1", 20)
+    assert result["data"]["balance"] == 50
+
+    wallet = memory_store.reference('wallets/user1').get()
+    assert wallet["daily_totals"][get_today_date()]["withdrawal"] == 50
+    assert len(wallet["transactions"]) == 2
+
+
+def test_deduct_funds_daily_limit(memory_store):
+    from wallet.services import MAX_DAILY_WITHDRAWAL
+    memory_store.reference('wallets/user1').set({"balance": MAX_DAILY_WITHDRAWAL * 2})
+
+    response, status = deduct_funds_service("user1", MAX_DAILY_WITHDRAWAL + 1)
+    assert status == 400
+    assert response["message"] == "Daily withdrawal limit exceeded."
+
+
+def test_add_funds_drops_previous_daily_totals(memory_store):
+    memory_store.reference('wallets/user1').set({
+        "balance": 100,
+        "daily_totals": {"2020-01-01": {"deposit": 500}, get_today_date(): {"withdrawal": 20}}
+    })
+
+    add_funds_service("user1", 50)
+
+    daily_totals = memory_store.reference('wallets/user1/daily_totals').get()
+    assert daily_totals == {get_today_date(): {"deposit": 50, "withdrawal": 20}}
+
+
+def test_daily_totals_never_lowered_by_stale_counters(memory_store):
+    from wallet.services import MAX_DAILY_DEPOSIT
+    memory_store.reference('wallets/user1').set({"balance": 100})
+    add_funds_service("user1", 10)
+
+    # Another process deposits; this process's counters still say 10
+    memory_store.reference(f'wallets/user1/daily_totals/{get_today_date()}/deposit').set(MAX_DAILY_DEPOSIT - 40)
+
+    add_funds_service("user1", 30)
+    assert memory_store.reference(f'wallets/user1/daily_totals/{get_today_date()}/deposit').get() == MAX_DAILY_DEPOSIT - 10
+
+    response, status = add_funds_service("user1", 20)
+    assert status == 400
+    assert response["data"]["daily_total"] == MAX_DAILY_DEPOSIT - 10
+    assert memory_store.reference('wallets/user1/balance').get() == 140
+
+
+def test_daily_limit_tracker_rollover_and_reconcile():
+    tracker = DailyLimitTracker(reconcile_seconds=3600, max_wallets=2)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return {"deposit": 10}
+
+    assert tracker.get_totals("user1", "2024-01-01", load) == {"deposit": 10}
+    tracker.record("user1", "2024-01-01", "deposit", 5)
+    assert tracker.get_totals("user1", "2024-01-01", load) == {"deposit": 15}
+    assert len(loads) == 1
+
+    # A new day starts from the persisted totals again
+    assert tracker.get_totals("user1", "2024-01-02", lambda: None) == {}
+
+    # Least recently used wallets are evicted beyond max_wallets
+    tracker.get_totals("user2", "2024-01-02", lambda: None)
+    tracker.get_totals("user3", "2024-01-02", lambda: None)
+    tracker.get_totals("user1", "2024-01-02", load)
+    assert len(loads) == 2
+
+    tracker.reconcile_seconds = 0
+    tracker.record("user1", "2024-01-02", "deposit", 20)
+    # Reconciliation keeps whichever of the local and persisted totals is higher
+    assert tracker.get_totals("user1", "2024-01-02", load) == {"deposit": 30}
+
+
+def test_concurrent_entry_fees_never_overdraw(memory_store):
+    from concurrent.futures import ThreadPoolExecutor
+    memory_store.reference('wallets/user1').set({"balance": 50})
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: deduct_entry_fee("user1", "contest_1", 10), range(20)))
+
+    successes = [result for result in results if isinstance(result, dict) and result.get("success")]
+    assert len(successes) == 5
+    assert memory_store.reference('wallets/user1/balance').get() == 0
+    assert len(memory_store.reference('wallets/user1/transactions').get()) == 5
+
+
+def test_credit_winnings_retries_on_concurrent_write():
+    class InterferingStore(MemoryStore):
+        """Simulates another process changing the balance before the first write."""
+        interfered = False
+
+        def compare_and_set(self, segments, expected_etag, value):
+            if not self.interfered:
+                self.interfered = True
+                self.write(['wallets', 'user1', 'balance'], 500)
+            return super().compare_and_set(segments, expected_etag, value)
+
+    store = InterferingStore()
+    previous = set_store(store)
+    try:
+        store.reference('wallets/user1').set({"balance": 100})
+        result = credit_winnings_service("user1", "contest_1", 50)
+        assert result["balance"] == 550
+        assert store.reference('wallets/user1/balance').get() == 550
+    finally:
+        set_store(previous)
+
+
+def test_transaction_history_pages_by_cursor(memory_store):
+    transactions = {
+        f"txn{i:02d}": {"type": "deposit", "amount": i, "timestamp": f"2025-01-{i:02d}T12:00:00"}
+        for i in range(1, 11)
+    }
+    memory_store.reference('wallets/user1').set({"balance": 55, "transactions": transactions})
+
+    first = get_transaction_history_service("user1", limit=4)
+    assert [t["details"]["amount"] for t in first["data"]] == [10, 9, 8, 7]
+    assert first["pagination"]["prev_cursor"] is None
+
+    second = get_transaction_history_service("user1", limit=4, before=first["pagination"]["next_cursor"])
+    assert [t["details"]["amount"] for t in second["data"]] == [6, 5, 4, 3]
+
+    last = get_transaction_history_service("user1", limit=4, before=second["pagination"]["next_cursor"])
+    assert [t["details"]["amount"] for t in last["data"]] == [2, 1]
+    assert last["pagination"]["next_cursor"] is None
+
+    back = get_transaction_history_service("user1", limit=4, after=last["pagination"]["prev_cursor"])
+    assert [t["details"]["amount"] for t in back["data"]] == [6, 5, 4, 3]
+
+
+def test_transaction_history_date_range(memory_store):
+    memory_store.reference('wallets/user1/transactions').set({
+        "a": {"amount": 1, "timestamp": "2025-01-01T10:00:00"},
+        "b": {"amount": 2, "timestamp": "2025-01-02T10:00:00"},
+        "c": {"amount": 3, "timestamp": "2025-01-02T23:00:00"},
+        "d": {"amount": 4, "timestamp": "2025-01-03T10:00:00"},
+    })
+    result = get_transaction_history_service("user1", start_date="2025-01-02", end_date="2025-01-02")
+    assert [t["id"] for t in result["data"]] == ["c", "b"]
+
+
+def test_transaction_history_invalid_cursor(memory_store):
+    response, status = get_transaction_history_service("user1", before="not-a-cursor")
+    assert status == 400
+
+
+# --- Segmented ledger ---
+
+import datetime
+import json
+import wallet.ledger as ledger
+
+
+@pytest.fixture
+def segmented_ledger(monkeypatch, memory_store):
+    monkeypatch.setattr(ledger, "LEDGER_MODE", "segmented")
+    return memory_store
+
+
+def test_segmented_ledger_appends_to_monthly_segment(segmented_ledger):
+    add_funds_service("user1", 100)
+    wallet = segmented_ledger.reference('wallets/user1').get()
+    assert "transactions" not in wallet
+    (segment,) = wallet["ledger"].keys()
+    assert segment == datetime.datetime.utcnow().strftime('%Y-%m')
+
+
+def test_history_spans_segments_and_legacy_entries(segmented_ledger):
+    segmented_ledger.reference('wallets/user1').set({
+        "balance": 60,
+        "transactions": {"old": {"type": "deposit", "amount": 10, "timestamp": "2024-12-31T10:00:00"}},
+        "ledger": {
+            "2025-01": {"a": {"type": "deposit", "amount": 20, "timestamp": "2025-01-05T10:00:00"}},
+            "2025-02": {"b": {"type": "deposit", "amount": 30, "timestamp": "2025-02-05T10:00:00"}},
+        },
+    })
+    first = get_transaction_history_service("user1", limit=2)
+    assert [t["id"] for t in first["data"]] == ["b", "a"]
+    second = get_transaction_history_service("user1", limit=2, before=first["pagination"]["next_cursor"])
+    assert [t["id"] for t in second["data"]] == ["old"]
+    assert second["pagination"]["next_cursor"] is None
+
+
+def test_compaction_folds_old_segments(segmented_ledger):
+    segmented_ledger.reference('wallets/user1').set({
+        "balance": 45,
+        "transactions": {"old": {"type": "deposit", "amount": 10, "timestamp": "2024-11-02T10:00:00"}},
+        "ledger": {
+            "2025-01": {"a": {"type": "deposit", "amount": 50, "timestamp": "2025-01-05T10:00:00"},
+                        "b": {"type": "withdrawal", "amount": 20, "timestamp": "2025-01-06T10:00:00"}},
+            "2025-03": {"c": {"type": "contest_entry", "amount": -5, "timestamp": "2025-03-05T10:00:00"},
+                        "d": {"type": "deposit", "amount": 10, "timestamp": "2025-03-06T10:00:00"}},
+        },
+    })
+    wallet_ref = segmented_ledger.reference('wallets/user1')
+    assert ledger.get_ledger_balance(wallet_ref) == 45
+
+    result = ledger.compact_wallet("user1", retained_segments=1, now=datetime.datetime(2025, 3, 20))
+    assert result["folded_segments"] == 2
+    assert result["folded_transactions"] == 3
+
+    wallet = wallet_ref.get()
+    assert list(wallet["ledger"].keys()) == ["2025-03"]
+    assert "transactions" not in wallet
+    assert wallet["archive"]["2025-01"]["net"] == 30
+    assert wallet["archive"]["2024-11"]["count"] == 1
+    assert wallet["checkpoint"]["balance"] == 40
+    assert ledger.get_ledger_balance(wallet_ref) == wallet["balance"]
+
+
+# --- Idempotency keys ---
+
+def access_token(user_id):
+    import jwt
+    from middleware import JWT_SECRET, JWT_ALGORITHM
+    return jwt.encode({"user_id": user_id}, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+
+def test_add_funds_idempotency_key_replays_response(client, memory_store):
+    from middleware import idempotency_store
+    idempotency_store.clear()
+    memory_store.reference('wallets/user1').set({"balance": 100})
+    payload = {"user_id": "user1", "amount": 25}
+    headers = {"Idempotency-Key": "retry-1", "access-token": access_token("alice")}
+
+    first = client.post("/wallet/add-funds", json=payload, headers=headers)
+    second = client.post("/wallet/add-funds", json=payload, headers=headers)
+
+    assert first.get_json() == second.get_json()
+    assert second.headers.get("Idempotent-Replayed") == "true"
+    assert memory_store.reference('wallets/user1/balance').get() == 125
+
+    reused = client.post("/wallet/add-funds", json={"user_id": "user1", "amount": 30}, headers=headers)
+    assert reused.status_code == 422
+
+
+def test_idempotency_key_scoped_to_caller(client, memory_store):
+    from middleware import idempotency_store
+    idempotency_store.clear()
+    memory_store.reference('wallets/user1').set({"balance": 100})
+    payload = {"user_id": "user1", "amount": 25}
+
+    for caller in ("alice", "bob"):
+        response = client.post("/wallet/add-funds", json=payload,
+                               headers={"Idempotency-Key": "shared", "Authorization": f"Bearer {access_token(caller)}"})
+        assert response.headers.get("Idempotent-Replayed") is None
+    assert memory_store.reference('wallets/user1/balance').get() == 150
+
+    # Without a verified caller the key is refused instead of shared
+    for headers in ({}, {"access-token": "forged"}):
+        response = client.post("/wallet/add-funds", json=payload, headers=dict(headers, **{"Idempotency-Key": "shared"}))
+        assert response.status_code == 400
+    assert memory_store.reference('wallets/user1/balance').get() == 150
+
+
+def test_contest_join_idempotency_key_scoped_to_user(memory_store):
+    from contest.routes import contest_bp
+    from middleware import idempotency_store
+    idempotency_store.clear()
+    app = Flask(__name__)
+    app.register_blueprint(contest_bp, url_prefix="/contest")
+    client = app.test_client()
+    memory_store.reference('users').set({"alice": {"username": "alice"}, "bob": {"username": "bob"}})
+
+    responses = {}
+    for caller, contest_id in (("alice", "c1"), ("bob", "c2")):
+        responses[caller] = client.post("/contest/join", json={"contest_id": contest_id},
+                                        headers={"Idempotency-Key": "join-1", "access-token": access_token(caller)})
+    assert responses["bob"].status_code == 404
+    assert responses["bob"].headers.get("Idempotent-Replayed") is None
+
+    replay = client.post("/contest/join", json={"contest_id": "c1"},
+                         headers={"Idempotency-Key": "join-1", "access-token": access_token("alice")})
+    assert replay.headers.get("Idempotent-Replayed") == "true"
+
+
+def test_idempotency_store_bounded_and_expiring():
+    from middleware import IdempotencyStore
+    store = IdempotencyStore(max_entries=2, ttl_seconds=60)
+    store.put("a", 1)
+    store.put("b", 2)
+    store.put("c", 3)
+    assert store.get("a") is None
+    assert store.get("c") == 3
+
+    expired = IdempotencyStore(max_entries=2, ttl_seconds=0)
+    expired.put("a", 1)
+    assert expired.get("a") is None
+
+
+def test_apply_batch_service(memory_store):
+    from wallet.services import apply_batch_service
+    memory_store.reference('wallets').set({
+        "user1": {"balance": 100},
+        "user2": {"balance": 5}
+    })
+
+    result = apply_batch_service([
+        {"user_id": "user1", "amount": 50, "reason": "contest_winnings", "contest_id": "c1"},
+        {"user_id": "user2", "amount": -10, "reason": "adjustment"},
+        {"user_id": "user1", "amount": -30},
+        {"user_id": "user3", "amount": 0},
+        {"user_id": "user4", "amount": 20, "reason": "contest_refund"},
+    ])
+
+    assert result["success"] is False
+    assert result["data"]["succeeded"] == 3
+    outcomes = result["data"]["results"]
+    assert [outcome["success"] for outcome in outcomes] == [True, False, True, False, True]
+    assert outcomes[1]["error"] == "Insufficient balance."
+
+    wallets = memory_store.reference('wallets').get()
+    assert wallets["user1"]["balance"] == 120
+    assert wallets["user2"]["balance"] == 5
+    assert wallets["user4"]["balance"] == 20
+    types = sorted(transaction["type"] for transaction in wallets["user1"]["transactions"].values())
+    assert types == ["batch_debit", "contest_winnings"]
+
+
+def test_batch_route_requires_admin(client, memory_store):
+    memory_store.reference('users').set({"alice": {"role": "user"}, "root": {"role": "admin"}})
+    payload = {"items": [{"user_id": "user1", "amount": 50, "reason": "contest_refund"}]}
+
+    assert client.post("/wallet/batch", json=payload).status_code == 401
+    assert client.post("/wallet/batch", json=payload, headers={"access-token": access_token("alice")}).status_code == 403
+    assert memory_store.reference('wallets/user1').get() is None
+
+    response = client.post("/wallet/batch", json=payload, headers={"access-token": access_token("root")})
+    assert response.status_code == 200
+    assert memory_store.reference('wallets/user1/balance').get() == 50
+
+
+def test_apply_batch_service_failed_write_leaves_wallet_untouched(memory_store, monkeypatch):
+    from wallet.services import apply_batch_service
+    memory_store.reference('wallets').set({"user1": {"balance": 10}, "user2": {"balance": 10}})
+    items = [{"user_id": "user1", "amount": 50, "reason": "contest_refund"},
+             {"user_id": "user2", "amount": 5, "reason": "contest_refund"}]
+
+    original = memory_store.compare_and_set
+
+    def failing_compare_and_set(segments, expected_etag, value):
+        if segments == ['wallets', 'user1', 'balance']:
+            raise RuntimeError("write failed")
+        return original(segments, expected_etag, value)
+
+    monkeypatch.setattr(memory_store, "compare_and_set", failing_compare_and_set)
+    result = apply_batch_service(items)
+
+    assert [outcome["success"] for outcome in result["data"]["results"]] == [False, True]
+    wallets = memory_store.reference('wallets').get()
+    # Only the recovery marker of the failed mutation is left behind
+    assert wallets["user1"]["balance"] == 10 and "transactions" not in wallets["user1"]
+    assert len(wallets["user1"]["pending"]) == 1
+    assert wallets["user2"]["balance"] == 15
+
+    # Retrying only the failed item credits it exactly once
+    monkeypatch.setattr(memory_store, "compare_and_set", original)
+    assert apply_batch_service(items[:1])["success"] is True
+    wallet = memory_store.reference('wallets/user1').get()
+    assert wallet["balance"] == 60
+    assert len(wallet["transactions"]) == 1
+
+
+def test_apply_batch_service_idempotency_key(memory_store):
+    from wallet.services import apply_batch_service
+    item = {"user_id": "user1", "amount": 10, "reason": "contest_refund", "idempotency_key": "contest_refund:c1"}
+
+    first = apply_batch_service([item])["data"]["results"][0]
+    second = apply_batch_service([item, dict(item)])["data"]["results"]
+
+    assert [result.get("already_applied") for result in second] == [True, True]
+    assert second[0]["transaction_id"] == first["transaction_id"]
+    assert memory_store.reference('wallets/user1/balance').get() == 10
+
+    # Keys that only differ in characters a database key cannot hold stay distinct
+    similar = [dict(item, idempotency_key=key) for key in ("refund/c.1", "refund_c_1", "refund_c.1")]
+    assert not any(result.get("already_applied") for result in apply_batch_service(similar)["data"]["results"])
+    assert memory_store.reference('wallets/user1/balance').get() == 40
+
+
+def test_applied_idempotency_keys_expire(memory_store):
+    from wallet.services import apply_batch_service, hash_idempotency_key
+    old, kept = hash_idempotency_key("contest_refund:old"), hash_idempotency_key("contest_refund:kept")
+    memory_store.reference('wallets/user1').set({"balance": 0, "applied": {
+        old: {"transaction_id": "t1", "timestamp": "2020-01-01T00:00:00"},
+        kept: {"transaction_id": "t2", "timestamp": "2999-01-01T00:00:00"},
+    }})
+    apply_batch_service([{"user_id": "user1", "amount": 10, "reason": "contest_refund", "idempotency_key": "contest_refund:c1"}])
+
+    applied = memory_store.reference('wallets/user1/applied').get()
+    assert set(applied) == {kept, hash_idempotency_key("contest_refund:c1")}
+
+
+def test_apply_batch_service_many_wallets(memory_store):
+    from wallet.services import apply_batch_service
+    items = [{"user_id": f"user{i}", "amount": 10, "reason": "contest_refund"} for i in range(2000)]
+
+    result = apply_batch_service(items)
+
+    assert result["success"] is True
+    wallets = memory_store.reference('wallets').get()
+    assert len(wallets) == 2000
+    assert all(wallet["balance"] == 10 for wallet in wallets.values())
+
+
+def test_get_balance_reads_only_balance_leaf(memory_store):
+    from wallet.services import get_balance_service
+    memory_store.reference('wallets/user1').set({"balance": 100, "transactions": {"t1": {"amount": 100}}})
+
+    reads = []
+    original_read = memory_store.read
+    memory_store.read = lambda segments: reads.append(list(segments)) or original_read(segments)
+
+    assert get_balance_service("user1")["data"]["balance"] == 100
+    assert get_balance_service("user1")["data"]["balance"] == 100
+    # The second call is served from the cache
+    assert reads == [["wallets", "user1", "balance"]]
+
+
+def test_wallet_mutations_write_through_balance_cache(memory_store):
+    from wallet.services import get_balance_service
+    memory_store.reference('wallets/user1').set({"balance": 100})
+    assert get_balance_service("user1")["data"]["balance"] == 100
+
+    add_funds_service("user1", 25)
+    deduct_entry_fee("user1", "contest_1", 10)
+    assert balance_cache.get("user1") == (True, 115)
+    assert get_balance_service("user1")["data"]["balance"] == 115
+
+
+def test_balance_cache_ttl_and_bound():
+    cache = BalanceCache(ttl_seconds=0, max_entries=2)
+    cache.set("user1", 10)
+    assert cache.get("user1") == (False, None)
+
+    cache.ttl_seconds = 60
+    for user in ("user1", "user2", "user3"):
+        cache.set(user, 10)
+    assert cache.get("user1") == (False, None)
+    assert cache.get("user3") == (True, 10)
+
+    # A read result never replaces a fresh write-through value
+    cache.add("user3", 5)
+    assert cache.get("user3") == (True, 10)
+
+
+def test_export_transactions_streams_all_pages(memory_store, client, monkeypatch):
+    import wallet.services as wallet_services
+    monkeypatch.setattr(wallet_services, "EXPORT_PAGE_SIZE", 2)
+    memory_store.reference('wallets/user1/transactions').set({
+        f"t{i}": {"type": "deposit", "amount": i, "timestamp": f"2024-01-0{i}T00:00:00"} for i in range(1, 6)
+    })
+
+    response = client.get("/wallet/transactions/export?user_id=user1")
+    assert response.status_code == 200
+    assert response.is_streamed
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line["id"] for line in lines] == ["t5", "t4", "t3", "t2", "t1"]
+
+    response = client.get("/wallet/transactions/export?user_id=user1&format=csv&from=2024-01-02&to=2024-01-03")
+    assert response.content_type.startswith("text/csv")
+    assert response.get_data(as_text=True).splitlines() == [
+        "id,timestamp,type,amount,contest_id",
+        "t3,2024-01-03T00:00:00,deposit,3,",
+        "t2,2024-01-02T00:00:00,deposit,2,",
+    ]
+
+
+# --- Reconciliation ---
+
+def test_reconcile_wallets_reports_and_repairs(memory_store, tmp_path):
+    from wallet.reconcile import reconcile_wallets, index_wallet_keys
+    memory_store.reference('wallets').set({
+        "user1": {"balance": 70, "transactions": {
+            "t1": {"type": "deposit", "amount": 100}, "t2": {"type": "withdrawal", "amount": 30}
+        }},
+        "user2": {"balance": 999, "transactions": {"t1": {"type": "contest_winnings", "amount": 40}}},
+    })
+    assert index_wallet_keys(page_size=1) == 2
+    # New wallets join the key index on their first mutation
+    add_funds_service("user3", 10)
+    deduct_funds_service("user3", 10)
+    assert memory_store.reference('wallet_keys').get() == {"user1": True, "user2": True, "user3": True}
+    checkpoint_file = str(tmp_path / "checkpoint.json")
+    report_file = str(tmp_path / "report.ndjson")
+
+    stats = reconcile_wallets(workers=2, page_size=1, checkpoint_file=checkpoint_file, report_file=report_file)
+    assert (stats["wallets"], stats["ok"], stats["mismatch"]) == (3, 2, 1)
+    assert json.loads(open(report_file).read())["wallet"] == "user2"
+
+    stats = reconcile_wallets(workers=2, page_size=1, repair=True, checkpoint_file=checkpoint_file)
+    assert stats["repaired"] == 1
+    assert memory_store.reference('wallets/user2/balance').get() == 40
+
+
+def test_reconcile_recovers_interrupted_mutations(memory_store, monkeypatch):
+    import wallet.services
+    from wallet.reconcile import reconcile_wallet
+    memory_store.reference('wallets').set({
+        user_id: {"balance": 100, "transactions": {"t0": {"type": "deposit", "amount": 100}}}
+        for user_id in ("user1", "user2")
+    })
+
+    # Both mutations stop after their pending marker; only user1's balance write happens
+    def interrupted(wallet_ref, mutation_id, transactions):
+        raise RuntimeError("process stopped")
+
+    original = memory_store.compare_and_set
+
+    def failing_compare_and_set(segments, expected_etag, value):
+        if segments == ['wallets', 'user2', 'balance']:
+            raise RuntimeError("process stopped")
+        return original(segments, expected_etag, value)
+
+    monkeypatch.setattr(wallet.services, "finish_pending_mutation", interrupted)
+    monkeypatch.setattr(memory_store, "compare_and_set", failing_compare_and_set)
+    assert add_funds_service("user1", 50)[1] == 500
+    assert add_funds_service("user2", 50)[1] == 500
+    monkeypatch.undo()
+
+    # Markers of mutations that may still be running are left alone
+    assert reconcile_wallet("user1", repair=True)["status"] == "changed"
+    for user_id in ("user1", "user2"):
+        for mutation_id in memory_store.reference(f'wallets/{user_id}/pending').get():
+            memory_store.reference(f'wallets/{user_id}/pending/{mutation_id}/timestamp').set("2024-01-01T00:00:00")
+    assert reconcile_wallet("user1")["status"] == "interrupted"
+
+    assert reconcile_wallet("user1", repair=True)["status"] == "recovered"
+    assert reconcile_wallet("user2", repair=True)["status"] == "recovered"
+    user1, user2 = memory_store.reference('wallets/user1').get(), memory_store.reference('wallets/user2').get()
+    assert user1["balance"] == 150 and [t["amount"] for t in user1["transactions"].values()] == [100, 50]
+    assert user2["balance"] == 100 and len(user2["transactions"]) == 1
+    assert "pending" not in user1 and "pending" not in user2
+
+
+def test_reconcile_wallets_resumes_from_checkpoint(memory_store, tmp_path):
+    from wallet.reconcile import reconcile_wallets, save_checkpoint, index_wallet_keys
+    memory_store.reference('wallets').set({f"user{i}": {"balance": 0} for i in range(5)})
+    index_wallet_keys()
+    checkpoint_file = str(tmp_path / "checkpoint.json")
+    save_checkpoint(checkpoint_file, "user2", {"wallets": 3, "ok": 3})
+
+    stats = reconcile_wallets(page_size=2, checkpoint_file=checkpoint_file, resume=True)
+    assert stats["wallets"] == 5
+    assert json.load(open(checkpoint_file))["last_key"] == "user4"
+
+
+# --- Cold-storage archival ---
+
+@pytest.mark.parametrize("store_name", ["node", "files"])
+def test_archive_wallet_keeps_history_and_balance(memory_store, tmp_path, monkeypatch, store_name):
+    import wallet.archive
+    from wallet.services import get_transaction_history_service
+    monkeypatch.setattr(wallet.archive, "ARCHIVE_DIR", str(tmp_path))
+    archive = wallet.archive.get_archive(store_name)
+    memory_store.reference('wallets/user1').set({
+        "balance": 150,
+        "transactions": {
+            "t1": {"type": "deposit", "amount": 100, "timestamp": "2023-01-05T00:00:00"},
+            "t2": {"type": "withdrawal", "amount": 20, "timestamp": "2023-02-05T00:00:00"},
+            "t3": {"type": "deposit", "amount": 70, "timestamp": "2024-06-05T00:00:00"},
+        }
+    })
+
+    result = wallet.archive.archive_wallet("user1", older_than_days=365, now=datetime.datetime(2024, 7, 1), archive=archive)
+    assert result == {"archived_segments": 2, "archived_transactions": 2}
+
+    wallet = memory_store.reference('wallets/user1').get()
+    assert list(wallet["transactions"]) == ["t3"]
+    assert wallet["archive"]["2023-01"]["cold_storage"] == store_name
+    assert ledger.get_ledger_balance(memory_store.reference('wallets/user1')) == 150
+
+    # History pages from the live ledger into the archive
+    page = get_transaction_history_service("user1", limit=2)
+    assert [item["id"] for item in page["data"]] == ["t3", "t2"]
+    older = get_transaction_history_service("user1", limit=2, before=page["pagination"]["next_cursor"])
+    assert [item["id"] for item in older["data"]] == ["t1"]
+    assert older["pagination"]["next_cursor"] is None
@@ -1,6 +1,7 @@
 
 import firebase_admin
-from firebase_admin import credentials, db
+from firebase_admin import credentials
+from storage.backend import reference
 import jwt
 from flask import request, jsonify
 from functools import wraps
@@ -32,7 +33,7 @@ def token_required(f):
             if data is None:
                 print("missing")
             print(data)
-            user_ref = db.reference(f'users/{data["user_id"]}').get()
+            user_ref = reference(f'users/{data["user_id"]}').get()
             if not user_ref:
                 raise ValueError("User not found")
             current_user = user_ref
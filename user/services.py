@@ -2,10 +2,9 @@ import bcrypt
 import jwt
 import datetime
 from flask import jsonify, request
-from firebase_admin import db
 import re
 from datetime import datetime, timedelta
-from user.models import get_firebase_app
+from storage.backend import reference
 from utils import standardize_response
 from logging_utils import setup_logger
 
@@ -15,8 +14,6 @@ logger = setup_logger("user_services")
 # Simulated in-memory store for tracking attempts (use Redis/DB in production)
 login_attempts = {}
 
-get_firebase_app()
-
 # Existing Functions
 def register_user(data):
     logger.info("Attempting to register a new user.")
@@ -42,7 +39,7 @@ def register_user(data):
         return standardize_response(False, message="Password must meet complexity requirements"), 400
 
     # Check for duplicate username or email
-    users = db.reference('users').get() or {}
+    users = reference('users').get() or {}
     for user in users.values():
         if user.get('username') == username:
             logger.warning("Registration failed: Username already exists.")
@@ -64,7 +61,7 @@ def register_user(data):
     }
 
     # Save user data to the database
-    user_ref = db.reference('users').push(user_data)
+    user_ref = reference('users').push(user_data)
 
     logger.info(f"User registered successfully with ID: {user_ref.key}")
     # Return successful registration response
@@ -103,7 +100,7 @@ def login_user(data):
     login_attempts[email]["last_attempt"] = now
 
     # Query the database for the user
-    users = db.reference('users').order_by_child('email').equal_to(email).get()
+    users = reference('users').order_by_child('email').equal_to(email).get()
     user = next(iter(users.values()), None)
 
     if not user or not bcrypt.checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
@@ -124,7 +121,7 @@ def login_user(data):
 def list_all_users():
     logger.info("Fetching all users.")
     try:
-        users = db.reference('users').get()
+        users = reference('users').get()
         if not users:
             logger.info("No users found in the database.")
             return standardize_response(True, data=[], message="No users found"), 200
@@ -255,7 +252,7 @@ def update_user_profile(current_user, data):
         updates['password'] = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
     # Apply updates
-    user_ref = db.reference(f'users/{current_user["id"]}')
+    user_ref = reference(f'users/{current_user["id"]}')
     user_ref.update(updates)
 
     logger.info("User profile updated successfully.")
@@ -0,0 +1,232 @@
+import argparse
+import base64
+import datetime
+import gzip
+import json
+import os
+import zlib
+from storage.backend import reference
+from storage.memory import MemoryStore
+from wallet.models import get_database_ref
+from wallet.concurrency import wallet_lock
+from wallet.ledger import get_segment_refs, segment_key, summarize_transactions, signed_amount
+from logging_utils import setup_logger
+
+# Set up logger
+logger = setup_logger("wallet_archive")
+
+# Where archived transactions go: 'node' stores compressed segments under
+# wallet_archive/<uid>/<YYYY-MM>, 'files' writes <dir>/<uid>/<YYYY-MM>.json.gz
+ARCHIVE_STORE = os.environ.get('DAMNPLAY_WALLET_ARCHIVE_STORE', 'node')
+ARCHIVE_DIR = os.environ.get('DAMNPLAY_WALLET_ARCHIVE_DIR', 'wallet_archive')
+
+# Transactions older than this many days are archived
+DEFAULT_ARCHIVE_AGE_DAYS = 365
+
+
+class NodeArchive:
+    """Archive segments stored as zlib compressed, base64 encoded JSON in the database."""
+
+    name = 'node'
+
+    def _ref(self, wallet_key, segment):
+        return reference('wallet_archive').child(wallet_key).child(segment)
+
+    def read_segment(self, wallet_key, segment):
+        node = self._ref(wallet_key, segment).get()
+        if not node:
+            return []
+        return json.loads(zlib.decompress(base64.b64decode(node['data'])))
+
+    def write_segment(self, wallet_key, segment, rows):
+        data = zlib.compress(json.dumps(rows, separators=(',', ':')).encode('utf-8'), 9)
+        self._ref(wallet_key, segment).set({
+            'encoding': 'zlib+base64',
+            'count': len(rows),
+            'data': base64.b64encode(data).decode('ascii')
+        })
+
+
+class FileArchive:
+    """Archive segments stored as gzipped JSON files, one per wallet and month."""
+
+    name = 'files'
+
+    def __init__(self, directory=None):
+        self.directory = directory or ARCHIVE_DIR
+
+    def _path(self, wallet_key, segment):
+        return os.path.join(self.directory, wallet_key, f'{segment}.json.gz')
+
+    def read_segment(self, wallet_key, segment):
+        path = self._path(wallet_key, segment)
+        if not os.path.exists(path):
+            return []
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def write_segment(self, wallet_key, segment, rows):
+        path = self._path(wallet_key, segment)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = path + '.tmp'
+        with gzip.open(temporary_path, 'wt', encoding='utf-8') as f:
+            json.dump(rows, f, separators=(',', ':'))
+        os.replace(temporary_path, path)
+
+
+def get_archive(name=None):
+    """Return the archive store selected by name or DAMNPLAY_WALLET_ARCHIVE_STORE."""
+    name = name or ARCHIVE_STORE
+    if name == 'node':
+        return NodeArchive()
+    if name == 'files':
+        return FileArchive()
+    raise ValueError(f"Unknown wallet archive store: {name}")
+
+
+class ArchivedSegmentRef:
+    """
+    Read-only reference to one archived segment.
+
+    The segment is decompressed on first query and loaded into an in-memory store,
+    so the history paging queries run against it unchanged.
+    """
+
+    def __init__(self, wallet_key, segment, archive):
+        self._wallet_key = wallet_key
+        self._segment = segment
+        self._archive = archive
+        self._ref = None
+
+    def _load(self):
+        if self._ref is None:
+            rows = self._archive.read_segment(self._wallet_key, self._segment)
+            store = MemoryStore()
+            if rows:
+                store.write([], {transaction_id: transaction for transaction_id, transaction in rows})
+            self._ref = store.reference()
+        return self._ref
+
+    def get(self, *args, **kwargs):
+        return self._load().get(*args, **kwargs)
+
+    def order_by_child(self, path):
+        return self._load().order_by_child(path)
+
+    def order_by_key(self):
+        return self._load().order_by_key()
+
+
+def get_history_refs(wallet_ref):
+    """
+    References to every location holding transactions, archived or live, oldest first.
+
+    Archived segments only hold transactions older than anything left in the live
+    ledger, so they come before the live locations.
+
+    :return: List of (segment key or None, reference) pairs
+    """
+    summaries = wallet_ref.child('archive').get() or {}
+    refs = []
+    for key in sorted(summaries):
+        store_name = summaries[key].get('cold_storage')
+        if store_name:
+            refs.append((key, ArchivedSegmentRef(wallet_ref.key, key, get_archive(store_name))))
+    return refs + get_segment_refs(wallet_ref)
+
+
+def archive_wallet(wallet_key, older_than_days=DEFAULT_ARCHIVE_AGE_DAYS, now=None, archive=None):
+    """
+    Move a wallet's transactions older than the given age into archived monthly segments.
+
+    The archived segments are written first; the live entries are then removed,
+    the 'archive/<segment>' summaries extended and the checkpoint balance moved
+    forward in one multi-path update, so ``balance == checkpoint + live
+    transactions`` keeps holding.
+
+    :param wallet_key: Key of the wallet node (the sanitized user ID)
+    :return: dict with the number of archived segments and transactions
+    """
+    archive = archive or get_archive()
+    now = now or datetime.datetime.utcnow()
+    cutoff = (now - datetime.timedelta(days=older_than_days)).isoformat()
+    wallet_ref = get_database_ref().child(wallet_key)
+
+    with wallet_lock(wallet_key):
+        updates = {}
+        by_segment = {}
+        for key, ref in get_segment_refs(wallet_ref):
+            old = ref.order_by_child('timestamp').end_at(cutoff).get() or {}
+            for transaction_id, transaction in old.items():
+                if (transaction.get('timestamp') or '') >= cutoff:
+                    continue
+                live_path = f'ledger/{key}/{transaction_id}' if key else f'transactions/{transaction_id}'
+                updates[live_path] = None
+                by_segment.setdefault(segment_key(transaction.get('timestamp')), []).append(
+                    [transaction_id, transaction]
+                )
+
+        if not by_segment:
+            return {"archived_segments": 0, "archived_transactions": 0}
+
+        archived_net = 0
+        summaries = wallet_ref.child('archive').get() or {}
+        for segment, rows in by_segment.items():
+            merged = {transaction_id: transaction for transaction_id, transaction in
+                      archive.read_segment(wallet_key, segment)}
+            merged.update((transaction_id, transaction) for transaction_id, transaction in rows)
+            archive.write_segment(
+                wallet_key,
+                segment,
+                sorted(([key, value] for key, value in merged.items()),
+                       key=lambda row: (row[1].get('timestamp', ''), row[0]))
+            )
+
+            summary = summarize_transactions((transaction for _, transaction in rows), summaries.get(segment))
+            summary['cold_storage'] = archive.name
+            updates[f'archive/{segment}'] = summary
+            archived_net += sum(signed_amount(transaction) for _, transaction in rows)
+
+        checkpoint = wallet_ref.child('checkpoint').get() or {}
+        updates['checkpoint'] = dict(
+            checkpoint,
+            balance=checkpoint.get('balance', 0) + archived_net,
+            updated_at=now.isoformat()
+        )
+        wallet_ref.update(updates)
+
+    archived_transactions = sum(len(rows) for rows in by_segment.values())
+    logger.info(f"Archived {archived_transactions} transactions of wallet {wallet_key} into {len(by_segment)} segments.")
+    return {"archived_segments": len(by_segment), "archived_transactions": archived_transactions}
+
+
+def archive_wallets(older_than_days=DEFAULT_ARCHIVE_AGE_DAYS, now=None, archive=None):
+    """
+    Run archive_wallet for every wallet.
+
+    :return: dict with totals across all wallets
+    """
+    archive = archive or get_archive()
+    totals = {"wallets": 0, "archived_segments": 0, "archived_transactions": 0}
+    wallet_keys = get_database_ref().get(shallow=True) or {}
+    for wallet_key in wallet_keys:
+        try:
+            result = archive_wallet(wallet_key, older_than_days, now, archive)
+        except Exception as e:
+            logger.error(f"Failed to archive wallet {wallet_key}: {e}")
+            continue
+        totals["wallets"] += 1
+        totals["archived_segments"] += result["archived_segments"]
+        totals["archived_transactions"] += result["archived_transactions"]
+    logger.info(f"Wallet archival finished: {totals}")
+    return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move old wallet transactions into compressed archive segments.")
+    parser.add_argument('--older-than-days', type=int, default=DEFAULT_ARCHIVE_AGE_DAYS,
+                        help="Archive transactions older than this many days.")
+    parser.add_argument('--store', choices=['node', 'files'], default=None,
+                        help="Archive store (defaults to DAMNPLAY_WALLET_ARCHIVE_STORE).")
+    args = parser.parse_args()
+    print(archive_wallets(older_than_days=args.older_than_days, archive=get_archive(args.store)))
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+# How long a cached balance is served before it is read again
+BALANCE_CACHE_TTL_SECONDS = 5
+
+# Maximum number of balances kept in memory
+BALANCE_CACHE_MAX_ENTRIES = 50000
+
+
+class BalanceCache:
+    """
+    Bounded LRU cache of wallet balances with a per-entry TTL.
+
+    Wallet mutations in this process write their new balance through the cache, so
+    it is exact for them; the TTL bounds how long a change made by another process
+    can go unnoticed.
+    """
+
+    def __init__(self, ttl_seconds=BALANCE_CACHE_TTL_SECONDS, max_entries=BALANCE_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, wallet_key):
+        """
+        :return: (hit, balance)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(wallet_key)
+            if entry is None:
+                return False, None
+            balance, expires_at = entry
+            if expires_at <= now:
+                del self._entries[wallet_key]
+                return False, None
+            self._entries.move_to_end(wallet_key)
+            return True, balance
+
+    def set(self, wallet_key, balance):
+        """
+        Store the balance a mutation has just written.
+        """
+        with self._lock:
+            self._store(wallet_key, balance)
+
+    def add(self, wallet_key, balance):
+        """
+        Store a balance read from the database unless a fresher one was written
+        while the read was in flight.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(wallet_key)
+            if entry is not None and entry[1] > now:
+                return
+            self._store(wallet_key, balance)
+
+    def invalidate(self, wallet_key):
+        with self._lock:
+            self._entries.pop(wallet_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, wallet_key, balance):
+        self._entries[wallet_key] = (balance, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(wallet_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Shared cache for the wallet services
+balance_cache = BalanceCache()
@@ -0,0 +1,53 @@
+import threading
+import zlib
+from contextlib import contextmanager, ExitStack
+
+# Number of lock stripes shared by all wallets in this process
+WALLET_LOCK_STRIPES = 256
+
+# Number of compare-and-set attempts before a balance update gives up
+MAX_BALANCE_RETRIES = 5
+
+_wallet_locks = [threading.Lock() for _ in range(WALLET_LOCK_STRIPES)]
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when a balance keeps changing underneath a compare-and-set update."""
+
+
+def get_lock_stripe(sanitized_user_id):
+    """Return the index of the lock stripe a wallet maps to."""
+    return zlib.crc32(sanitized_user_id.encode('utf-8')) % WALLET_LOCK_STRIPES
+
+
+def get_wallet_lock(sanitized_user_id):
+    """
+    Return the lock stripe guarding a wallet.
+
+    Wallets are spread over a fixed number of locks by a stable hash of the
+    sanitized user ID, so updates to the same wallet are serialized while
+    updates to different wallets can run in parallel.
+    """
+    return _wallet_locks[get_lock_stripe(sanitized_user_id)]
+
+
+@contextmanager
+def wallet_lock(sanitized_user_id):
+    """Hold the lock stripe for a wallet for the duration of the block."""
+    with get_wallet_lock(sanitized_user_id):
+        yield
+
+
+@contextmanager
+def wallet_locks(sanitized_user_ids):
+    """
+    Hold the lock stripes for several wallets for the duration of the block.
+
+    Each stripe is taken once, in stripe order, so concurrent batches touching
+    overlapping stripes cannot deadlock.
+    """
+    stripes = sorted({get_lock_stripe(user_id) for user_id in sanitized_user_ids})
+    with ExitStack() as stack:
+        for stripe in stripes:
+            stack.enter_context(_wallet_locks[stripe])
+        yield
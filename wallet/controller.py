@@ -1,9 +1,12 @@
-from flask import request
+from flask import request, Response, stream_with_context
 from wallet.services import (
     add_funds_service,
     deduct_funds_service,
     get_balance_service,
-    get_transaction_history_service
+    get_transaction_history_service,
+    apply_batch_service,
+    export_transactions_service,
+    DEFAULT_HISTORY_PAGE_SIZE
 )
 from utils import standardize_response  # Import the standardize_response utility
 
@@ -106,7 +109,23 @@ def get_transaction_history_controller():
                 success=False
             )
 
-        result = get_transaction_history_service(user_id)
+        try:
+            limit = int(request.args.get('limit', DEFAULT_HISTORY_PAGE_SIZE))
+        except ValueError:
+            return standardize_response(
+                data={"details": "Limit must be an integer."},
+                message="Failed to fetch transaction history",
+                success=False
+            )
+
+        result = get_transaction_history_service(
+            user_id,
+            limit=limit,
+            before=request.args.get('before'),
+            after=request.args.get('after'),
+            start_date=request.args.get('from') or request.args.get('start_date'),
+            end_date=request.args.get('to') or request.args.get('end_date')
+        )
         return result#standardize_response(
         #     data=result,
         #     message="Transaction history fetched successfully",
@@ -118,3 +137,63 @@ def get_transaction_history_controller():
             message="Failed to fetch transaction history",
             success=False
         )
+
+def export_transactions_controller():
+    """
+    Controller to handle streaming the full transaction history of a wallet.
+    """
+    try:
+        user_id = request.args.get('user_id')
+
+        if not user_id:
+            return standardize_response(
+                data={"details": "User ID is required."},
+                message="Failed to export transactions",
+                success=False
+            )
+
+        result = export_transactions_service(
+            user_id,
+            export_format=request.args.get('format', 'ndjson'),
+            start_date=request.args.get('from') or request.args.get('start_date'),
+            end_date=request.args.get('to') or request.args.get('end_date')
+        )
+        if isinstance(result, tuple):
+            return result
+
+        export = result["data"]
+        return Response(
+            stream_with_context(export["rows"]),
+            content_type=export["content_type"],
+            headers={"Content-Disposition": f'attachment; filename="{export["filename"]}"'}
+        )
+    except Exception as e:
+        return standardize_response(
+            data={"details": str(e)},
+            message="Failed to export transactions",
+            success=False
+        )
+
+def batch_controller():
+    """
+    Controller to handle a batch of credits and debits.
+    """
+    try:
+        data = request.get_json() or {}
+        items = data.get('items')
+
+        if not isinstance(items, list) or not items:
+            return standardize_response(
+                data={"details": "A non-empty list of items is required."},
+                message="Failed to apply wallet batch",
+                success=False
+            )
+
+        result = apply_batch_service(items)
+        return result
+    except Exception as e:
+        return standardize_response(
+            data={"details": str(e)},
+            message="Failed to apply wallet batch",
+            success=False
+        )
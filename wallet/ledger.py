@@ -0,0 +1,245 @@
+import argparse
+import datetime
+import os
+from wallet.models import get_database_ref
+from wallet.concurrency import wallet_lock
+from logging_utils import setup_logger
+
+# Set up logger
+logger = setup_logger("wallet_ledger")
+
+# Ledger layout: 'flat' keeps every transaction under wallets/<uid>/transactions,
+# 'segmented' appends them to monthly segments under wallets/<uid>/ledger/<YYYY-MM>
+LEDGER_MODE = os.environ.get('DAMNPLAY_WALLET_LEDGER_MODE', 'flat')
+
+# Number of most recent monthly segments compaction keeps in full
+DEFAULT_RETAINED_SEGMENTS = 3
+
+
+def is_segmented():
+    return LEDGER_MODE == 'segmented'
+
+
+def segment_key(timestamp):
+    """
+    Return the monthly segment ('YYYY-MM') an ISO timestamp belongs to.
+    """
+    return (timestamp or '')[:7] or 'unknown'
+
+
+def ledger_entry_path(transaction_id, timestamp):
+    """
+    Path of a new ledger entry relative to the wallet node.
+    """
+    if is_segmented():
+        return f'ledger/{segment_key(timestamp)}/{transaction_id}'
+    return f'transactions/{transaction_id}'
+
+
+def signed_amount(transaction):
+    """
+    Effect of a transaction on the balance. Withdrawals are stored with a positive
+    amount, every other type already carries its sign.
+    """
+    amount = transaction.get('amount', 0) or 0
+    if transaction.get('type') == 'withdrawal':
+        return -abs(amount)
+    return amount
+
+
+def get_segment_refs(wallet_ref):
+    """
+    References to every location holding live transactions, oldest first.
+
+    The flat 'transactions' node always comes first: in segmented mode it only
+    holds entries written before the switch, which are older than any segment.
+
+    :return: List of (segment key or None, reference) pairs
+    """
+    refs = [(None, wallet_ref.child('transactions'))]
+    if is_segmented():
+        segments = wallet_ref.child('ledger').get(shallow=True) or {}
+        refs.extend((key, wallet_ref.child('ledger').child(key)) for key in sorted(segments))
+    return refs
+
+
+def summarize_transactions(transactions, summary=None):
+    """
+    Fold transactions into a segment summary, optionally extending an existing one.
+    """
+    summary = dict(summary or {'count': 0, 'credits': 0, 'debits': 0, 'net': 0})
+    for transaction in transactions:
+        amount = signed_amount(transaction)
+        timestamp = transaction.get('timestamp')
+        summary['count'] += 1
+        summary['net'] += amount
+        if amount >= 0:
+            summary['credits'] += amount
+        else:
+            summary['debits'] += -amount
+        if timestamp:
+            if not summary.get('first_timestamp') or timestamp < summary['first_timestamp']:
+                summary['first_timestamp'] = timestamp
+            if not summary.get('last_timestamp') or timestamp > summary['last_timestamp']:
+                summary['last_timestamp'] = timestamp
+    return summary
+
+
+def get_cutoff_segment(now=None, retained_segments=DEFAULT_RETAINED_SEGMENTS):
+    """
+    Oldest segment compaction keeps; every older segment is folded.
+    """
+    now = now or datetime.datetime.utcnow()
+    year, month = now.year, now.month - (max(1, retained_segments) - 1)
+    while month <= 0:
+        month += 12
+        year -= 1
+    return f'{year:04d}-{month:02d}'
+
+
+def iter_ledger_transactions(ref, page_size):
+    """
+    Yield the transactions under a ledger location in key order, reading at most
+    `page_size` of them per query.
+    """
+    last_key = None
+    while True:
+        query = ref.order_by_key()
+        if last_key is None:
+            rows = list((query.limit_to_first(page_size).get() or {}).items())
+        else:
+            # start_at is inclusive, so fetch one extra row and drop the previous last key
+            rows = list((query.start_at(last_key).limit_to_first(page_size + 1).get() or {}).items())
+            rows = rows[1:] if rows and rows[0][0] == last_key else rows[:page_size]
+        for _, transaction in rows:
+            yield transaction
+        if len(rows) < page_size:
+            return
+        last_key = rows[-1][0]
+
+
+def get_ledger_balance(wallet_ref, page_size=None):
+    """
+    Balance implied by the ledger: the checkpoint balance plus the sum of every
+    live transaction written since that checkpoint.
+
+    :param page_size: Read transactions in pages of this size instead of all at once
+    """
+    checkpoint = wallet_ref.child('checkpoint').get() or {}
+    balance = checkpoint.get('balance', 0)
+    for _, ref in get_segment_refs(wallet_ref):
+        transactions = iter_ledger_transactions(ref, page_size) if page_size else (ref.get() or {}).values()
+        for transaction in transactions:
+            balance += signed_amount(transaction)
+    return balance
+
+
+def compact_wallet(wallet_key, retained_segments=DEFAULT_RETAINED_SEGMENTS, now=None):
+    """
+    Fold a wallet's old ledger segments into archived summaries.
+
+    Entries still in the flat 'transactions' node are moved into their monthly
+    segment first. Every segment older than the retained window is replaced by a
+    summary under 'archive/<segment>' and its net amount is added to the
+    checkpoint balance, so ``balance == checkpoint + live transactions`` keeps
+    holding. All changes are written in one multi-path update while the wallet's
+    lock is held.
+
+    :param wallet_key: Key of the wallet node (the sanitized user ID)
+    :return: dict with the number of folded segments and transactions
+    """
+    if not is_segmented():
+        logger.warning("Ledger compaction requires DAMNPLAY_WALLET_LEDGER_MODE=segmented.")
+        return {"folded_segments": 0, "folded_transactions": 0, "moved_transactions": 0}
+
+    wallet_ref = get_database_ref().child(wallet_key)
+    cutoff = get_cutoff_segment(now, retained_segments)
+
+    # Serialized with the wallet's mutations, so no transaction is written to a
+    # segment between reading it and deleting it
+    with wallet_lock(wallet_key):
+        legacy = wallet_ref.child('transactions').get() or {}
+        legacy_by_segment = {}
+        for transaction_id, transaction in legacy.items():
+            legacy_by_segment.setdefault(segment_key(transaction.get('timestamp')), {})[transaction_id] = transaction
+
+        segment_keys = set(wallet_ref.child('ledger').get(shallow=True) or {})
+        updates = {}
+        folded_net = 0
+        folded_segments = []
+        folded_transactions = 0
+        moved_transactions = 0
+
+        for key in sorted(segment_keys | set(legacy_by_segment)):
+            if key >= cutoff:
+                # Retained segment: only move flat entries into it
+                for transaction_id, transaction in legacy_by_segment.get(key, {}).items():
+                    updates[f'ledger/{key}/{transaction_id}'] = transaction
+                    moved_transactions += 1
+                continue
+
+            transactions = list(legacy_by_segment.get(key, {}).values())
+            if key in segment_keys:
+                transactions.extend((wallet_ref.child('ledger').child(key).get() or {}).values())
+
+            existing_summary = wallet_ref.child('archive').child(key).get()
+            summary = summarize_transactions(transactions, existing_summary)
+            updates[f'archive/{key}'] = summary
+            if key in segment_keys:
+                updates[f'ledger/{key}'] = None
+            folded_net += summary['net'] - (existing_summary or {}).get('net', 0)
+            folded_segments.append(key)
+            folded_transactions += len(transactions)
+
+        if legacy:
+            updates['transactions'] = None
+
+        if folded_segments:
+            checkpoint = wallet_ref.child('checkpoint').get() or {}
+            updates['checkpoint'] = {
+                'balance': checkpoint.get('balance', 0) + folded_net,
+                'through_segment': max(folded_segments + [checkpoint.get('through_segment', '')]),
+                'updated_at': datetime.datetime.utcnow().isoformat()
+            }
+
+        if updates:
+            wallet_ref.update(updates)
+
+    logger.info(
+        f"Compacted wallet {wallet_key}: {len(folded_segments)} segments, "
+        f"{folded_transactions} transactions folded, {moved_transactions} moved."
+    )
+    return {
+        "folded_segments": len(folded_segments),
+        "folded_transactions": folded_transactions,
+        "moved_transactions": moved_transactions
+    }
+
+
+def compact_wallets(retained_segments=DEFAULT_RETAINED_SEGMENTS, now=None):
+    """
+    Run compact_wallet for every wallet.
+
+    :return: dict with totals across all wallets
+    """
+    totals = {"wallets": 0, "folded_segments": 0, "folded_transactions": 0, "moved_transactions": 0}
+    wallet_keys = get_database_ref().get(shallow=True) or {}
+    for wallet_key in wallet_keys:
+        try:
+            result = compact_wallet(wallet_key, retained_segments, now)
+        except Exception as e:
+            logger.error(f"Failed to compact wallet {wallet_key}: {e}")
+            continue
+        totals["wallets"] += 1
+        for name in ("folded_segments", "folded_transactions", "moved_transactions"):
+            totals[name] += result[name]
+    logger.info(f"Ledger compaction finished: {totals}")
+    return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fold old wallet ledger segments into archived summaries.")
+    parser.add_argument('--retain', type=int, default=DEFAULT_RETAINED_SEGMENTS,
+                        help="Number of most recent monthly segments to keep in full.")
+    args = parser.parse_args()
+    print(compact_wallets(retained_segments=args.retain))
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+# How often a wallet's in-memory daily totals are re-read from the database
+DAILY_TOTALS_RECONCILE_SECONDS = 30
+
+# Maximum number of wallets whose daily totals are kept in memory
+MAX_TRACKED_WALLETS = 100000
+
+
+class DailyLimitExceeded(Exception):
+    """Raised when a transaction would take a wallet past its daily limit."""
+
+    def __init__(self, daily_total):
+        super().__init__(f"Daily limit exceeded at a total of {daily_total}.")
+        self.daily_total = daily_total
+
+
+class DailyLimitTracker:
+    """
+    Per-process counters of each wallet's deposits and withdrawals for the current UTC day.
+
+    Limit checks read the local counters; a wallet's counters are loaded from the
+    persisted daily totals the first time they are needed and again every
+    `reconcile_seconds`, so increments made by other processes are picked up
+    periodically. All counters are dropped when the day rolls over, and the least
+    recently used wallets are evicted beyond `max_wallets`.
+    """
+
+    def __init__(self, reconcile_seconds=DAILY_TOTALS_RECONCILE_SECONDS, max_wallets=MAX_TRACKED_WALLETS):
+        self.reconcile_seconds = reconcile_seconds
+        self.max_wallets = max_wallets
+        self._day = None
+        self._wallets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _roll_over(self, day):
+        if day != self._day:
+            self._day = day
+            self._wallets.clear()
+
+    def get_totals(self, wallet_key, day, load_persisted):
+        """
+        Return the day's totals for a wallet, e.g. {'deposit': 100, 'withdrawal': 20}.
+
+        :param load_persisted: Callable returning the persisted totals for the day
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._roll_over(day)
+            entry = self._wallets.get(wallet_key)
+            if entry is not None and now - entry['synced_at'] < self.reconcile_seconds:
+                self._wallets.move_to_end(wallet_key)
+                return dict(entry['totals'])
+
+        persisted = load_persisted() or {}
+
+        with self._lock:
+            self._roll_over(day)
+            entry = self._wallets.get(wallet_key)
+            totals = dict(persisted)
+            if entry is not None:
+                # Never lose increments made locally since the last reconciliation
+                for transaction_type, total in entry['totals'].items():
+                    totals[transaction_type] = max(total, totals.get(transaction_type, 0))
+            self._store(wallet_key, totals, now)
+            return dict(totals)
+
+    def record(self, wallet_key, day, transaction_type, amount):
+        """
+        Add a committed transaction to the local counters.
+        """
+        with self._lock:
+            self._roll_over(day)
+            entry = self._wallets.get(wallet_key)
+            if entry is None:
+                # Unknown totals: force a reload before the next check
+                return
+            entry['totals'][transaction_type] = entry['totals'].get(transaction_type, 0) + amount
+            self._wallets.move_to_end(wallet_key)
+
+    def _store(self, wallet_key, totals, synced_at):
+        self._wallets[wallet_key] = {'totals': totals, 'synced_at': synced_at}
+        self._wallets.move_to_end(wallet_key)
+        while len(self._wallets) > self.max_wallets:
+            self._wallets.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._day = None
+            self._wallets.clear()
+
+
+# Shared tracker for the wallet services
+daily_limits = DailyLimitTracker()
@@ -1,6 +1,4 @@
-import firebase_admin
-from firebase_admin import credentials, db
-from user.models import get_firebase_app
+from storage.backend import reference
 
 # # Initialize Firebase Admin SDK
 # cred = credentials.Certificate('firebase_key.json')  # Path to your service account key JSON
@@ -8,8 +6,10 @@ from user.models import get_firebase_app
 #     'databaseURL': 'https://<your-database-name>.firebaseio.com/'  # Replace with your database URL
 # })
 
-get_firebase_app()
-
-# Get a reference to the Realtime Database
+# Get a reference to the wallets node in the configured database
 def get_database_ref():
-    return db.reference('wallets')
+    return reference('wallets')
+
+# Get a reference to the index of wallet keys, which holds `true` per wallet
+def get_wallet_keys_ref():
+    return reference('wallet_keys')
@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wallet.models import get_database_ref, get_wallet_keys_ref
+from wallet.concurrency import wallet_lock
+from wallet.cache import balance_cache
+from wallet.ledger import get_ledger_balance
+from wallet.services import is_stale_mutation, finish_pending_mutation
+from logging_utils import setup_logger
+
+# Set up logger
+logger = setup_logger("wallet_reconcile")
+
+DEFAULT_WORKERS = 8
+DEFAULT_PAGE_SIZE = 500
+DEFAULT_CHECKPOINT_FILE = 'wallet_reconcile.checkpoint.json'
+
+# Differences below this are rounding noise, not drift
+BALANCE_TOLERANCE = 1e-6
+
+
+def load_checkpoint(checkpoint_file):
+    """
+    Load the progress saved by a previous run.
+
+    :return: dict with 'last_key' and the accumulated 'stats', or None
+    """
+    if not checkpoint_file or not os.path.exists(checkpoint_file):
+        return None
+    with open(checkpoint_file) as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint_file, last_key, stats):
+    """
+    Atomically record that every wallet up to and including last_key was checked.
+    """
+    if not checkpoint_file:
+        return
+    temporary_file = checkpoint_file + '.tmp'
+    with open(temporary_file, 'w') as f:
+        json.dump({'last_key': last_key, 'stats': stats}, f)
+    os.replace(temporary_file, checkpoint_file)
+
+
+def recover_interrupted_mutations(wallet_ref, markers, difference):
+    """
+    Finish or drop the pending markers of mutations interrupted between their
+    balance write and their ledger write.
+
+    A mutation whose balance write happened accounts for part of `difference`,
+    the balance minus the ledger balance, so its ledger entries are written. The
+    markers of the other mutations, whose balance write never happened, are
+    deleted.
+
+    :return: Total amount of the finished mutations
+    """
+    amounts = {mutation_id: marker.get('amount', 0) for mutation_id, marker in markers.items()}
+    if abs(difference - sum(amounts.values())) <= BALANCE_TOLERANCE:
+        finished = set(amounts)
+    else:
+        finished = set()
+        for mutation_id, amount in amounts.items():
+            if abs(difference - amount) <= BALANCE_TOLERANCE:
+                finished.add(mutation_id)
+                difference -= amount
+
+    for mutation_id, marker in markers.items():
+        if mutation_id in finished:
+            finish_pending_mutation(wallet_ref, mutation_id, marker.get('transactions') or {})
+        else:
+            wallet_ref.child('pending').child(mutation_id).delete()
+    return sum(amounts[mutation_id] for mutation_id in finished)
+
+
+def reconcile_wallet(wallet_key, repair=False, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Compare a wallet's balance with the balance implied by its ledger.
+
+    A mismatch is checked a second time under the wallet lock, and only reported
+    (or repaired) if the balance did not change between the two checks and no
+    mutation is pending, so a mutation caught between its balance write and its
+    ledger write is not mistaken for drift. With repair, the pending markers of
+    interrupted mutations are resolved first; a wallet that only had such markers
+    is reported as 'recovered'.
+
+    :return: dict with the wallet key, the status ('ok', 'mismatch', 'repaired',
+             'recovered', 'interrupted' or 'changed') and both balances
+    """
+    wallet_ref = get_database_ref().child(wallet_key)
+    balance, etag = wallet_ref.child('balance').get(etag=True)
+    ledger_balance = get_ledger_balance(wallet_ref, page_size)
+    if abs((balance or 0) - ledger_balance) <= BALANCE_TOLERANCE and not wallet_ref.child('pending').get(shallow=True):
+        return {'wallet': wallet_key, 'status': 'ok', 'balance': balance, 'ledger_balance': ledger_balance}
+
+    with wallet_lock(wallet_key):
+        balance, recheck_etag = wallet_ref.child('balance').get(etag=True)
+        ledger_balance = get_ledger_balance(wallet_ref, page_size)
+        markers = wallet_ref.child('pending').get() or {}
+        result = {'wallet': wallet_key, 'balance': balance, 'ledger_balance': ledger_balance}
+
+        if not markers and abs((balance or 0) - ledger_balance) <= BALANCE_TOLERANCE:
+            result['status'] = 'ok'
+        elif recheck_etag != etag or not all(is_stale_mutation(marker) for marker in markers.values()):
+            result['status'] = 'changed'
+        elif markers and not repair:
+            result['status'] = 'interrupted'
+        else:
+            if markers:
+                ledger_balance += recover_interrupted_mutations(wallet_ref, markers, (balance or 0) - ledger_balance)
+                result['ledger_balance'] = ledger_balance
+            if abs((balance or 0) - ledger_balance) <= BALANCE_TOLERANCE:
+                result['status'] = 'recovered'
+            elif not repair:
+                result['status'] = 'mismatch'
+            else:
+                success, _, _ = wallet_ref.child('balance').set_if_unchanged(recheck_etag, ledger_balance)
+                if success:
+                    balance_cache.set(wallet_key, ledger_balance)
+                    result['status'] = 'repaired'
+                else:
+                    result['status'] = 'changed'
+
+    if result['status'] != 'ok':
+        logger.warning(
+            f"Wallet {wallet_key}: balance {balance} differs from ledger {ledger_balance} ({result['status']})."
+        )
+    return result
+
+
+def index_wallet_keys(page_size=DEFAULT_PAGE_SIZE):
+    """
+    Add every existing wallet to the 'wallet_keys' index, `page_size` keys per
+    write. Wallets created afterwards are indexed by their first mutation, so this
+    only has to run once.
+
+    :return: Number of indexed wallets
+    """
+    wallet_keys = list(get_database_ref().get(shallow=True) or {})
+    for start in range(0, len(wallet_keys), page_size):
+        get_wallet_keys_ref().update({key: True for key in wallet_keys[start:start + page_size]})
+    logger.info(f"Indexed {len(wallet_keys)} wallet keys.")
+    return len(wallet_keys)
+
+
+def iter_wallet_key_pages(page_size, after=None):
+    """
+    Yield the wallet keys in key order, one page of at most `page_size` keys per
+    query, starting after the key `after`.
+
+    Keys are paged from the 'wallet_keys' index, whose values are `true`, so a
+    page never downloads the wallets themselves.
+    """
+    last_key = after
+    while True:
+        query = get_wallet_keys_ref().order_by_key()
+        if last_key is None:
+            rows = list(query.limit_to_first(page_size).get() or {})
+        else:
+            # start_at is inclusive, so fetch one extra key and drop the previous last key
+            rows = list(query.start_at(last_key).limit_to_first(page_size + 1).get() or {})
+            rows = rows[1:] if rows and rows[0] == last_key else rows[:page_size]
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        last_key = rows[-1]
+
+
+def reconcile_wallets(workers=DEFAULT_WORKERS, page_size=DEFAULT_PAGE_SIZE, repair=False,
+                      checkpoint_file=DEFAULT_CHECKPOINT_FILE, resume=False, report_file=None):
+    """
+    Reconcile every wallet, `page_size` wallets at a time across a pool of workers.
+
+    Wallet keys are read one page at a time, so the job never holds the full list
+    of wallets.
+
+    Progress is checkpointed after each page, so an interrupted run started again
+    with resume=True continues after the last completed page.
+
+    :param report_file: Optional path; every wallet that is not 'ok' is appended as a JSON line
+    :return: dict with counts per status, elapsed seconds and wallets per second
+    """
+    stats = {'wallets': 0, 'ok': 0, 'mismatch': 0, 'repaired': 0, 'recovered': 0, 'interrupted': 0, 'changed': 0, 'errors': 0}
+    last_key = None
+    if resume:
+        checkpoint = load_checkpoint(checkpoint_file)
+        if checkpoint:
+            last_key = checkpoint['last_key']
+            stats.update(checkpoint['stats'])
+            logger.info(f"Resuming wallet reconciliation after {last_key}.")
+
+    def check(wallet_key):
+        try:
+            return reconcile_wallet(wallet_key, repair, page_size)
+        except Exception as e:
+            logger.error(f"Failed to reconcile wallet {wallet_key}: {e}")
+            return {'wallet': wallet_key, 'status': 'errors', 'details': str(e)}
+
+    started_at = time.monotonic()
+    checked = 0
+    report = open(report_file, 'a') if report_file else None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for page in iter_wallet_key_pages(page_size, after=last_key):
+                for result in executor.map(check, page):
+                    stats['wallets'] += 1
+                    stats[result['status']] += 1
+                    if report and result['status'] != 'ok':
+                        report.write(json.dumps(result) + '\n')
+                if report:
+                    report.flush()
+                checked += len(page)
+                save_checkpoint(checkpoint_file, page[-1], stats)
+
+                elapsed = time.monotonic() - started_at
+                logger.info(
+                    f"Reconciled {checked} wallets "
+                    f"({checked / elapsed if elapsed else 0:.1f} wallets/s): {stats}"
+                )
+    finally:
+        if report:
+            report.close()
+
+    elapsed = time.monotonic() - started_at
+    stats['elapsed_seconds'] = round(elapsed, 3)
+    stats['wallets_per_second'] = round(checked / elapsed, 1) if elapsed else 0
+    logger.info(f"Wallet reconciliation finished: {stats}")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check every wallet balance against its ledger.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="Number of wallets checked in parallel.")
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                        help="Wallets per checkpointed page and transactions per ledger read.")
+    parser.add_argument('--repair', action='store_true',
+                        help="Set mismatched balances to the ledger balance.")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue after the last page recorded in the checkpoint file.")
+    parser.add_argument('--checkpoint-file', default=DEFAULT_CHECKPOINT_FILE)
+    parser.add_argument('--report', dest='report_file',
+                        help="Append every mismatched wallet to this file as JSON lines.")
+    parser.add_argument('--index-keys', action='store_true',
+                        help="First add every existing wallet to the wallet key index.")
+    args = parser.parse_args()
+    if args.index_keys:
+        index_wallet_keys(args.page_size)
+    print(reconcile_wallets(
+        workers=args.workers,
+        page_size=args.page_size,
+        repair=args.repair,
+        checkpoint_file=args.checkpoint_file,
+        resume=args.resume,
+        report_file=args.report_file
+    ))
@@ -3,10 +3,14 @@ from wallet.controller import (
     add_funds_controller,
     deduct_funds_controller,
     get_balance_controller,
-    get_transaction_history_controller
+    get_transaction_history_controller,
+    export_transactions_controller,
+    batch_controller
 )
 from utils import standardize_response  # Import the standardize_response utility
 from logging_utils import setup_logger
+from middleware import idempotent
+from user.models import admin_required, token_required
 
 # Initialize logger for the wallet module
 logger = setup_logger("wallet_routes")
@@ -14,6 +18,7 @@ logger = setup_logger("wallet_routes")
 wallet_bp = Blueprint('wallet', __name__)
 
 @wallet_bp.route('/add-funds', methods=['POST'])
+@idempotent
 def add_funds():
     """
     Route to add funds to a wallet.
@@ -28,6 +33,7 @@ def add_funds():
         return standardize_response(data={"details": str(e)}, message="Failed to add funds", success=False)
 
 @wallet_bp.route('/deduct-funds', methods=['POST'])
+@idempotent
 def deduct_funds():
     """
     Route to deduct funds from a wallet.
@@ -68,3 +74,33 @@ def get_transaction_history():
     except Exception as e:
         logger.error(f"Failed to fetch transaction history: {e}", exc_info=True)
         return standardize_response(data={"details": str(e)}, message="Failed to fetch transaction history", success=False)
+
+@wallet_bp.route('/transactions/export', methods=['GET'])
+def export_transactions():
+    """
+    Route to stream the full transaction history of a wallet as NDJSON or CSV.
+    """
+    try:
+        logger.info("Exporting transaction history.")
+        return export_transactions_controller()
+    except Exception as e:
+        logger.error(f"Failed to export transaction history: {e}", exc_info=True)
+        return standardize_response(data={"details": str(e)}, message="Failed to export transactions", success=False)
+
+@wallet_bp.route('/batch', methods=['POST'])
+@token_required
+@admin_required
+@idempotent
+def apply_batch(current_user):
+    """
+    Route to apply a batch of credits and debits to many wallets.
+    Only accessible by admins.
+    """
+    try:
+        logger.info("Processing wallet batch request.")
+        result = batch_controller()
+        logger.info("Wallet batch processed.")
+        return result
+    except Exception as e:
+        logger.error(f"Failed to apply wallet batch: {e}", exc_info=True)
+        return standardize_response(data={"details": str(e)}, message="Failed to apply wallet batch", success=False)
@@ -1,6 +1,20 @@
 from flask import jsonify
-from wallet.models import get_database_ref
+from wallet.models import get_database_ref, get_wallet_keys_ref
+from wallet.concurrency import (
+    wallet_lock, wallet_locks, get_lock_stripe, ConcurrentUpdateError, MAX_BALANCE_RETRIES, WALLET_LOCK_STRIPES
+)
+from wallet.ledger import ledger_entry_path, segment_key
+from wallet.limits import daily_limits, DailyLimitExceeded
+from wallet.cache import balance_cache
+from wallet.archive import get_history_refs
+from storage.base import generate_push_id
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import csv
 import datetime
+import hashlib
+import io
+import json
 import re
 from logging_utils import setup_logger
 
@@ -8,6 +22,27 @@ from logging_utils import setup_logger
 MAX_DAILY_WITHDRAWAL = 50000  # Example limit
 MAX_DAILY_DEPOSIT = 50000     # Example limit
 
+# Transaction history page sizes
+DEFAULT_HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 500
+
+# Transaction export
+EXPORT_PAGE_SIZE = 500
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_CSV_COLUMNS = ['id', 'timestamp', 'type', 'amount', 'contest_id']
+
+# Batch operations
+MAX_BATCH_ITEMS = 10000
+BATCH_GROUP_SIZE = 500    # Wallets per worker group
+BATCH_MAX_WORKERS = 8
+BATCH_RESERVED_REASONS = ('deposit', 'withdrawal')
+MAX_IDEMPOTENCY_KEY_LENGTH = 256
+APPLIED_KEY_RETENTION_DAYS = 90   # Applied idempotency keys older than this are forgotten
+APPLIED_KEY_PRUNE_LIMIT = 100     # Expired keys deleted per recorded key batch
+
+# Wallet mutations whose pending marker is older than this were interrupted
+PENDING_MUTATION_TIMEOUT_SECONDS = 60
+
 # Set up logger
 logger = setup_logger("wallet_services")
 
@@ -23,29 +58,186 @@ def sanitize_key(key):
 def get_today_date():
     return datetime.datetime.utcnow().strftime('%Y-%m-%d')
 
-# Helper function to get daily transaction totals
-def get_daily_totals(user_id, transaction_type):
-    try:
-        db_ref = get_database_ref()
-        wallet_ref = db_ref.child(user_id)
-        daily_totals_ref = wallet_ref.child('daily_totals').child(get_today_date())
-        totals = daily_totals_ref.get()
-        return totals.get(transaction_type, 0) if totals else 0
-    except Exception as e:
-        logger.error(f"Error fetching daily totals for user {user_id}: {e}")
-        raise
+# Helper function to read the balance a wallet mutation depends on
+def read_wallet_state(wallet_ref):
+    """
+    Read the balance a mutation is computed from. Only this leaf is fetched, never
+    the transactions subtree.
+    """
+    return wallet_ref.child('balance').get()
+
+# Helper function to get a wallet's totals for a day
+def get_daily_totals(sanitized_user_id, wallet_ref, date):
+    """
+    Return the wallet's deposit and withdrawal totals for the given day from the
+    in-process counters, loading the persisted totals only when they are missing
+    or due for reconciliation.
+    """
+    return daily_limits.get_totals(
+        sanitized_user_id,
+        date,
+        lambda: wallet_ref.child('daily_totals').child(date).get()
+    )
+
+class _BalanceChanged(Exception):
+    """Aborts a wallet mutation whose balance moved since the caller read it."""
+
+# Helper function to turn an idempotency key into a database key
+def hash_idempotency_key(key):
+    """
+    Return the SHA-256 hex digest of a raw idempotency key. Keys are stored by
+    their hash, so distinct keys never map to the same 'applied/<key>' entry.
+    """
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+# Helper function to check whether a pending marker belongs to an interrupted mutation
+def is_stale_mutation(marker):
+    """
+    A pending marker older than PENDING_MUTATION_TIMEOUT_SECONDS belongs to a
+    mutation that was interrupted between its balance write and its ledger write.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=PENDING_MUTATION_TIMEOUT_SECONDS)
+    return (marker or {}).get('timestamp', '') < cutoff.isoformat()
+
+# Helper function to check idempotency keys against applied and pending mutations
+def idempotency_keys_taken(wallet_ref, mutation_id, keys):
+    """
+    Return True if one of the keys was already applied to the wallet or is part of
+    another pending mutation.
+    """
+    applied_ref = wallet_ref.child('applied')
+    if any(applied_ref.child(key).get() for key in keys):
+        return True
+    for other_id, marker in (wallet_ref.child('pending').get() or {}).items():
+        if other_id == mutation_id:
+            continue
+        if any(transaction.get('idempotency_key') in keys for transaction in (marker.get('transactions') or {}).values()):
+            return True
+    return False
+
+# Helper function to write the ledger entries of a mutation whose balance is written
+def finish_pending_mutation(wallet_ref, mutation_id, transactions):
+    """
+    Append the ledger entries of a mutation, record its idempotency keys under
+    'applied/<key>' and remove its pending marker, in one multi-path update.
+    Entries keep their IDs, so finishing a mutation twice writes the same entries.
+
+    A mutation that records keys also deletes up to APPLIED_KEY_PRUNE_LIMIT keys
+    older than APPLIED_KEY_RETENTION_DAYS, so the map does not grow without bound.
+    """
+    updates = {}
+    for transaction_id, transaction in transactions.items():
+        updates[ledger_entry_path(transaction_id, transaction['timestamp'])] = transaction
+        if transaction.get('idempotency_key'):
+            updates[f"applied/{transaction['idempotency_key']}"] = {
+                'transaction_id': transaction_id,
+                'timestamp': transaction['timestamp']
+            }
+    if any(path.startswith('applied/') for path in updates):
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=APPLIED_KEY_RETENTION_DAYS)
+        expired_query = wallet_ref.child('applied').order_by_child('timestamp').end_at(cutoff.isoformat())
+        expired = expired_query.limit_to_first(APPLIED_KEY_PRUNE_LIMIT).get() or {}
+        for key in expired:
+            updates.setdefault(f'applied/{key}', None)
+    updates[f'pending/{mutation_id}'] = None
+    wallet_ref.update(updates)
+
+# Helper function to add to the persisted daily total of a transaction type
+def reserve_daily_total(wallet_ref, date, daily_type, amount, daily_limit=None):
+    """
+    Add `amount` to 'daily_totals/<date>/<daily_type>' with a transaction on the
+    small 'daily_totals' node, so totals written by other processes are never
+    lowered. Totals of previous days are deleted by the same write.
+
+    :raises DailyLimitExceeded: If the persisted daily total would pass `daily_limit`
+    """
+    def reserve(totals):
+        totals = totals if isinstance(totals, dict) else {}
+        for previous_day in [key for key in totals if key != date]:
+            del totals[previous_day]
+        day_totals = totals.setdefault(date, {})
+        daily_total = day_totals.get(daily_type, 0)
+        if daily_limit is not None and daily_total + amount > daily_limit:
+            raise DailyLimitExceeded(daily_total)
+        day_totals[daily_type] = daily_total + amount
+        return totals
+
+    wallet_ref.child('daily_totals').transaction(reserve)
+
+# Helper function to give back a daily total reserved by a mutation that was not written
+def release_daily_total(wallet_ref, date, daily_type, amount):
+    def release(totals):
+        day_totals = (totals or {}).get(date)
+        if isinstance(day_totals, dict) and daily_type in day_totals:
+            day_totals[daily_type] -= amount
+        return totals
+
+    wallet_ref.child('daily_totals').transaction(release)
+
+# Helper function to write a wallet mutation
+def write_wallet_mutation(wallet_ref, expected_balance, new_balance, transactions,
+                          daily_type=None, daily_amount=0, daily_limit=None, date=None):
+    """
+    Write the new balance, the ledger entries and, optionally, the day's total of
+    one transaction type.
+
+    The balance is the commit point: it is changed by a transaction on the
+    'balance' leaf alone, which gives up if the balance is no longer
+    `expected_balance`; the caller then reads it again and repeats its checks.
+    The ledger entries are appended afterwards with one multi-path update, so no
+    step reads or rewrites the ledger. Before the balance changes, the entries are
+    recorded in a 'pending/<mutation_id>' marker that the ledger write removes;
+    the reconciliation job finishes or drops the markers of mutations interrupted
+    between the two writes. A mutation that creates the wallet also adds it to
+    the 'wallet_keys' index the reconciliation job pages through.
+
+    The daily total is reserved first with `reserve_daily_total`, which checks
+    `daily_limit` against the persisted total, and given back if the balance had
+    changed.
+
+    :param transactions: List of ledger entries to append; an entry with an
+                         'idempotency_key' (a `hash_idempotency_key` digest) is
+                         recorded under 'applied/<key>', and the
+                         mutation gives up if that key was already applied or is
+                         part of another pending mutation
+    :param daily_type: Transaction type whose daily total grows by `daily_amount`
+    :param daily_limit: Optional maximum of that daily total
+    :return: The IDs of the new transactions, or None if the balance had changed
+    :raises DailyLimitExceeded: If the persisted daily total would pass `daily_limit`
+    """
+    mutation_id = generate_push_id()
+    entries = {generate_push_id(): transaction for transaction in transactions}
+    keys = [transaction['idempotency_key'] for transaction in transactions if transaction.get('idempotency_key')]
+    day = date or get_today_date()
+
+    if daily_type:
+        reserve_daily_total(wallet_ref, day, daily_type, daily_amount, daily_limit)
+    if expected_balance is None:
+        get_wallet_keys_ref().child(wallet_ref.key).set(True)
+    pending_ref = wallet_ref.child('pending').child(mutation_id)
+    pending_ref.set({
+        'timestamp': datetime.datetime.utcnow().isoformat(),
+        'amount': new_balance - (expected_balance or 0),
+        'transactions': entries
+    })
+
+    def apply(balance):
+        if balance != expected_balance:
+            raise _BalanceChanged()
+        return new_balance
 
-# Helper function to update daily transaction totals
-def update_daily_totals(user_id, transaction_type, amount):
     try:
-        db_ref = get_database_ref()
-        wallet_ref = db_ref.child(user_id)
-        daily_totals_ref = wallet_ref.child('daily_totals').child(get_today_date())
-        current_total = get_daily_totals(user_id, transaction_type)
-        daily_totals_ref.update({transaction_type: current_total + amount})
-    except Exception as e:
-        logger.error(f"Error updating daily totals for user {user_id}: {e}")
-        raise
+        if keys and idempotency_keys_taken(wallet_ref, mutation_id, keys):
+            raise _BalanceChanged()
+        wallet_ref.child('balance').transaction(apply)
+    except _BalanceChanged:
+        pending_ref.delete()
+        if daily_type:
+            release_daily_total(wallet_ref, day, daily_type, daily_amount)
+        return None
+
+    finish_pending_mutation(wallet_ref, mutation_id, entries)
+    return list(entries)
 
 # Add funds to the wallet
 def add_funds_service(user_id, amount):
@@ -60,41 +252,44 @@ def add_funds_service(user_id, amount):
     sanitized_user_id = sanitize_key(user_id)
 
     try:
-        # Check daily deposit limit
-        daily_deposit_total = get_daily_totals(sanitized_user_id, 'deposit')
-        if daily_deposit_total + amount > MAX_DAILY_DEPOSIT:
-            logger.info(f"Daily deposit limit exceeded for user {user_id}.")
-            return {
-                "success": False,
-                "message": "Daily deposit limit exceeded.",
-                "data": {
-                    "daily_total": daily_deposit_total,
-                    "attempted_deposit": amount,
-                    "limit": MAX_DAILY_DEPOSIT
-                }
-            }, 400
-
         db_ref = get_database_ref()
         wallet_ref = db_ref.child(sanitized_user_id)
+        today = get_today_date()
 
-        # Fetch current balance
-        wallet_data = wallet_ref.get()
-        current_balance = wallet_data['balance'] if wallet_data else 0
-
-        # Update balance
-        new_balance = current_balance + amount
-        wallet_ref.update({'balance': new_balance})
+        with wallet_lock(sanitized_user_id):
+            for attempt in range(MAX_BALANCE_RETRIES):
+                # Fetch current balance; today's totals come from the local counters
+                current_balance = read_wallet_state(wallet_ref)
+                daily_totals = get_daily_totals(sanitized_user_id, wallet_ref, today)
 
-        # Log transaction
-        transaction_ref = wallet_ref.child('transactions').push()
-        transaction_ref.set({
-            'type': 'deposit',
-            'amount': amount,
-            'timestamp': datetime.datetime.utcnow().isoformat()
-        })
+                # Check daily deposit limit; the write checks it again against the persisted total
+                daily_deposit_total = daily_totals.get('deposit', 0)
+                if daily_deposit_total + amount > MAX_DAILY_DEPOSIT:
+                    raise DailyLimitExceeded(daily_deposit_total)
 
-        # Update daily totals
-        update_daily_totals(sanitized_user_id, 'deposit', amount)
+                # Update balance, log transaction and update daily totals
+                new_balance = (current_balance or 0) + amount
+                transaction_ids = write_wallet_mutation(
+                    wallet_ref,
+                    current_balance,
+                    new_balance,
+                    [{
+                        'type': 'deposit',
+                        'amount': amount,
+                        'timestamp': datetime.datetime.utcnow().isoformat()
+                    }],
+                    daily_type='deposit',
+                    daily_amount=amount,
+                    daily_limit=MAX_DAILY_DEPOSIT,
+                    date=today
+                )
+                if transaction_ids:
+                    balance_cache.set(sanitized_user_id, new_balance)
+                    daily_limits.record(sanitized_user_id, today, 'deposit', amount)
+                    break
+                logger.info(f"Balance changed concurrently for user {user_id}, retrying ({attempt + 1}/{MAX_BALANCE_RETRIES}).")
+            else:
+                raise ConcurrentUpdateError(f"Balance kept changing for user {user_id}.")
 
         logger.info(f"Funds added successfully for user {user_id}. New balance: {new_balance}")
         return {
@@ -103,6 +298,18 @@ def add_funds_service(user_id, amount):
             "data": {"balance": new_balance}
         }
 
+    except DailyLimitExceeded as e:
+        logger.info(f"Daily deposit limit exceeded for user {user_id}.")
+        return {
+            "success": False,
+            "message": "Daily deposit limit exceeded.",
+            "data": {
+                "daily_total": e.daily_total,
+                "attempted_deposit": amount,
+                "limit": MAX_DAILY_DEPOSIT
+            }
+        }, 400
+
     except Exception as e:
         logger.error(f"Failed to add funds for user {user_id}: {e}")
         return {
@@ -124,67 +331,83 @@ def deduct_funds_service(user_id, amount):
     sanitized_user_id = sanitize_key(user_id)
 
     try:
-        # Check daily withdrawal limit
-        daily_withdrawal_total = get_daily_totals(sanitized_user_id, 'withdrawal')
-        if daily_withdrawal_total + amount > MAX_DAILY_WITHDRAWAL:
-            logger.info(f"Daily withdrawal limit exceeded for user {user_id}.")
-            return {
-                "success": False,
-                "message": "Daily withdrawal limit exceeded.",
-                "data": {
-                    "daily_total": daily_withdrawal_total,
-                    "attempted_withdrawal": amount,
-                    "limit": MAX_DAILY_WITHDRAWAL
-                }
-            }, 400
-
         db_ref = get_database_ref()
         wallet_ref = db_ref.child(sanitized_user_id)
+        today = get_today_date()
 
-        # Fetch current balance
-        wallet_data = wallet_ref.get()
-        if not wallet_data:
-            logger.warning(f"Wallet not found for user {user_id}.")
-            return {
-                "success": False,
-                "message": "Wallet not found.",
-                "data": None
-            }, 404
+        with wallet_lock(sanitized_user_id):
+            for attempt in range(MAX_BALANCE_RETRIES):
+                # Fetch current balance; today's totals come from the local counters
+                current_balance = read_wallet_state(wallet_ref)
+                daily_totals = get_daily_totals(sanitized_user_id, wallet_ref, today)
 
-        current_balance = wallet_data['balance']
+                # Check daily withdrawal limit; the write checks it again against the persisted total
+                daily_withdrawal_total = daily_totals.get('withdrawal', 0)
+                if daily_withdrawal_total + amount > MAX_DAILY_WITHDRAWAL:
+                    raise DailyLimitExceeded(daily_withdrawal_total)
 
-        # Ensure sufficient balance
-        if current_balance >= amount:
-            new_balance = current_balance - amount
-            wallet_ref.update({'balance': new_balance})
+                if current_balance is None:
+                    logger.warning(f"Wallet not found for user {user_id}.")
+                    return {
+                        "success": False,
+                        "message": "Wallet not found.",
+                        "data": None
+                    }, 404
 
-            # Log transaction
-            transaction_ref = wallet_ref.child('transactions').push()
-            transaction_ref.set({
-                'type': 'withdrawal',
-                'amount': amount,
-                'timestamp': datetime.datetime.utcnow().isoformat()
-            })
+                # Ensure sufficient balance
+                if current_balance < amount:
+                    logger.warning(f"Insufficient funds for user {user_id}. Current balance: {current_balance}")
+                    return {
+                        "success": False,
+                        "message": "Insufficient funds.",
+                        "data": {
+                            "current_balance": current_balance,
+                            "attempted_deduction": amount
+                        }
+                    }, 400
 
-            # Update daily totals
-            update_daily_totals(sanitized_user_id, 'withdrawal', amount)
+                # Update balance, log transaction and update daily totals
+                new_balance = current_balance - amount
+                transaction_ids = write_wallet_mutation(
+                    wallet_ref,
+                    current_balance,
+                    new_balance,
+                    [{
+                        'type': 'withdrawal',
+                        'amount': amount,
+                        'timestamp': datetime.datetime.utcnow().isoformat()
+                    }],
+                    daily_type='withdrawal',
+                    daily_amount=amount,
+                    daily_limit=MAX_DAILY_WITHDRAWAL,
+                    date=today
+                )
+                if transaction_ids:
+                    balance_cache.set(sanitized_user_id, new_balance)
+                    daily_limits.record(sanitized_user_id, today, 'withdrawal', amount)
+                    break
+                logger.info(f"Balance changed concurrently for user {user_id}, retrying ({attempt + 1}/{MAX_BALANCE_RETRIES}).")
+            else:
+                raise ConcurrentUpdateError(f"Balance kept changing for user {user_id}.")
 
-            logger.info(f"Funds deducted successfully for user {user_id}. New balance: {new_balance}")
-            return {
-                "success": True,
-                "message": "Funds deducted successfully.",
-                "data": {"balance": new_balance}
+        logger.info(f"Funds deducted successfully for user {user_id}. New balance: {new_balance}")
+        return {
+            "success": True,
+            "message": "Funds deducted successfully.",
+            "data": {"balance": new_balance}
+        }
+
+    except DailyLimitExceeded as e:
+        logger.info(f"Daily withdrawal limit exceeded for user {user_id}.")
+        return {
+            "success": False,
+            "message": "Daily withdrawal limit exceeded.",
+            "data": {
+                "daily_total": e.daily_total,
+                "attempted_withdrawal": amount,
+                "limit": MAX_DAILY_WITHDRAWAL
             }
-        else:
-            logger.warning(f"Insufficient funds for user {user_id}. Current balance: {current_balance}")
-            return {
-                "success": False,
-                "message": "Insufficient funds.",
-                "data": {
-                    "current_balance": current_balance,
-                    "attempted_deduction": amount
-                }
-            }, 400
+        }, 400
 
     except Exception as e:
         logger.error(f"Failed to deduct funds for user {user_id}: {e}")
@@ -210,14 +433,19 @@ def get_balance_service(user_id):
         db_ref = get_database_ref()
         wallet_ref = db_ref.child(sanitized_user_id)
 
-        # Fetch current balance
-        wallet_data = wallet_ref.get()
-        if wallet_data:
-            logger.info(f"Balance retrieved for user {user_id}. Balance: {wallet_data['balance']}")
+        # Serve the balance from the cache, reading only the balance leaf on a miss
+        hit, balance = balance_cache.get(sanitized_user_id)
+        if not hit:
+            balance = wallet_ref.child('balance').get()
+            if balance is not None:
+                balance_cache.add(sanitized_user_id, balance)
+
+        if balance is not None:
+            logger.info(f"Balance retrieved for user {user_id}. Balance: {balance}")
             return {
                 "success": True,
                 "message": "Wallet balance retrieved successfully.",
-                "data": {"balance": wallet_data['balance']}
+                "data": {"balance": balance}
             }
         else:
             logger.warning(f"Wallet not found for user {user_id}.")
@@ -235,8 +463,126 @@ def get_balance_service(user_id):
             "data": {"details": str(e)}
         }, 500
 
+# Helper functions to encode and decode transaction history cursors
+def encode_cursor(timestamp, transaction_id):
+    """
+    Build an opaque page cursor from the position of a transaction.
+    """
+    raw = json.dumps([timestamp, transaction_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor created by encode_cursor.
+
+    :return: (timestamp, transaction_id)
+    :raises ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, transaction_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor.")
+    if not isinstance(timestamp, str) or not isinstance(transaction_id, str):
+        raise ValueError("Invalid cursor.")
+    return timestamp, transaction_id
+
+# Helper function to fetch one page of transactions ordered by timestamp
+def query_transactions_page(transactions_ref, limit, before=None, after=None, start=None, end=None):
+    """
+    Fetch up to `limit` transactions, newest first, with an ordered and limited
+    query on `timestamp`, so the cost depends on the page size rather than the
+    size of the ledger.
+
+    :param before: (timestamp, id) position; only older transactions are returned
+    :param after: (timestamp, id) position; only newer transactions are returned
+    :param start: Lowest timestamp (prefix) to include
+    :param end: Highest timestamp (prefix) to include
+    :return: (list of (id, transaction) newest first, whether more transactions exist past the page)
+    """
+    lower = start
+    upper = end + '\uf8ff' if end else None
+    if before and (upper is None or before[0] < upper):
+        upper = before[0]
+    if after and (lower is None or after[0] > lower):
+        lower = after[0]
+
+    # One extra row tells whether another page exists; the window grows only when
+    # several transactions share the cursor timestamp.
+    window = limit + 1
+    while True:
+        query = transactions_ref.order_by_child('timestamp')
+        if lower is not None:
+            query = query.start_at(lower)
+        if upper is not None:
+            query = query.end_at(upper)
+        query = query.limit_to_first(window) if after else query.limit_to_last(window)
+        fetched = list((query.get() or {}).items())
+
+        rows = fetched
+        if before:
+            rows = [row for row in rows if (row[1].get('timestamp', ''), row[0]) < before]
+        if after:
+            rows = [row for row in rows if (row[1].get('timestamp', ''), row[0]) > after]
+        rows.sort(key=lambda row: (row[1].get('timestamp', ''), row[0]))
+
+        if len(rows) > limit or len(fetched) < window:
+            break
+        window *= 2
+
+    has_more = len(rows) > limit
+    # Keep the rows closest to the cursor (or the newest rows without one)
+    page = rows[:limit] if after else rows[max(0, len(rows) - limit):]
+    page.reverse()
+    return page, has_more
+
+# Helper function to fetch one page of transactions across ledger segments
+def query_ledger_page(segment_refs, limit, before=None, after=None, start=None, end=None):
+    """
+    Page through transactions spread over several ledger locations, querying
+    segments one at a time and only as far as needed to fill the page.
+
+    :param segment_refs: (segment key or None, reference) pairs, oldest first
+    :return: (list of (id, transaction) newest first, whether more transactions exist past the page)
+    """
+    def in_range(key):
+        if key is None:
+            return True
+        if start and key < segment_key(start):
+            return False
+        if end and key > segment_key(end):
+            return False
+        if before and key > segment_key(before[0]):
+            return False
+        if after and key < segment_key(after[0]):
+            return False
+        return True
+
+    refs = [ref for key, ref in segment_refs if in_range(key)]
+    if not after:
+        refs.reverse()  # Newest segment first
+
+    collected = []
+    has_more = False
+    for index, ref in enumerate(refs):
+        page, has_more = query_transactions_page(ref, limit - len(collected), before, after, start, end)
+        # Collect in the order pages are walked: newest first, or oldest first for `after`
+        collected.extend(reversed(page) if after else page)
+        if len(collected) >= limit:
+            if not has_more:
+                has_more = any(
+                    query_transactions_page(other, 1, before, after, start, end)[0]
+                    for other in refs[index + 1:]
+                )
+            break
+
+    if after:
+        collected.reverse()
+    return collected, has_more
+
 # Get transaction history
-def get_transaction_history_service(user_id):
+def get_transaction_history_service(user_id, limit=DEFAULT_HISTORY_PAGE_SIZE, before=None, after=None,
+                                    start_date=None, end_date=None):
     if not user_id:
         logger.warning("User ID is required for get_transaction_history_service.")
         return {
@@ -245,33 +591,65 @@ def get_transaction_history_service(user_id):
             "data": None
         }, 400
 
+    if before and after:
+        return {
+            "success": False,
+            "message": "Only one of 'before' and 'after' can be given.",
+            "data": None
+        }, 400
+
     sanitized_user_id = sanitize_key(user_id)
 
+    try:
+        limit = max(1, min(int(limit), MAX_HISTORY_PAGE_SIZE))
+        before_position = decode_cursor(before) if before else None
+        after_position = decode_cursor(after) if after else None
+    except ValueError as e:
+        logger.warning(f"Invalid pagination parameters for user {user_id}: {e}")
+        return {
+            "success": False,
+            "message": "Invalid pagination parameters.",
+            "data": {"details": str(e)}
+        }, 400
+
     try:
         db_ref = get_database_ref()
-        transactions_ref = db_ref.child(sanitized_user_id).child('transactions')
+        wallet_ref = db_ref.child(sanitized_user_id)
 
-        # Fetch all transactions
-        transactions = transactions_ref.get()
-        if transactions:
+        # Fetch one page of transactions, newest first
+        page, has_more = query_ledger_page(
+            get_history_refs(wallet_ref),
+            limit,
+            before=before_position,
+            after=after_position,
+            start=start_date,
+            end=end_date
+        )
+        if page:
             transaction_list = [
-                {"id": key, "details": value} for key, value in transactions.items()
+                {"id": key, "details": value} for key, value in page
             ]
-            transaction_list.sort(
-                key=lambda x: x['details']['timestamp'], reverse=True
-            )
+            newest, oldest = page[0], page[-1]
+            older_exists = has_more if not after_position else True
+            newer_exists = has_more if after_position else before_position is not None
             logger.info(f"Transaction history retrieved for user {user_id}.")
             return {
                 "success": True,
                 "message": "Transaction history retrieved successfully.",
-                "data": transaction_list
+                "data": transaction_list,
+                "pagination": {
+                    "limit": limit,
+                    "next_cursor": encode_cursor(oldest[1].get('timestamp', ''), oldest[0]) if older_exists else None,
+                    "prev_cursor": encode_cursor(newest[1].get('timestamp', ''), newest[0]) if newer_exists else None
+                }
             }
         else:
             logger.warning(f"No transactions found for user {user_id}.")
             return {
                 "success": False,
                 "message": "No transactions found.",
-                "data": []
+                "data": [],
+                "pagination": {"limit": limit, "next_cursor": None, "prev_cursor": None}
             }
 
     except Exception as e:
@@ -282,6 +660,95 @@ def get_transaction_history_service(user_id):
             "data": {"details": str(e)}
         }, 500
     
+# Helper function to iterate over a wallet's transactions page by page
+def iter_transactions(wallet_ref, start_date=None, end_date=None, page_size=None):
+    """
+    Yield (id, transaction) pairs newest first, fetching one page at a time and
+    continuing from the oldest transaction of the previous page.
+    """
+    page_size = page_size or EXPORT_PAGE_SIZE
+    segment_refs = get_history_refs(wallet_ref)
+    before = None
+    while True:
+        page, has_more = query_ledger_page(segment_refs, page_size, before=before, start=start_date, end=end_date)
+        yield from page
+        if not page or not has_more:
+            return
+        oldest_id, oldest = page[-1]
+        before = (oldest.get('timestamp', ''), oldest_id)
+
+# Helper function to format exported transactions
+def format_export_rows(transactions, export_format):
+    """
+    Turn (id, transaction) pairs into NDJSON lines or CSV rows, one at a time.
+    """
+    if export_format == 'ndjson':
+        for transaction_id, transaction in transactions:
+            yield json.dumps({"id": transaction_id, **transaction}, separators=(',', ':')) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush(row):
+        writer.writerow(row)
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    yield flush(EXPORT_CSV_COLUMNS)
+    for transaction_id, transaction in transactions:
+        row = dict(transaction, id=transaction_id)
+        yield flush([row.get(column, '') for column in EXPORT_CSV_COLUMNS])
+
+# Export transaction history
+def export_transactions_service(user_id, export_format='ndjson', start_date=None, end_date=None):
+    """
+    Prepare a streaming export of a wallet's full transaction history.
+
+    Nothing is read until the returned rows are iterated, and only one page of
+    transactions is held in memory at a time.
+
+    :return: Response dict whose data holds the content type and a generator of rows
+    """
+    if not user_id:
+        logger.warning("User ID is required for export_transactions_service.")
+        return {
+            "success": False,
+            "message": "User ID is required.",
+            "data": None
+        }, 400
+
+    if export_format not in EXPORT_FORMATS:
+        return {
+            "success": False,
+            "message": f"Unsupported export format. Use one of: {', '.join(EXPORT_FORMATS)}.",
+            "data": None
+        }, 400
+
+    sanitized_user_id = sanitize_key(user_id)
+    wallet_ref = get_database_ref().child(sanitized_user_id)
+
+    def rows():
+        try:
+            yield from format_export_rows(iter_transactions(wallet_ref, start_date, end_date), export_format)
+            logger.info(f"Transaction export finished for user {user_id}.")
+        except Exception as e:
+            # Headers are already sent, so the error can only be logged and the stream cut short
+            logger.error(f"Transaction export failed for user {user_id}: {e}")
+            raise
+
+    return {
+        "success": True,
+        "message": "Transaction export started.",
+        "data": {
+            "content_type": EXPORT_FORMATS[export_format],
+            "filename": f"transactions-{sanitized_user_id}.{export_format}",
+            "rows": rows()
+        }
+    }
+
 # Deduct entry fee for a contest
 def deduct_entry_fee(user_id, contest_id, entry_fee):
     if not user_id or not contest_id or entry_fee <= 0:
@@ -295,28 +762,31 @@ def deduct_entry_fee(user_id, contest_id, entry_fee):
         db_ref = get_database_ref()
         wallet_ref = db_ref.child(sanitized_user_id)
 
-        wallet_data = wallet_ref.get()
-        if not wallet_data or 'balance' not in wallet_data:
-            logger.warning(f"Wallet not found for user {user_id}.")
-            return {'success': False, 'error': 'Wallet not found'}, 404
-
-        current_balance = wallet_data['balance']
-        if current_balance < entry_fee:
-            logger.warning(f"Insufficient balance for user {user_id}. Current balance: {current_balance}, Entry fee: {entry_fee}")
-            return {'success': False, 'error': 'Insufficient balance'}, 400
-
-        # Deduct entry fee
-        new_balance = current_balance - entry_fee
-        wallet_ref.update({'balance': new_balance})
-
-        # Log transaction
-        transaction_ref = wallet_ref.child('transactions').push()
-        transaction_ref.set({
-            'type': 'contest_entry',
-            'contest_id': sanitized_contest_id,
-            'amount': -entry_fee,
-            'timestamp': datetime.datetime.utcnow().isoformat()
-        })
+        with wallet_lock(sanitized_user_id):
+            for attempt in range(MAX_BALANCE_RETRIES):
+                current_balance = read_wallet_state(wallet_ref)
+                if current_balance is None:
+                    logger.warning(f"Wallet not found for user {user_id}.")
+                    return {'success': False, 'error': 'Wallet not found'}, 404
+
+                if current_balance < entry_fee:
+                    logger.warning(f"Insufficient balance for user {user_id}. Current balance: {current_balance}, Entry fee: {entry_fee}")
+                    return {'success': False, 'error': 'Insufficient balance'}, 400
+
+                # Deduct entry fee and log transaction
+                new_balance = current_balance - entry_fee
+                transaction_ids = write_wallet_mutation(wallet_ref, current_balance, new_balance, [{
+                    'type': 'contest_entry',
+                    'contest_id': sanitized_contest_id,
+                    'amount': -entry_fee,
+                    'timestamp': datetime.datetime.utcnow().isoformat()
+                }])
+                if transaction_ids:
+                    balance_cache.set(sanitized_user_id, new_balance)
+                    break
+                logger.info(f"Balance changed concurrently for user {user_id}, retrying ({attempt + 1}/{MAX_BALANCE_RETRIES}).")
+            else:
+                raise ConcurrentUpdateError(f"Balance kept changing for user {user_id}.")
 
         logger.info(f"Entry fee of {entry_fee} deducted for user {user_id} for contest {contest_id}. New balance: {new_balance}")
         return {'success': True, 'message': 'Entry fee deducted', 'balance': new_balance}
@@ -338,25 +808,219 @@ def credit_winnings_service(user_id, contest_id, winnings):
         db_ref = get_database_ref()
         wallet_ref = db_ref.child(sanitized_user_id)
 
-        wallet_data = wallet_ref.get()
-        current_balance = wallet_data['balance'] if wallet_data else 0
+        with wallet_lock(sanitized_user_id):
+            for attempt in range(MAX_BALANCE_RETRIES):
+                current_balance = read_wallet_state(wallet_ref)
 
-        # Credit winnings
-        new_balance = current_balance + winnings
-        wallet_ref.update({'balance': new_balance})
-
-        # Log transaction
-        transaction_ref = wallet_ref.child('transactions').push()
-        transaction_ref.set({
-            'type': 'contest_winnings',
-            'contest_id': sanitized_contest_id,
-            'amount': winnings,
-            'timestamp': datetime.datetime.utcnow().isoformat()
-        })
+                # Credit winnings and log transaction
+                new_balance = (current_balance or 0) + winnings
+                transaction_ids = write_wallet_mutation(wallet_ref, current_balance, new_balance, [{
+                    'type': 'contest_winnings',
+                    'contest_id': sanitized_contest_id,
+                    'amount': winnings,
+                    'timestamp': datetime.datetime.utcnow().isoformat()
+                }])
+                if transaction_ids:
+                    balance_cache.set(sanitized_user_id, new_balance)
+                    break
+                logger.info(f"Balance changed concurrently for user {user_id}, retrying ({attempt + 1}/{MAX_BALANCE_RETRIES}).")
+            else:
+                raise ConcurrentUpdateError(f"Balance kept changing for user {user_id}.")
 
         logger.info(f"Winnings of {winnings} credited for user {user_id} for contest {contest_id}. New balance: {new_balance}")
         return {'message': 'Winnings credited', 'balance': new_balance}
 
     except Exception as e:
         logger.error(f"Error crediting winnings for user {user_id}: {e}")
-        return {'error': 'Database error', 'details': str(e)}, 500
\ No newline at end of file
+        return {'error': 'Database error', 'details': str(e)}, 500
+
+# Helper function to validate a batch item
+def validate_batch_item(item):
+    """
+    :return: Error message, or None if the item is valid
+    """
+    if not isinstance(item, dict):
+        return "Item must be an object."
+    user_id, amount, reason = item.get('user_id'), item.get('amount'), item.get('reason')
+    if not user_id or not isinstance(user_id, str):
+        return "User ID is required."
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount == 0:
+        return "Amount must be a non-zero number."
+    if reason is not None and (not isinstance(reason, str) or not reason or reason in BATCH_RESERVED_REASONS):
+        return "Invalid reason."
+    key = item.get('idempotency_key')
+    if key is not None and (not isinstance(key, str) or not key or len(key) > MAX_IDEMPOTENCY_KEY_LENGTH):
+        return "Invalid idempotency key."
+    return None
+
+# Helper function to apply one group of batch items
+def apply_batch_group(db_ref, group):
+    """
+    Apply the items of a group of wallets whose lock stripes no other group uses.
+
+    Each wallet's items are written as one mutation with `write_wallet_mutation`,
+    so a failed write leaves that wallet's balance untouched and its items are
+    reported as failed; the other wallets of the group are unaffected.
+
+    :param group: dict of sanitized user ID -> list of (index, item)
+    :return: List of (index, result) pairs
+    """
+    results = []
+    timestamp = datetime.datetime.utcnow().isoformat()
+
+    with wallet_locks(group.keys()):
+        for sanitized_user_id, entries in group.items():
+            wallet_ref = db_ref.child(sanitized_user_id)
+            try:
+                for attempt in range(MAX_BALANCE_RETRIES):
+                    current_balance = read_wallet_state(wallet_ref)
+                    balance = current_balance
+                    outcomes = []
+                    transactions = []
+                    keys = set()
+                    for index, item in entries:
+                        amount = item['amount']
+                        key = item.get('idempotency_key') and hash_idempotency_key(item['idempotency_key'])
+                        applied = key and wallet_ref.child('applied').child(key).get()
+                        if applied:
+                            outcomes.append((index, item, applied))
+                        elif key in keys:
+                            outcomes.append((index, item, "Duplicate idempotency key."))
+                        elif amount < 0 and balance is None:
+                            outcomes.append((index, item, "Wallet not found."))
+                        elif amount < 0 and balance < -amount:
+                            outcomes.append((index, item, "Insufficient balance."))
+                        else:
+                            balance = (balance or 0) + amount
+                            outcomes.append((index, item, None))
+                            transaction = {
+                                'type': item.get('reason') or ('batch_credit' if amount > 0 else 'batch_debit'),
+                                'amount': amount,
+                                'timestamp': timestamp
+                            }
+                            if item.get('contest_id'):
+                                transaction['contest_id'] = sanitize_key(str(item['contest_id']))
+                            if key:
+                                transaction['idempotency_key'] = key
+                                keys.add(key)
+                            transactions.append(transaction)
+
+                    if not transactions:
+                        transaction_ids = []
+                        break
+                    transaction_ids = write_wallet_mutation(wallet_ref, current_balance, balance, transactions)
+                    if transaction_ids:
+                        break
+                    logger.info(f"Balance changed concurrently for user {sanitized_user_id}, retrying ({attempt + 1}/{MAX_BALANCE_RETRIES}).")
+                else:
+                    raise ConcurrentUpdateError(f"Balance kept changing for user {sanitized_user_id}.")
+                if transactions:
+                    balance_cache.set(sanitized_user_id, balance)
+            except Exception as e:
+                logger.error(f"Failed to apply batch items for user {sanitized_user_id}: {e}")
+                results.extend(
+                    (index, {"user_id": item['user_id'], "success": False, "error": str(e)})
+                    for index, item in entries
+                )
+                continue
+
+            transaction_ids = iter(transaction_ids)
+            for index, item, outcome in outcomes:
+                if isinstance(outcome, dict):
+                    # Applied by an earlier batch with the same idempotency key
+                    results.append((index, {
+                        "user_id": item['user_id'],
+                        "success": True,
+                        "transaction_id": outcome.get('transaction_id'),
+                        "balance": balance,
+                        "already_applied": True
+                    }))
+                elif outcome:
+                    results.append((index, {"user_id": item['user_id'], "success": False, "error": outcome}))
+                else:
+                    results.append((index, {
+                        "user_id": item['user_id'],
+                        "success": True,
+                        "transaction_id": next(transaction_ids),
+                        "balance": balance
+                    }))
+
+    return results
+
+# Apply a batch of credits and debits
+def apply_batch_service(items):
+    """
+    Apply many credits and debits at once.
+
+    Items are grouped by wallet lock stripe so that groups never contend with each
+    other, each wallet's items are written as one mutation, and groups run
+    concurrently. A debit that would overdraw its wallet fails on its own without
+    affecting the other items.
+
+    An item with an 'idempotency_key' is applied at most once per wallet: the key
+    is held by the mutation's pending marker until it is recorded with the ledger
+    entries, and a later item with the same key reports the earlier transaction
+    with 'already_applied' instead.
+
+    :param items: List of {'user_id', 'amount', 'reason', 'contest_id', 'idempotency_key'}
+                  dicts; a positive amount is a credit and a negative amount a debit
+    :return: Result per item, in the order of the input
+    """
+    if not isinstance(items, list) or not items:
+        logger.warning("Invalid input for apply_batch_service.")
+        return {
+            "success": False,
+            "message": "Invalid input. A non-empty list of items is required.",
+            "data": None
+        }, 400
+
+    if len(items) > MAX_BATCH_ITEMS:
+        return {
+            "success": False,
+            "message": f"A batch can contain at most {MAX_BATCH_ITEMS} items.",
+            "data": None
+        }, 400
+
+    results = [None] * len(items)
+    wallets = {}
+    for index, item in enumerate(items):
+        error = validate_batch_item(item)
+        if error:
+            results[index] = {"user_id": item.get('user_id') if isinstance(item, dict) else None,
+                              "success": False, "error": error}
+            continue
+        wallets.setdefault(sanitize_key(item['user_id']), []).append((index, item))
+
+    try:
+        # Wallets sharing a lock stripe always land in the same group
+        group_count = min(WALLET_LOCK_STRIPES, max(BATCH_MAX_WORKERS, -(-len(wallets) // BATCH_GROUP_SIZE)))
+        groups = [{} for _ in range(group_count)]
+        for sanitized_user_id, entries in wallets.items():
+            groups[get_lock_stripe(sanitized_user_id) % group_count][sanitized_user_id] = entries
+        groups = [group for group in groups if group]
+
+        db_ref = get_database_ref()
+        with ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS) as executor:
+            for group_results in executor.map(lambda group: apply_batch_group(db_ref, group), groups):
+                for index, result in group_results:
+                    results[index] = result
+
+    except Exception as e:
+        logger.error(f"Failed to apply wallet batch: {e}")
+        return {
+            "success": False,
+            "message": "Failed to apply wallet batch.",
+            "data": {"details": str(e)}
+        }, 500
+
+    failed = sum(1 for result in results if not result['success'])
+    logger.info(f"Wallet batch applied: {len(items) - failed} succeeded, {failed} failed.")
+    return {
+        "success": failed == 0,
+        "message": "Batch applied successfully." if failed == 0 else "Batch applied with failures.",
+        "data": {
+            "results": results,
+            "succeeded": len(items) - failed,
+            "failed": failed
+        }
+    }